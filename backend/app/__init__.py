@@ -45,6 +45,8 @@ def create_app(config_name=None):
     from app.routes.main import main_bp  # 添加这行导入 main_bp
     from app.routes.alerts_routes import alerts_bp, register_swag_definitions as register_alert_definitions
     from app.routes.system_logs_routes import system_logs_bp, register_swag_definitions as register_logs_definitions
+    from app.routes.metrics_routes import metrics_bp
+    from app.routes.jobs_routes import jobs_bp
     
     # 在蓝图注册部分添加
     app.register_blueprint(rtmp_bp)  # 添加这行
@@ -57,6 +59,8 @@ def create_app(config_name=None):
     app.register_blueprint(dlib_bp) # 注册 Dlib 蓝图
     app.register_blueprint(alerts_bp)
     app.register_blueprint(system_logs_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(jobs_bp)
     
     # 注册 Swagger 定义
     register_alert_definitions(swagger)
@@ -85,6 +89,12 @@ def create_app(config_name=None):
         db.create_all()
         print("✅ 数据库表已创建 (如果不存在).")
 
+    # 告警与系统日志的批量写库线程在本应用的上下文中写入，之后记录日志不再需要重新创建应用
+    from app.services.alerts import alert_writer
+    from app.services.logger import log_writer
+    alert_writer.init_app(app)
+    log_writer.init_app(app)
+
 
     return app 
 
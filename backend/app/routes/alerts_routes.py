@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify, request
-from app.services.alerts import get_all_alerts, update_alert_status, create_alert
+from app.services.alerts import (
+    get_all_alerts, update_alert_status, create_alert, get_alert_gate_stats, configure_alert_gate
+)
 from app.services.logger import log_info, log_warning, log_error  # 导入日志服务
 from flasgger import swag_from
 
@@ -463,4 +465,47 @@ def register_swag_definitions(swagger):
             "frame_snapshot_path": {"type": "string"}
         }
     }
-    swagger.template['definitions']['Alert'] = alert_definition
\ No newline at end of file
+    swagger.template['definitions']['Alert'] = alert_definition
+
+@alerts_bp.route('/gate', methods=['GET', 'PUT'])
+def alert_gate_config():
+    """
+    告警去重闸门
+    ---
+    tags:
+      - 告警管理
+    summary: 查看或修改告警去重的冷却与升级窗口
+    description: |
+      实时告警按 (流, 目标ID, 事件类型, 区域) 去重。事件持续触发期间只在首次以及持续时长跨过各升级窗口时放行，
+      超过冷却时长没有再触发后才算新的事件。GET 返回当前配置与放行/升级/抑制计数，PUT 修改配置。
+    parameters:
+      - name: body
+        in: body
+        required: false
+        schema:
+          type: object
+          properties:
+            cooldown:
+              type: number
+              description: 冷却时长（秒）
+            escalation_windows:
+              type: array
+              items:
+                type: number
+              description: 从首次触发起的升级时间点（秒）
+    responses:
+      200:
+        description: 当前配置与计数
+      400:
+        description: 参数无效
+    """
+    if request.method == 'PUT':
+        data = request.get_json() or {}
+        try:
+            stats = configure_alert_gate(data.get('cooldown'), data.get('escalation_windows'))
+        except (TypeError, ValueError) as e:
+            log_warning('alerts', f'修改告警闸门配置失败: {str(e)}')
+            return jsonify({'error': str(e)}), 400
+        log_info('alerts', f'告警闸门配置已更新: 冷却 {stats["cooldown"]}s, 升级窗口 {stats["escalation_windows"]}')
+        return jsonify(stats)
+    return jsonify(get_alert_gate_stats())
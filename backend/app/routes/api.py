@@ -42,13 +42,9 @@ api_bp = Blueprint('api_bp', __name__, url_prefix='/api')
     }
 })
 def api_status():
-    """API status check endpoint
+    """API状态检查端点
     ---
     tags:
-      - General API
-    responses:
-      200:
-        description: API running status.
       - 通用及测试API
     summary: 检查API服务状态
     description: 返回API的当前运行状态、版本等信息，可用于健康检查。
@@ -208,13 +204,6 @@ def add_test_alert():
     }
 })
 def get_alerts():
-    """Get alerts endpoint
-    ---
-    tags:
-      - General API
-    responses:
-      200:
-        description: Current list of alerts.
     """获取内存中的告警信息端点
     ---
     tags:
@@ -324,38 +313,4 @@ def handle_scream_detect(message):
         socketio.emit('scream_status', {'status': 'listening'}, namespace='/api/scream_ws', to=sid)
     elif action == 'stop':
         real_time_detection.stop_scream_detection()
-        socketio.emit('scream_status', {'status': 'stopped'}, namespace='/api/scream_ws', to=sid) 
-                type: object
-                properties:
-                  id:
-                    type: integer
-                  event_type:
-                    type: string
-                  details:
-                    type: string
-                  message:
-                    type: string
-                  snapshot_path:
-                    type: string
-                    nullable: true
-                  timestamp:
-                    type: string
-                    format: date-time
-                  status:
-                    type: string
-      500:
-        description: 服务器内部错误
-        schema:
-          type: object
-          properties:
-            error:
-              type: string
-              example: '服务器内部错误'
-    """
-    from app.services.alerts import get_alerts as get_memory_alerts
-    try:
-        memory_alerts = get_memory_alerts()
-        return jsonify({"alerts": memory_alerts})
-    except Exception as e:
-        print(f"获取内存告警失败: {e}")
-        return jsonify({"error": "服务器内部错误"}), 500
+        socketio.emit('scream_status', {'status': 'stopped'}, namespace='/api/scream_ws', to=sid)
@@ -3,9 +3,11 @@ import numpy as np
 
 from app.services import system_state
 from app.services.danger_zone import (
-    DANGER_ZONE, SAFETY_DISTANCE, LOITERING_THRESHOLD,
+    get_config as get_zone_config,
     update_danger_zone as save_danger_zone,  # 使用别名以减少代码改动
-    update_thresholds as save_thresholds
+    update_thresholds as save_thresholds,
+    get_stream_zones,
+    update_stream_zones
 )
 
 # 创建配置蓝图
@@ -41,12 +43,12 @@ def get_config():
             loitering_threshold:
               type: number
               description: 停留时间警报阈值.
+            version:
+              type: integer
+              description: 配置版本号，每次修改后递增.
     """
-    return jsonify({
-        "danger_zone": DANGER_ZONE.tolist(),
-        "safety_distance": SAFETY_DISTANCE,
-        "loitering_threshold": LOITERING_THRESHOLD
-    })
+    # 每次请求都读取当前生效的配置快照，而不是模块加载时导入的旧值
+    return jsonify(get_zone_config().to_dict())
 
 @config_bp.route("/update_danger_zone", methods=["POST"])
 def update_danger_zone():
@@ -76,13 +78,11 @@ def update_danger_zone():
       400:
         description: 无效的坐标数据.
     """
-    global DANGER_ZONE
     data = request.json
     new_zone = data.get('danger_zone')
     if new_zone and len(new_zone) >= 3:  # 确保至少有3个点形成多边形
-        DANGER_ZONE = np.array(new_zone, np.int32)
-        save_danger_zone(DANGER_ZONE)
-        return jsonify({"status": "success", "message": "Danger zone updated and saved successfully"})
+        snapshot = save_danger_zone(np.array(new_zone, np.int32))
+        return jsonify({"status": "success", "message": "Danger zone updated and saved successfully", "version": snapshot.version})
     else:
         return jsonify({"status": "error", "message": "Invalid danger zone coordinates"}), 400
 
@@ -113,26 +113,96 @@ def update_thresholds():
       400:
         description: 无效的输入值.
     """
-    global SAFETY_DISTANCE, LOITERING_THRESHOLD
     data = request.json
+    current = get_zone_config()
+    new_safety_distance = current.safety_distance
+    new_loitering_threshold = current.loitering_threshold
     safety_distance = data.get('safety_distance')
     loitering_threshold = data.get('loitering_threshold')
     if safety_distance is not None:
         try:
-            SAFETY_DISTANCE = int(safety_distance)
+            new_safety_distance = int(safety_distance)
         except ValueError:
             return jsonify({"status": "error", "message": "Invalid safety distance value"}), 400
     if loitering_threshold is not None:
         try:
-            LOITERING_THRESHOLD = float(loitering_threshold)
+            new_loitering_threshold = float(loitering_threshold)
         except ValueError:
             return jsonify({"status": "error", "message": "Invalid loitering threshold value"}), 400
-    save_thresholds(SAFETY_DISTANCE, LOITERING_THRESHOLD)
+    snapshot = save_thresholds(new_safety_distance, new_loitering_threshold)
     return jsonify({
         "status": "success", 
         "message": "Thresholds updated and saved successfully",
-        "safety_distance": SAFETY_DISTANCE,
-        "loitering_threshold": LOITERING_THRESHOLD
+        "safety_distance": snapshot.safety_distance,
+        "loitering_threshold": snapshot.loitering_threshold,
+        "version": snapshot.version
+    })
+
+@config_bp.route("/zones/<stream>", methods=["GET", "PUT"])
+def stream_zones(stream):
+    """获取或设置一路流的命名危险区域
+    ---
+    tags:
+      - 配置管理
+    summary: 获取或设置一路流的命名危险区域
+    description: |
+      每路流可以配置多个命名区域，每个区域有独立的安全距离和停留阈值。
+      流名称：上传视频为 upload，摄像头为 camera，RTMP流为 rtmp:<流ID>。
+      未单独配置的流使用全局默认区域；PUT 空列表可删除该流的单独配置。
+    parameters:
+      - name: stream
+        in: path
+        type: string
+        required: true
+        description: 流名称.
+      - name: body
+        in: body
+        required: false
+        schema:
+          type: object
+          properties:
+            zones:
+              type: array
+              items:
+                type: object
+                properties:
+                  name:
+                    type: string
+                  polygon:
+                    type: array
+                    items:
+                      type: array
+                      items:
+                        type: integer
+                  safety_distance:
+                    type: integer
+                  loitering_threshold:
+                    type: number
+    responses:
+      200:
+        description: 返回该流当前使用的区域列表.
+      400:
+        description: 无效的区域数据.
+    """
+    if request.method == "PUT":
+        data = request.json or {}
+        zones = data.get('zones')
+        if not isinstance(zones, list):
+            return jsonify({"status": "error", "message": "zones must be a list"}), 400
+        try:
+            snapshot = update_stream_zones(stream, zones)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        return jsonify({
+            "status": "success",
+            "stream": stream,
+            "zones": [zone.to_dict() for zone in snapshot.zones_for(stream)],
+            "version": snapshot.version
+        })
+    return jsonify({
+        "stream": stream,
+        "zones": [zone.to_dict() for zone in get_stream_zones(stream)],
+        "version": get_zone_config().version
     })
 
 @config_bp.route("/toggle_edit_mode", methods=["POST"])
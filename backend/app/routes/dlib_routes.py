@@ -78,6 +78,52 @@ def delete_registered_face(name):
     else:
         return jsonify({"status": "error", "message": f"'{name}' 未找到或无法删除。"}), 404
 
+@dlib_bp.route('/index', methods=['GET'])
+def get_face_index():
+    """
+    获取人脸最近邻索引的状态，可选评估召回率与查询延迟 (Dlib)。
+    ---
+    tags:
+      - Dlib人脸管理
+    summary: 获取人脸索引状态
+    description: 返回当前索引类型与规模；evaluate=1 时从人脸库抽样查询，以精确检索为基准计算 recall@1 和单次查询延迟。
+    parameters:
+      - name: evaluate
+        in: query
+        type: integer
+        required: false
+        default: 0
+        description: 为 1 时执行召回率与延迟评估。
+      - name: sample
+        in: query
+        type: integer
+        required: false
+        default: 200
+        description: 评估时的抽样查询数。
+    responses:
+      200:
+        description: 成功返回索引状态。
+        schema:
+          type: object
+          properties:
+            status:
+              type: string
+              example: success
+            index:
+              type: object
+              example: {"backend": "auto:ivf", "size": 50000, "nlist": 894, "nprobe": 8}
+            threshold:
+              type: number
+              example: 0.42
+            evaluation:
+              type: object
+              example: {"queries": 200, "k": 1, "recall": 1.0, "latency_ms": {"mean": 0.25, "p95": 0.34}, "exact_latency_ms": {"mean": 1.32, "p95": 1.54}}
+    """
+    evaluate = request.args.get('evaluate', 0, type=int) == 1
+    sample = max(1, min(request.args.get('sample', 200, type=int), 5000))
+    report = dlib_face_service.index_report(evaluate=evaluate, sample=sample)
+    return jsonify({"status": "success", **report})
+
 # --- WebSocket 交互式注册 ---
 
 # 用于存储每个客户端的注册状态
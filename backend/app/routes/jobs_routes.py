@@ -0,0 +1,51 @@
+from flask import Blueprint, jsonify
+from app import socketio
+from app.services.jobs import job_queue, JOBS_NAMESPACE
+
+jobs_bp = Blueprint('jobs_bp', __name__, url_prefix='/api/jobs')
+
+@jobs_bp.route('', methods=['GET'])
+def list_jobs():
+    """
+    获取后台任务列表
+    ---
+    tags:
+      - 后台任务
+    summary: 获取后台任务列表
+    description: 返回内存中保留的后台任务（最新的在前），不包含处理结果。
+    responses:
+      200:
+        description: 任务列表
+    """
+    return jsonify({"status": "success", "jobs": job_queue.list()})
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    获取后台任务状态与结果
+    ---
+    tags:
+      - 后台任务
+    summary: 获取后台任务状态与结果
+    description: 返回任务状态（queued/running/succeeded/failed）、进度（已处理帧数、处理速度、预计剩余时间）以及完成后的处理结果。
+    parameters:
+      - name: job_id
+        in: path
+        type: string
+        required: true
+        description: 任务ID
+    responses:
+      200:
+        description: 任务信息
+      404:
+        description: 任务不存在
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "任务不存在"}), 404
+    return jsonify({"status": "success", "job": job.to_dict()})
+
+# SocketIO事件处理：客户端连接 /jobs 命名空间后即可收到 job_update / job_progress 事件
+@socketio.on('connect', namespace=JOBS_NAMESPACE)
+def handle_jobs_connect():
+    print('客户端连接到任务进度命名空间')
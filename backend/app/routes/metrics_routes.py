@@ -0,0 +1,72 @@
+from flask import Blueprint, Response, jsonify
+from app.services.metrics import metrics
+from app.services import track_state
+from app.services.alerts import alert_writer
+from app.services.logger import get_log_sink_stats
+
+metrics_bp = Blueprint('metrics_bp', __name__, url_prefix='/api')
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Prometheus 指标
+    ---
+    tags:
+      - 性能监控
+    summary: 以 Prometheus 文本格式导出各处理阶段的延迟直方图
+    description: 包含采集、解码、各模型调用、规则判断、绘制和JPEG编码的耗时直方图（按流和检测模式区分），以及每路流的输出帧数。
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: Prometheus 文本格式的指标
+    """
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@metrics_bp.route('/metrics/summary', methods=['GET'])
+def metrics_summary():
+    """
+    指标摘要
+    ---
+    tags:
+      - 性能监控
+    summary: 各处理阶段的调用次数与平均耗时
+    description: 按 流 -> 检测模式 -> 阶段 汇总调用次数与平均耗时（毫秒），便于快速判断瓶颈所在的阶段。
+    responses:
+      200:
+        description: 指标摘要
+    """
+    return jsonify({"status": "success", "summary": metrics.summary()})
+
+@metrics_bp.route('/metrics/tracks', methods=['GET'])
+def track_state_stats():
+    """
+    目标状态表
+    ---
+    tags:
+      - 性能监控
+    summary: 每路流的目标状态表大小
+    description: 返回每路流当前保存的追踪目标数、流时钟（秒）以及累计因超时被回收的目标数，用于确认长时间运行时状态不会无限增长。
+    responses:
+      200:
+        description: 各流的目标状态表统计
+    """
+    return jsonify({"status": "success", "streams": track_state.get_stats()})
+
+@metrics_bp.route('/metrics/db_writers', methods=['GET'])
+def db_writer_stats():
+    """
+    批量写库线程
+    ---
+    tags:
+      - 性能监控
+    summary: 后台批量写库线程的队列与吞吐统计
+    description: 每个写入线程的已提交、已写入、丢弃（队列满）、失败记录数，批次数与最近/平均批次耗时，以及当前队列积压；系统日志另含按级别的采样丢弃数。
+    responses:
+      200:
+        description: 各写入线程的统计
+    """
+    return jsonify({"status": "success", "writers": {
+        "alerts": alert_writer.stats(),
+        "system_logs": get_log_sink_stats()
+    }})
@@ -254,6 +254,12 @@ def stream_feed(stream_id):
         type: string
         required: true
         description: 流ID
+      - name: mode
+        in: query
+        type: string
+        enum: [latest, every]
+        required: false
+        description: latest（默认）跟不上时跳到最新帧；every 尽量逐帧接收
     produces:
       - multipart/x-mixed-replace; boundary=frame
     responses:
@@ -267,9 +273,12 @@ def stream_feed(stream_id):
             error:
               type: string
     """
+    mode = request.args.get('mode', 'latest')
+    if mode not in ('latest', 'every'):
+        return jsonify({'error': f'无效的订阅模式: {mode}'}), 400
     try:
         def generate():
-            for frame_data in rtmp_manager.get_stream_frames(stream_id):
+            for frame_data in rtmp_manager.get_stream_frames(stream_id, mode=mode):
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n')
         return Response(generate(),
@@ -277,6 +286,48 @@ def stream_feed(stream_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@rtmp_bp.route('/streams/<stream_id>/viewers', methods=['GET'])
+def stream_viewers(stream_id):
+    """
+    获取指定流的观看者统计
+    ---
+    tags:
+      - RTMP流管理
+    summary: 获取指定流的观看者统计
+    description: 返回该流广播通道的最新帧序号，以及每个观看者的已投递帧数、跳帧数和落后帧数（lag）。
+    parameters:
+      - name: stream_id
+        in: path
+        type: string
+        required: true
+        description: 流ID
+    responses:
+      200:
+        description: 成功获取统计
+      404:
+        description: 流不存在
+    """
+    if stream_id not in rtmp_manager.streams:
+        return jsonify({'error': '流不存在'}), 404
+    return jsonify(rtmp_manager.get_broadcast_stats(stream_id)), 200
+
+@rtmp_bp.route('/streams/batch_inference', methods=['GET'])
+def batch_inference_stats():
+    """
+    获取跨流批量推理统计
+    ---
+    tags:
+      - RTMP流管理
+    summary: 获取跨流批量推理统计
+    description: 返回批量推理服务的批次数、平均批大小、平均排队等待时间以及每批/每帧的前向推理耗时。
+    responses:
+      200:
+        description: 批量推理统计
+    """
+    if rtmp_manager.batch_service is None:
+        return jsonify({'running': False}), 200
+    return jsonify(rtmp_manager.batch_service.stats()), 200
+
 # SocketIO事件处理
 @socketio.on('connect', namespace='/rtmp')
 def handle_rtmp_connect():
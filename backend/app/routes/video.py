@@ -4,8 +4,12 @@ import uuid
 import json
 from flask import Blueprint, request, jsonify, Response, send_from_directory, current_app
 from werkzeug.utils import secure_filename
-from app.services.video import video_feed, stop_video_feed_service
-from app.services.detection import process_image, process_video
+from app.services.video import video_feed, stop_video_feed_service, get_video_feed_stats, get_video_feed_viewers
+from app.services.detection import process_image, process_video, reevaluate_video, model_pool, UPLOAD_STREAM
+from app.services import danger_zone as danger_zone_service
+from app.services import system_state
+from app.services.load_controller import load_controller
+from app.services.jobs import job_queue
 from app.services.logger import log_info, log_error
 
 video_bp = Blueprint('video_bp', __name__, url_prefix='/api')
@@ -28,9 +32,30 @@ def allowed_file(filename):
 
 @video_bp.route('/video_feed')
 def get_video_feed():
-    """提供实时视频流"""
+    """提供实时视频流（?pipelined=1 启用采集/推理/编码流水线，?mode=every 尽量逐帧接收）"""
     log_info('video', '开始视频流')
-    return video_feed()
+    pipelined = request.args.get('pipelined')
+    if pipelined is not None:
+        pipelined = pipelined.lower() in ('1', 'true', 'yes')
+    mode = request.args.get('mode', 'latest')
+    if mode not in ('latest', 'every'):
+        return jsonify({"status": "error", "message": f"无效的订阅模式: {mode}"}), 400
+    return video_feed(pipelined=pipelined, mode=mode)
+
+@video_bp.route('/video_feed/stats')
+def video_feed_stats():
+    """
+    获取实时视频流水线统计
+    ---
+    tags:
+      - 视频处理
+    summary: 获取实时视频流水线统计
+    description: 返回流水线模式下采集、推理、输出的帧数以及各阶段丢帧数，以及摄像头广播通道上每个观看者的跳帧数与落后帧数。
+    responses:
+      200:
+        description: 流水线统计信息（未运行过流水线时为 null）与观看者统计
+    """
+    return jsonify({"status": "success", "stats": get_video_feed_stats(), "viewers": get_video_feed_viewers()})
 
 @video_bp.route('/stop_video_feed', methods=['POST'])
 def stop_video_feed():
@@ -39,6 +64,82 @@ def stop_video_feed():
     log_info('video', '停止视频流')
     return jsonify({"success": result})
 
+@video_bp.route('/models/pool')
+def model_pool_status():
+    """
+    获取模型池内存占用
+    ---
+    tags:
+      - 视频处理
+    summary: 获取模型池内存占用
+    description: 返回已加载模型的参数内存、加载耗时、借出/空闲的会话实例数以及进程常驻内存。
+    responses:
+      200:
+        description: 模型池状态
+    """
+    return jsonify({"status": "success", "pool": model_pool.memory_report()})
+
+@video_bp.route('/load_controller', methods=['GET'])
+def load_controller_status():
+    """
+    获取自适应降载控制器状态
+    ---
+    tags:
+      - 视频处理
+    summary: 获取自适应降载控制器状态
+    description: 返回每种检测模式的目标帧率/延迟预算，以及每路流（摄像头与RTMP流）当前的检测间隔、输入分辨率、JPEG质量和测量值。
+    responses:
+      200:
+        description: 控制器状态
+    """
+    return jsonify({"status": "success", "controller": load_controller.snapshot()})
+
+@video_bp.route('/load_controller/budgets/<mode>', methods=['PUT'])
+def update_load_budget(mode):
+    """
+    修改检测模式的性能预算
+    ---
+    tags:
+      - 视频处理
+    summary: 修改检测模式的性能预算
+    description: 设置某检测模式的目标帧率与单次推理延迟预算，正在运行的流会在下一次调整时按新预算升降档。
+    parameters:
+      - name: mode
+        in: path
+        type: string
+        required: true
+        description: 检测模式，如 object_detection
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            target_fps:
+              type: number
+              example: 20
+            latency_budget_ms:
+              type: number
+              example: 60
+    responses:
+      200:
+        description: 更新后的预算
+      400:
+        description: 参数无效
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        target_fps = data.get('target_fps')
+        latency_budget_ms = data.get('latency_budget_ms')
+        budget = load_controller.set_budget(
+            mode,
+            target_fps=float(target_fps) if target_fps is not None else None,
+            latency_budget_ms=float(latency_budget_ms) if latency_budget_ms is not None else None
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    log_info('video', f'更新检测模式 {mode} 的性能预算: {budget}')
+    return jsonify({"status": "success", "mode": mode, "budget": budget})
+
 @video_bp.route('/upload', methods=['POST'])
 def upload_file():
     """
@@ -54,9 +155,33 @@ def upload_file():
         type: file
         required: true
         description: 要上传的图片或视频文件
+      - in: query
+        name: parallel
+        type: boolean
+        required: false
+        description: 视频是否使用多进程分段推理（仅目标检测模式）
+      - in: query
+        name: output
+        type: string
+        enum: [video, sidecar]
+        required: false
+        description: sidecar 时跳过绘制与视频重新编码，只输出逐帧检测/追踪结果文件（目标检测、跌倒检测模式）
+      - in: query
+        name: format
+        type: string
+        enum: [npz, jsonl]
+        required: false
+        description: output=sidecar 时结果文件的格式，默认 npz
+      - in: query
+        name: preview_fps
+        type: number
+        required: false
+        description: output=sidecar 时可选输出的低帧率标注预览视频帧率
     responses:
       200:
-        description: 文件处理成功
+        description: 图片处理成功
+      202:
+        description: 视频已加入后台任务队列，返回 task_id，可通过 /api/jobs/<task_id> 或 /api/video/task_status/<task_id> 查询
       400:
         description: 无效的请求或文件类型
       500:
@@ -98,9 +223,27 @@ def upload_file():
             result = process_image(filepath, UPLOADS_DIR)
             return jsonify(result)
         elif file_ext in {'mp4', 'avi', 'mov'}:
-            # 处理视频
-            result = process_video(filepath, UPLOADS_DIR)
-            return jsonify(result)
+            # 视频放入后台任务队列处理，立即返回任务ID（?parallel=1 使用多进程分段推理）
+            parallel = request.args.get('parallel')
+            if parallel is not None:
+                parallel = parallel.lower() in ('1', 'true', 'yes')
+            # ?output=sidecar 只输出检测结果文件，不绘制、不重新编码视频
+            output = request.args.get('output', 'video')
+            sidecar_format = request.args.get('format', 'npz')
+            if output not in ('video', 'sidecar') or sidecar_format not in ('npz', 'jsonl'):
+                return jsonify({"status": "error", "message": "Invalid output or format"}), 400
+            preview_fps = request.args.get('preview_fps', type=float)
+            job = job_queue.submit(process_video, filepath, UPLOADS_DIR, parallel=parallel,
+                                   output=output, sidecar_format=sidecar_format, preview_fps=preview_fps,
+                                   mode=system_state.DETECTION_MODE,  # 按提交时的模式处理整段视频
+                                   kind='video', filename=unique_filename)
+            log_info('video', f'视频处理任务已提交: {job.id} ({unique_filename})')
+            return jsonify({
+                "status": "accepted",
+                "task_id": job.id,
+                "job_id": job.id,
+                "status_url": f"/api/jobs/{job.id}"
+            }), 202
         else:
             # 不应该到达这里，因为已经检查了文件类型
             log_error('video', f'未知的文件类型: {file_ext}')
@@ -110,6 +253,114 @@ def upload_file():
         log_error('video', f'处理上传文件时出错: {str(e)}')
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@video_bp.route('/video/task_status/<task_id>')
+def video_task_status(task_id):
+    """
+    查询视频处理任务状态
+    ---
+    tags:
+      - 视频处理
+    parameters:
+      - name: task_id
+        in: path
+        type: string
+        required: true
+        description: 上传接口返回的任务ID
+    responses:
+      200:
+        description: 处理完成，返回处理结果（file_url、alerts）
+      202:
+        description: 任务排队中或处理中，返回进度
+      404:
+        description: 任务不存在
+      500:
+        description: 任务处理失败
+    """
+    job = job_queue.get(task_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "任务不存在"}), 404
+    if job.status == 'succeeded':
+        return jsonify(job.result), 200
+    if job.status == 'failed':
+        return jsonify({"status": "error", "message": job.error or "视频处理失败"}), 500
+    return jsonify(job.to_dict(include_result=False)), 202
+
+@video_bp.route('/video/reevaluate', methods=['POST'])
+def reevaluate_uploaded_video():
+    """
+    用已保存的检测索引重新评估视频
+    ---
+    tags:
+      - 视频处理
+    summary: 重放危险区域/徘徊/跌倒规则，不重新推理
+    description: 视频上传处理（目标检测、跌倒检测模式）时会按文件哈希与模型版本保存逐帧检测/追踪索引。修改危险区域或阈值后调用本接口，只重放规则判断并返回新的告警。可在请求中临时指定危险区域与阈值试算，不会保存到配置。
+    parameters:
+      - in: body
+        name: body
+        schema:
+          type: object
+          required:
+            - filename
+          properties:
+            filename:
+              type: string
+              description: 上传接口保存的文件名（file_url 中 processed_ 之后的部分）
+            mode:
+              type: string
+              enum: [object_detection, fall_detection]
+              description: 检测模式，默认为当前模式
+            danger_zone:
+              type: array
+              items:
+                type: array
+                items:
+                  type: integer
+              description: 可选，临时使用的危险区域多边形
+            safety_distance:
+              type: number
+            loitering_threshold:
+              type: number
+    responses:
+      202:
+        description: 重放任务已提交，返回 task_id，可通过 /api/video/task_status/<task_id> 查询
+      400:
+        description: 参数无效
+      404:
+        description: 文件不存在
+    """
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(data.get('filename') or '')
+    filepath = os.path.join(UPLOADS_DIR, filename)
+    if not filename or not os.path.isfile(filepath):
+        return jsonify({"status": "error", "message": "文件不存在"}), 404
+
+    zone_config = None
+    overrides = [key for key in ('danger_zone', 'safety_distance', 'loitering_threshold') if key in data]
+    if overrides:
+        current = danger_zone_service.get_config()
+        try:
+            # 在当前配置（含上传视频的单独区域）之上覆盖，临时快照只用于本次重放，不保存、不影响正在运行的流
+            zone_config = current.with_overrides(
+                UPLOAD_STREAM,
+                data.get('danger_zone'),
+                float(data['safety_distance']) if 'safety_distance' in data else None,
+                float(data['loitering_threshold']) if 'loitering_threshold' in data else None
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({"status": "error", "message": f"无效的危险区域参数: {e}"}), 400
+
+    # 与视频处理共用任务队列：规则重放会重置全局告警列表，不能与上传任务同时运行
+    job = job_queue.submit(reevaluate_video, filepath, mode=data.get('mode') or system_state.DETECTION_MODE,
+                           zone_config=zone_config,
+                           kind='reevaluate', filename=filename)
+    log_info('video', f'规则重放任务已提交: {job.id} ({filename})')
+    return jsonify({
+        "status": "accepted",
+        "task_id": job.id,
+        "job_id": job.id,
+        "status_url": f"/api/jobs/{job.id}"
+    }), 202
+
 @video_bp.route('/files/<path:filename>')
 def serve_file(filename):
     """
@@ -0,0 +1,105 @@
+import threading
+
+# 同一 (流, 目标, 事件类型) 持续触发时，超过该时长（流时钟秒数）没有再触发才算一次新的事件
+ALERT_COOLDOWN = 10.0
+# 事件持续存在时，从首次触发起经过这些时长各升级并重新告警一次
+ALERT_ESCALATION_WINDOWS = (30.0, 120.0, 600.0)
+
+
+class GateEntry:
+    """一个告警键的状态"""
+    __slots__ = ('first_seen', 'last_seen', 'level', 'suppressed')
+
+    def __init__(self, now):
+        self.first_seen = now
+        self.last_seen = now
+        self.level = 0          # 升级次数，首次告警为 0
+        self.suppressed = 0     # 上一次放行之后被抑制的触发次数
+
+
+class AlertGate:
+    """
+    告警去重闸门。
+
+    告警按 (流, 目标ID, 事件类型, 区域) 哈希去重，每路流一张表：
+    - 键第一次出现，或距上次触发已超过 cooldown：作为新事件放行
+    - 事件持续触发期间：只在持续时长跨过 escalation_windows 中的下一个窗口时升级放行，其余触发全部抑制并计数
+    - 超过 cooldown 未触发的键在该流下一次清理时删除，表的大小只与同时存在的事件数有关
+    """
+
+    def __init__(self, cooldown=ALERT_COOLDOWN, escalation_windows=ALERT_ESCALATION_WINDOWS):
+        self.cooldown = cooldown
+        self.escalation_windows = tuple(escalation_windows)
+        self._streams = {}       # {stream: {key: GateEntry}}
+        self._last_purge = {}    # {stream: 上次清理时刻}
+        self._lock = threading.Lock()
+        self.admitted = {}       # {event_type: 放行次数}
+        self.escalated = {}      # {event_type: 升级次数}
+        self.suppressed = {}     # {event_type: 抑制次数}
+
+    def configure(self, cooldown=None, escalation_windows=None):
+        with self._lock:
+            if cooldown is not None:
+                self.cooldown = float(cooldown)
+            if escalation_windows is not None:
+                self.escalation_windows = tuple(sorted(float(w) for w in escalation_windows))
+
+    def admit(self, stream, key, event_type, now):
+        """
+        判断一次触发是否放行。返回 (放行与否, 升级次数, 自上次放行以来被抑制的次数)。
+        """
+        with self._lock:
+            entries = self._streams.setdefault(stream, {})
+            if now - self._last_purge.get(stream, now) >= self.cooldown:
+                self._purge(stream, entries, now)
+            self._last_purge.setdefault(stream, now)
+
+            entry = entries.get(key)
+            if entry is None or now - entry.last_seen >= self.cooldown:
+                entry = entries[key] = GateEntry(now)
+                self.admitted[event_type] = self.admitted.get(event_type, 0) + 1
+                return True, 0, 0
+
+            entry.last_seen = now
+            windows = self.escalation_windows
+            if entry.level < len(windows) and now - entry.first_seen >= windows[entry.level]:
+                entry.level += 1
+                self.admitted[event_type] = self.admitted.get(event_type, 0) + 1
+                self.escalated[event_type] = self.escalated.get(event_type, 0) + 1
+                suppressed, entry.suppressed = entry.suppressed, 0
+                return True, entry.level, suppressed
+
+            entry.suppressed += 1
+            self.suppressed[event_type] = self.suppressed.get(event_type, 0) + 1
+            return False, entry.level, entry.suppressed
+
+    def _purge(self, stream, entries, now):
+        expired = [key for key, entry in entries.items() if now - entry.last_seen >= self.cooldown]
+        for key in expired:
+            del entries[key]
+        self._last_purge[stream] = now
+
+    def reset(self, stream=None):
+        """清空指定流（None 表示所有流）的去重状态，计数器保留"""
+        with self._lock:
+            if stream is None:
+                self._streams.clear()
+                self._last_purge.clear()
+            else:
+                self._streams.pop(stream, None)
+                self._last_purge.pop(stream, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'cooldown': self.cooldown,
+                'escalation_windows': list(self.escalation_windows),
+                'active_keys': {stream: len(entries) for stream, entries in self._streams.items()},
+                'admitted': dict(self.admitted),
+                'escalated': dict(self.escalated),
+                'suppressed': dict(self.suppressed),
+            }
+
+
+# 全局告警闸门实例
+alert_gate = AlertGate()
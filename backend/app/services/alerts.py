@@ -1,79 +1,111 @@
-from collections import defaultdict
-import time
 # --- 新增: 数据库集成与应用上下文 ---
 from app import db, create_app
 from app.models.alert import Alert
 from datetime import datetime
 # --- 结束新增 ---
+import itertools
+import os
+import threading
+import time
+from collections import deque
 
+import cv2
 
-# === 旧的基于内存的告警系统 (保留以兼容) ===
+from app.services import track_state
+from app.services.alert_gate import alert_gate
+from app.services.db_writer import BatchWriter
 
-# For tracking how long targets stay in danger zones
-target_loitering_time = defaultdict(float)
 
-# Timestamp of last detection
-last_detection_time = time.time()
+# === 基于内存的告警系统 ===
 
-# For storing alert messages
-alerts = []
+# 目标的停留时间与检测时钟按流保存在 track_state 中，不同流的追踪ID互不冲突
 
-def reset_alerts():
-    """Reset all alert information"""
-    global alerts, target_loitering_time, last_detection_time
-    alerts = []
-    target_loitering_time = defaultdict(float)
-    last_detection_time = time.time()
+# 用于存储告警信息 - 改为存储字典对象以包含完整信息，只保留最近的50条
+MEMORY_ALERTS_LIMIT = 50
+_memory_alerts = deque(maxlen=MEMORY_ALERTS_LIMIT) # 重命名以避免混淆
+_memory_alert_ids = itertools.count(1)
+_memory_lock = threading.Lock()
 
-def add_alert(alert_message):
-    """Add a new alert message"""
-    global alerts
-    if alert_message not in alerts:
-        alerts.append(alert_message)
-        print(f"Alert: {alert_message}")
+def reset_stream_state(stream=None):
+    """重置指定流（None 表示所有流）的目标停留状态、检测时钟与告警去重状态"""
+    track_state.reset_table(stream)
+    alert_gate.reset(stream)
 
-def get_alerts():
-    """Get all current alert messages"""
-    return alerts
-# 用于存储告警信息 - 改为存储字典对象以包含完整信息
-_memory_alerts = [] # 重命名以避免混淆
+def drop_stream_state(stream):
+    """流结束时释放其目标状态与告警去重状态"""
+    track_state.drop_table(stream)
+    alert_gate.reset(stream)
 
-def reset_alerts():
-    """重置所有内存中的警报信息"""
-    global _memory_alerts, target_loitering_time, last_detection_time
-    _memory_alerts = []
-    target_loitering_time = defaultdict(float)
-    last_detection_time = time.time()
+def reset_alerts(stream=None):
+    """重置指定流（None 表示所有流）的内存警报、目标停留状态与检测时钟，其他流的警报保留"""
+    global _memory_alert_ids
+    with _memory_lock:
+        if stream is None:
+            _memory_alerts.clear()
+            _memory_alert_ids = itertools.count(1)
+        else:
+            kept = [alert for alert in _memory_alerts if alert['stream'] != stream]
+            _memory_alerts.clear()
+            _memory_alerts.extend(kept)
+    reset_stream_state(stream)
 
-def add_alert_memory(alert_message, event_type=None, details=None, snapshot_path=None):
-    """添加新的警报信息到内存，支持完整的告警信息"""
-    global _memory_alerts
+def add_alert_memory(alert_message, event_type=None, details=None, snapshot_path=None,
+                     stream=None, track_id=None, zone=None):
+    """
+    添加新的警报信息到内存，支持完整的告警信息。
+
+    同一 (流, 目标ID, 事件类型, 区域) 的重复触发先经过告警闸门去重：冷却期内持续触发的事件只在升级窗口放行，
+    被抑制时返回 None。未指定事件类型时以告警文本作为事件类型。
+    """
+    event_key = event_type or alert_message
+    # 有流标识时按该流的时钟计时（离线视频按视频时间），否则按实际时间
+    now = track_state.get_table(stream).now if stream is not None else time.monotonic()
+    admitted, level, suppressed = alert_gate.admit(stream, (track_id, event_key, zone), event_key, now)
+    if not admitted:
+        return None
     
     # 创建完整的告警对象
+    with _memory_lock:
+        alert_id = next(_memory_alert_ids)
     alert_obj = {
-        'id': len(_memory_alerts) + 1,  # 简单的ID生成
+        'id': alert_id,
         'event_type': event_type or 'Memory Alert',
         'details': details or alert_message,
         'message': alert_message,
         'snapshot_path': snapshot_path,
         'timestamp': datetime.now().strftime('%Y/%m/%d %H:%M:%S'),
-        'status': 'unprocessed'
+        'status': 'unprocessed',
+        'stream': stream,
+        'track_id': track_id,
+        'escalation_level': level,
+        'suppressed_count': suppressed
     }
     
-    # 添加到内存列表（保持最近的50条告警）
-    _memory_alerts.append(alert_obj)
-    if len(_memory_alerts) > 50:
-        _memory_alerts.pop(0)  # 移除最旧的告警
+    # 添加到内存列表（deque 满时自动丢弃最旧的告警）
+    with _memory_lock:
+        _memory_alerts.append(alert_obj)
         
-    print(f"内存告警已添加: {event_type} - {alert_message}")
+    print(f"内存告警已添加: {event_type} - {alert_message}" + (f" (升级 {level}，期间抑制 {suppressed} 次)" if level else ""))
     return alert_obj
 
-def get_alerts():
-    """获取当前内存中的所有警报信息"""
-    global _memory_alerts
-    print(f"get_alerts被调用，当前_memory_alerts长度: {len(_memory_alerts)}")
-    print(f"_memory_alerts内容: {_memory_alerts}")
-    return _memory_alerts
+def get_alerts(stream=None):
+    """获取当前内存中的警报信息，指定 stream 时只返回该流的警报"""
+    with _memory_lock:
+        return [alert for alert in _memory_alerts if stream is None or alert['stream'] == stream]
+
+def get_alert_gate_stats():
+    """告警闸门的放行、升级与抑制计数"""
+    return alert_gate.stats()
+
+def configure_alert_gate(cooldown=None, escalation_windows=None):
+    """修改告警冷却时长与升级窗口（秒），参数无效时抛出 ValueError"""
+    if cooldown is not None and float(cooldown) < 0:
+        raise ValueError("cooldown must be non-negative")
+    if escalation_windows is not None:
+        if not isinstance(escalation_windows, (list, tuple)) or any(float(w) <= 0 for w in escalation_windows):
+            raise ValueError("escalation_windows must be a list of positive numbers")
+    alert_gate.configure(cooldown, escalation_windows)
+    return alert_gate.stats()
 
 # --- 新的基于数据库的告警服务 ---
 
@@ -98,6 +130,93 @@ def create_alert(event_type, details, video_path=None, frame_snapshot_path=None)
         print(f"创建告警失败: {e}")
         return None
 
+# 告警快照保存目录（相对于 backend 运行目录，与告警录像一致）
+SNAPSHOT_DIR = os.path.join('uploads', 'snapshots')
+
+
+# 写入队列中最多同时保留的快照帧数：每帧是整幅画面的副本，超出后告警照常入队但不再附带快照
+MAX_PENDING_SNAPSHOTS = 32
+
+
+class AlertWriter(BatchWriter):
+    """
+    告警批量写库线程：快照图片的编码与落盘也在写入线程中完成，不占用推理线程。
+    队列中的快照数单独限制为 max_pending_snapshots，写库变慢时内存不会随积压的告警数线性增长。
+    """
+
+    def __init__(self, name, model, max_pending_snapshots=MAX_PENDING_SNAPSHOTS, **kwargs):
+        super().__init__(name, model, **kwargs)
+        self.max_pending_snapshots = max_pending_snapshots
+        self._pending_snapshots = 0
+        self._stats['snapshots_dropped'] = 0
+
+    def submit(self, row):
+        """入队一条告警；快照已达上限时丢弃快照只保留告警记录"""
+        snapshot = row.get('snapshot')
+        if snapshot is not None:
+            with self._stats_lock:
+                if self._pending_snapshots < self.max_pending_snapshots:
+                    self._pending_snapshots += 1
+                else:
+                    self._stats['snapshots_dropped'] += 1
+                    snapshot = None
+            # 调用方之后可能继续修改该帧，入队时复制一份
+            row['snapshot'] = snapshot.copy() if snapshot is not None else None
+        accepted = super().submit(row)
+        if not accepted and row['snapshot'] is not None:
+            self._release_snapshot()
+        return accepted
+
+    def _release_snapshot(self):
+        with self._stats_lock:
+            self._pending_snapshots -= 1
+
+    def prepare(self, rows):
+        for row in rows:
+            frame = row.pop('snapshot', None)
+            if frame is not None:
+                self._release_snapshot()
+                row['frame_snapshot_path'] = _save_snapshot(frame, row['timestamp'])
+        return rows
+
+    def stats(self):
+        stats = super().stats()
+        with self._stats_lock:
+            stats['pending_snapshots'] = self._pending_snapshots
+        return stats
+
+
+_snapshot_ids = itertools.count(1)
+
+def _save_snapshot(frame, timestamp):
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        path = os.path.join(SNAPSHOT_DIR, f"alert_{timestamp.strftime('%Y%m%d_%H%M%S_%f')}_{next(_snapshot_ids)}.jpg")
+        if cv2.imwrite(path, frame):
+            return path
+    except Exception as e:
+        print(f"保存告警快照失败: {e}")
+    return None
+
+alert_writer = AlertWriter('alerts', Alert)
+
+def create_alert_async(event_type, details, video_path=None, frame_snapshot_path=None, snapshot=None):
+    """
+    把告警放入后台写入队列（批量写库），不在调用线程中访问数据库。
+    snapshot: 可选的帧图像，由写入线程保存为快照并填入 frame_snapshot_path；
+              队列中待保存的快照过多时只写告警记录，不保存快照。
+    返回是否成功入队（队列持续满载时告警会被丢弃并计数）。
+    """
+    return alert_writer.submit({
+        'timestamp': datetime.utcnow(),
+        'event_type': event_type,
+        'details': details,
+        'status': 'unprocessed',
+        'video_path': video_path,
+        'frame_snapshot_path': frame_snapshot_path,
+        'snapshot': snapshot
+    })
+
 def get_all_alerts(page=1, per_page=20, status=None):
     """
     从数据库获取所有告警，支持分页和按状态过滤。
@@ -133,25 +252,36 @@ add_alert = add_alert_memory # 默认的 add_alert 仍然指向旧的内存版
 
 # (其余函数保持不变, 因为它们管理的是实时处理中的临时状态)
 
-def update_loitering_time(target_id, time_diff):
-    """Update how long a target has been in the danger zone"""
-    global target_loitering_time
-    target_loitering_time[target_id] += time_diff
-    return target_loitering_time[target_id]
-
-def reset_loitering_time(target_id):
-    """Reset a target's loitering time"""
-    global target_loitering_time
-    target_loitering_time[target_id] = 0
-
-def get_loitering_time(target_id):
-    """Get a target's loitering time"""
-    return target_loitering_time[target_id]
-
-def update_detection_time():
-    """Update detection time and return the time difference"""
-    global last_detection_time
-    current_time = time.time()
-    time_diff = current_time - last_detection_time
-    last_detection_time = current_time
-    return time_diff
\ No newline at end of file
+def evaluate_target_zones(target_id, target_hits, time_diff, stream='camera'):
+    """
+    根据一个目标与各命名区域的判断结果 [(zone, inside, distance), ...] 更新该目标在所属流中的停留时间，返回
+    (primary, in_zone, distance, loitering_time, events)：
+        primary:       画面展示用的最严重区域：在区域内时取停留时间占阈值比例最大的区域，否则取相对安全距离最近的区域；没有候选区域时为 None
+        in_zone:       是否在任一区域内
+        distance:      到 primary 的距离（没有候选区域时为 inf）
+        loitering_time: 在 primary 内的停留时间
+        events:        超过阈值的区域，[('intrusion', zone, 停留时间) 或 ('proximity', zone, 距离), ...]
+    """
+    inside_zones = [zone for zone, inside, _ in target_hits if inside]
+    times = track_state.get_table(stream).update_zones(target_id, {zone.name for zone in inside_zones}, time_diff)
+    events = []
+    for zone, inside, distance in target_hits:
+        if inside:
+            if times[zone.name] >= zone.loitering_threshold:
+                events.append(('intrusion', zone, times[zone.name]))
+        elif distance < zone.safety_distance:
+            events.append(('proximity', zone, distance))
+
+    if inside_zones:
+        primary = max(inside_zones, key=lambda zone: times[zone.name] / max(zone.loitering_threshold, 1e-6))
+        distance = next(d for zone, _, d in target_hits if zone is primary)
+        return primary, True, distance, times[primary.name], events
+    outside = [(zone, distance) for zone, inside, distance in target_hits if not inside]
+    if not outside:
+        return None, False, float('inf'), 0.0, events
+    primary, distance = min(outside, key=lambda item: item[1] / max(item[0].safety_distance, 1e-6))
+    return primary, False, distance, 0.0, events
+
+def update_detection_time(stream='camera', time_diff=None):
+    """推进指定流的检测时钟并返回时间差（同时按需回收该流中已消失的目标）"""
+    return track_state.get_table(stream).tick(time_diff)
\ No newline at end of file
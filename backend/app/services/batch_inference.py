@@ -0,0 +1,204 @@
+import queue
+import threading
+import time
+
+import torch
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils import IterableSimpleNamespace, yaml_load
+from ultralytics.utils.checks import check_yaml
+
+from app.services.metrics import metrics
+
+
+class _InferenceRequest:
+    """一路流提交的单帧推理请求，提交线程在 done 上等待结果"""
+    __slots__ = ('stream_id', 'frame', 'imgsz', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, stream_id, frame, imgsz):
+        self.stream_id = stream_id
+        self.frame = frame
+        self.imgsz = imgsz
+        self.enqueued_at = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchInferenceService:
+    """
+    跨流批量推理服务。
+
+    各路 RTMP 处理线程通过 submit() 提交帧并阻塞等待；后台线程把同一时刻到达的帧
+    （最多 max_batch 帧，最多等待 max_wait_ms）合成一个 batch 做一次前向推理，
+    再用每路流自己的追踪器做关联，把带追踪ID的结果交还给对应的流。
+    所有已注册的流都已提交时立即推理，不必等到截止时间。
+    """
+
+    def __init__(self, model_pool, model_name='object', max_batch=8, max_wait_ms=20,
+                 tracker_config='botsort.yaml', frame_rate=30):
+        self.model_pool = model_pool
+        self.model_name = model_name
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.tracker_config = tracker_config
+        self.frame_rate = frame_rate
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._trackers = {}
+        self._model = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+        self.batches = 0
+        self.frames = 0
+        self._batch_size_total = 0
+        self._wait_ms_total = 0.0
+        self._forward_ms_total = 0.0
+        self.last_batch_size = 0
+
+    @property
+    def names(self):
+        return self._model.names if self._model is not None else {}
+
+    def _new_tracker(self):
+        cfg = IterableSimpleNamespace(**yaml_load(check_yaml(self.tracker_config)))
+        return TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=self.frame_rate)
+
+    def register_stream(self, stream_id):
+        """为一路流创建独立的追踪器；第一次注册时启动后台推理线程"""
+        with self._lock:
+            self._trackers[stream_id] = self._new_tracker()
+            if self._thread is None or not self._thread.is_alive():
+                if self._model is None:
+                    # 从模型池借出一个会话实例，只由后台线程使用
+                    self._model = self.model_pool.acquire(self.model_name)
+                # 每个后台线程使用自己的停止事件，避免与正在退出的旧线程互相影响
+                self._stop_event = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop_event,),
+                                                name="batch-inference", daemon=True)
+                self._thread.start()
+
+    def has_stream(self, stream_id):
+        return stream_id in self._trackers
+
+    def unregister_stream(self, stream_id):
+        """移除流的追踪器；没有流时停止后台线程并归还模型"""
+        with self._lock:
+            self._trackers.pop(stream_id, None)
+            if self._trackers:
+                return
+            self._stop_event.set()
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            thread.join(timeout=2)
+        with self._lock:
+            if not self._trackers and self._model is not None:
+                self.model_pool.release(self.model_name, self._model)
+                self._model = None
+
+    def submit(self, stream_id, frame, imgsz=None, timeout=5.0):
+        """提交一帧并等待批量推理结果，返回带追踪ID的 ultralytics Results"""
+        if not self.has_stream(stream_id):
+            raise KeyError(f"流 {stream_id} 未注册到批量推理服务")
+        request = _InferenceRequest(stream_id, frame, imgsz)
+        self._queue.put(request)
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"流 {stream_id} 的批量推理超时")
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect_batch(self):
+        """取出第一帧后，在截止时间内尽量凑满一个 batch"""
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait_ms / 1000.0
+        target = min(self.max_batch, max(len(self._trackers), 1))
+        while len(batch) < target:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, stop_event):
+        while not stop_event.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            # 输入分辨率不同的请求分组，各组做一次前向推理
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.imgsz, []).append(request)
+            for imgsz, requests in groups.items():
+                self._infer(requests, imgsz)
+
+    def _infer(self, requests, imgsz):
+        start = time.time()
+        try:
+            kwargs = {'verbose': False}
+            if imgsz:
+                kwargs['imgsz'] = imgsz
+            results = self._model.predict([request.frame for request in requests], **kwargs)
+        except Exception as e:
+            for request in requests:
+                request.error = e
+                request.done.set()
+            return
+        forward_ms = (time.time() - start) * 1000
+        metrics.observe('model:object_batch', forward_ms / 1000.0, 'batch', self.model_name)
+
+        for request, result in zip(requests, results):
+            try:
+                request.result = self._associate(request, result)
+            except Exception as e:
+                request.error = e
+            request.done.set()
+
+        with self._lock:
+            self.batches += 1
+            self.frames += len(requests)
+            self.last_batch_size = len(requests)
+            self._batch_size_total += len(requests)
+            self._forward_ms_total += forward_ms
+            self._wait_ms_total += sum((start - request.enqueued_at) * 1000 for request in requests)
+
+    def _associate(self, request, result):
+        """与 ultralytics track() 的后处理一致：用该流的追踪器关联检测框并写回追踪ID"""
+        tracker = self._trackers.get(request.stream_id)
+        if tracker is None:
+            return result
+        det = result.boxes.cpu().numpy()
+        if len(det) == 0:
+            return result
+        tracks = tracker.update(det, request.frame)
+        if len(tracks) == 0:
+            return result
+        idx = tracks[:, -1].astype(int)
+        result = result[idx]
+        result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'running': self._thread is not None and self._thread.is_alive(),
+                'streams': len(self._trackers),
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait_ms,
+                'batches': self.batches,
+                'frames': self.frames,
+                'last_batch_size': self.last_batch_size,
+                'avg_batch_size': round(self._batch_size_total / self.batches, 2) if self.batches else 0.0,
+                'avg_wait_ms': round(self._wait_ms_total / self.frames, 2) if self.frames else 0.0,
+                'avg_forward_ms': round(self._forward_ms_total / self.batches, 2) if self.batches else 0.0,
+                'avg_forward_ms_per_frame': round(self._forward_ms_total / self.frames, 2) if self.frames else 0.0,
+            }
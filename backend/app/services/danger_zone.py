@@ -1,8 +1,13 @@
 import json
 import os
+import time
+import threading
 import numpy as np
+import cv2
 import logging
 
+from app.utils.geometry import PolygonGeometry
+
 # V5: Use a JSON file as the single source of truth for the danger zone
 CONFIG_DIR = os.path.join(os.path.dirname(__file__), '..', 'config')
 ZONE_CONFIG_FILE = os.path.join(CONFIG_DIR, 'danger_zone.json')
@@ -10,61 +15,503 @@ ZONE_CONFIG_FILE = os.path.join(CONFIG_DIR, 'danger_zone.json')
 # 确保配置目录存在
 os.makedirs(CONFIG_DIR, exist_ok=True)
 
-# 全局变量，作为内存缓存
-DANGER_ZONE = []
-SAFETY_DISTANCE = 50
-LOITERING_THRESHOLD = 2.0
+DEFAULT_DANGER_ZONE = [[200, 200], [600, 200], [600, 400], [200, 400]]
+DEFAULT_SAFETY_DISTANCE = 50
+DEFAULT_LOITERING_THRESHOLD = 2.0
+
+# 检查配置文件 mtime 的最小间隔（秒），避免每帧都访问磁盘
+MTIME_CHECK_INTERVAL = 1.0
+
+# 每个配置快照最多缓存几种分辨率的栅格（摄像头、各路RTMP流、上传视频的分辨率可能不同）
+MAX_RASTERS_PER_CONFIG = 4
+
+# 空间索引的网格单元边长（像素）
+GRID_CELL_SIZE = 64
+# 网格登记时外接矩形的扩展倍数（相对安全距离）：绘制距离线的范围是安全距离的2倍
+GRID_MARGIN_FACTOR = 2
+
+# 全局默认区域的名称
+DEFAULT_ZONE_NAME = 'default'
+
 TARGET_CLASSES = [0] # 'person'
 
-def load_config():
-    """从JSON文件加载配置到全局变量中"""
-    global DANGER_ZONE, SAFETY_DISTANCE, LOITERING_THRESHOLD
-    try:
-        if os.path.exists(ZONE_CONFIG_FILE):
-            with open(ZONE_CONFIG_FILE, 'r') as f:
-                config_data = json.load(f)
-                # 将点列表转换为numpy数组
-                DANGER_ZONE = np.array(config_data.get('danger_zone', []))
-                SAFETY_DISTANCE = config_data.get('safety_distance', 50)
-                LOITERING_THRESHOLD = config_data.get('loitering_threshold', 2.0)
-                logging.info(f"成功从 {ZONE_CONFIG_FILE} 加载危险区域配置。")
+
+class ZoneRaster:
+    """
+    危险区域在某一分辨率下的栅格化结果，随配置快照缓存：
+        mask:     uint8 掩码，区域内为 1
+        distance: float32，每个像素到区域边缘的距离（cv2.distanceTransform，精度约 1 像素）
+    区域内外判断与距离查询都变成数组下标访问；掩码同时用于绘制半透明叠加层。
+    """
+    __slots__ = ('shape', 'mask', 'distance', 'bbox')
+
+    def __init__(self, zone, shape):
+        height, width = int(shape[0]), int(shape[1])
+        self.shape = (height, width)
+        mask = np.zeros((height, width), dtype=np.uint8)
+        if len(zone) >= 3:
+            cv2.fillPoly(mask, [zone.reshape((-1, 1, 2))], 1)
+        self.mask = mask
+        if mask.any() and not mask.all():
+            # 区域外：到最近区域像素的距离；区域内：到最近区域外像素的距离
+            outside = cv2.distanceTransform(1 - mask, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+            inside = cv2.distanceTransform(mask, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+            self.distance = np.where(mask > 0, inside, outside).astype(np.float32)
+        else:
+            # 区域为空或覆盖整个画面时画面内没有边缘，距离交给精确几何计算
+            self.distance = None
+        if mask.any():
+            x, y, w, h = cv2.boundingRect(mask)
+            self.bbox = (x, y, x + w, y + h)
         else:
-            # 如果文件不存在，使用默认值并创建文件
-            DANGER_ZONE = np.array([[200, 200], [600, 200], [600, 400], [200, 400]])
-            save_config()
-            logging.warning(f"配置文件 {ZONE_CONFIG_FILE} 不存在，已使用默认值创建。")
-    except (json.JSONDecodeError, IOError) as e:
-        logging.error(f"加载或创建配置文件 {ZONE_CONFIG_FILE} 时出错: {e}, 使用默认值。")
-        DANGER_ZONE = np.array([[200, 200], [600, 200], [600, 400], [200, 400]])
-        SAFETY_DISTANCE = 50
-        LOITERING_THRESHOLD = 2.0
-
-def save_config():
-    """将当前的全局配置变量保存到JSON文件"""
+            self.bbox = None
+
+    def lookup(self, points):
+        """返回 (inside, distances, valid)：画面外的点 valid 为 False，其结果无效"""
+        points = np.asarray(points).reshape(-1, 2).astype(np.int64)
+        x, y = points[:, 0], points[:, 1]
+        height, width = self.shape
+        valid = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        inside = np.zeros(len(points), dtype=bool)
+        distances = np.full(len(points), np.inf)
+        inside[valid] = self.mask[y[valid], x[valid]] > 0
+        if self.distance is not None:
+            distances[valid] = self.distance[y[valid], x[valid]]
+        else:
+            valid[:] = False
+        return inside, distances, valid
+
+    def blend(self, frame, color, alpha):
+        """在 frame 上按掩码混合半透明颜色，只处理区域外接矩形内的像素"""
+        if self.bbox is None:
+            return
+        x0, y0, x1, y1 = self.bbox
+        roi = frame[y0:y1, x0:x1]
+        blended = cv2.addWeighted(np.full_like(roi, color), alpha, roi, 1 - alpha, 0)
+        np.copyto(roi, blended, where=self.mask[y0:y1, x0:x1, None].astype(bool))
+
+
+class Zone:
+    """
+    一个命名的危险区域（只读）：多边形、安全距离、停留阈值。
+    边向量随区域预计算一次，栅格按分辨率懒构建并缓存。
+    """
+    __slots__ = ('name', 'polygon', 'safety_distance', 'loitering_threshold', 'geometry', 'bbox',
+                 '_rasters', '_raster_lock')
+
+    def __init__(self, name, polygon, safety_distance, loitering_threshold):
+        polygon = np.array(polygon, dtype=np.int32).reshape((-1, 2)) if len(polygon) > 0 else np.zeros((0, 2), dtype=np.int32)
+        polygon.setflags(write=False)
+        self.name = name
+        self.polygon = polygon
+        self.safety_distance = safety_distance
+        self.loitering_threshold = loitering_threshold
+        self.geometry = PolygonGeometry(polygon)
+        # 多边形外接矩形 (x0, y0, x1, y1)，用于空间预筛选
+        self.bbox = (tuple(polygon.min(axis=0)) + tuple(polygon.max(axis=0))) if len(polygon) else None
+        self._rasters = {}
+        # 摄像头、RTMP 与后台任务线程共用同一快照中的区域，栅格缓存的查找、构建与淘汰需互斥
+        self._raster_lock = threading.Lock()
+
+    def raster(self, shape):
+        """获取指定分辨率 (height, width) 下的栅格，首次使用时构建"""
+        key = (int(shape[0]), int(shape[1]))
+        with self._raster_lock:
+            raster = self._rasters.get(key)
+            if raster is None:
+                raster = ZoneRaster(self.polygon, key)
+                if len(self._rasters) >= MAX_RASTERS_PER_CONFIG:
+                    self._rasters.pop(next(iter(self._rasters)), None)
+                self._rasters[key] = raster
+            return raster
+
+    def locate(self, points, shape=None):
+        """
+        批量判断点是否在区域内及到区域边缘的距离，返回 (inside, distances)。
+        给出画面尺寸时按栅格查表，画面外的点回退到精确的几何计算。
+        """
+        points = np.asarray(points).reshape(-1, 2)
+        if shape is None:
+            inside, distances, _ = self.geometry.query(points)
+            return inside, distances
+        inside, distances, valid = self.raster(shape).lookup(points)
+        if not valid.all():
+            fallback = ~valid
+            exact_inside, exact_distances, _ = self.geometry.query(points[fallback])
+            inside[fallback] = exact_inside
+            distances[fallback] = exact_distances
+        return inside, distances
+
+    def blend_overlay(self, frame, color, alpha):
+        """用缓存的掩码在 frame 上绘制半透明区域，代替整帧拷贝 + fillPoly + addWeighted"""
+        self.raster(frame.shape[:2]).blend(frame, color, alpha)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'polygon': self.polygon.tolist(),
+            'safety_distance': self.safety_distance,
+            'loitering_threshold': self.loitering_threshold
+        }
+
+
+class ZoneHits:
+    """
+    一批点与一组区域的批量判断结果，只包含通过空间预筛选的 (点, 区域) 组合：
+        point_index / zone_index / inside / distance 四个等长数组
+    """
+    __slots__ = ('zones', 'point_index', 'zone_index', 'inside', 'distance')
+
+    def __init__(self, zones, point_index, zone_index, inside, distance):
+        self.zones = zones
+        self.point_index = point_index
+        self.zone_index = zone_index
+        self.inside = inside
+        self.distance = distance
+
+    def __len__(self):
+        return len(self.point_index)
+
+    def by_point(self, count):
+        """按点分组：返回长度为 count 的列表，第 i 项为 [(zone, inside, distance), ...]"""
+        groups = [[] for _ in range(count)]
+        for point, zone, inside, distance in zip(self.point_index.tolist(), self.zone_index.tolist(),
+                                                 self.inside.tolist(), self.distance.tolist()):
+            groups[point].append((self.zones[zone], inside, distance))
+        return groups
+
+
+class ZoneSet:
+    """
+    一路流的全部命名区域，带均匀网格空间索引。
+
+    每个区域的外接矩形向外扩展 GRID_MARGIN_FACTOR 倍安全距离后登记到覆盖的网格单元中；
+    查询时每个点只与其所在单元登记的区域做精确判断。扩展矩形之外的点到该区域的距离必然大于2倍安全距离，
+    既不会在区域内、不会触发靠近告警，也不需要绘制距离线，因此预筛选不会漏掉任何结果。
+    """
+
+    def __init__(self, zones, cell_size=GRID_CELL_SIZE):
+        self.zones = tuple(zones)
+        self.cell_size = cell_size
+        self._grid = {}
+        for index, zone in enumerate(self.zones):
+            if zone.bbox is None:
+                continue
+            margin = zone.safety_distance * GRID_MARGIN_FACTOR
+            x0, y0, x1, y1 = zone.bbox
+            cx0, cy0 = int((x0 - margin) // cell_size), int((y0 - margin) // cell_size)
+            cx1, cy1 = int((x1 + margin) // cell_size), int((y1 + margin) // cell_size)
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self._grid.setdefault((cx, cy), []).append(index)
+
+    def __len__(self):
+        return len(self.zones)
+
+    def __iter__(self):
+        return iter(self.zones)
+
+    def query(self, points, shape=None):
+        """批量判断所有点与本组区域的关系，返回 ZoneHits"""
+        points = np.asarray(points).reshape(-1, 2)
+        empty = np.zeros(0, dtype=np.int64)
+        if len(points) == 0 or not self._grid:
+            return ZoneHits(self.zones, empty, empty, np.zeros(0, dtype=bool), np.zeros(0))
+
+        # 1. 网格预筛选：同一单元内的点共享候选区域
+        cells = np.floor_divide(points, self.cell_size).astype(np.int64)
+        unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique_cells) + 1))
+        candidates = {}
+        for cell_index, (cx, cy) in enumerate(unique_cells.tolist()):
+            zone_indices = self._grid.get((cx, cy))
+            if not zone_indices:
+                continue
+            point_indices = order[bounds[cell_index]:bounds[cell_index + 1]]
+            for zone_index in zone_indices:
+                candidates.setdefault(zone_index, []).append(point_indices)
+
+        # 2. 每个区域对其候选点做一次批量判断
+        point_parts, zone_parts, inside_parts, distance_parts = [], [], [], []
+        for zone_index, parts in candidates.items():
+            point_indices = np.concatenate(parts)
+            inside, distances = self.zones[zone_index].locate(points[point_indices], shape)
+            point_parts.append(point_indices)
+            zone_parts.append(np.full(len(point_indices), zone_index, dtype=np.int64))
+            inside_parts.append(inside)
+            distance_parts.append(distances)
+        if not point_parts:
+            return ZoneHits(self.zones, empty, empty, np.zeros(0, dtype=bool), np.zeros(0))
+        return ZoneHits(self.zones, np.concatenate(point_parts), np.concatenate(zone_parts),
+                        np.concatenate(inside_parts), np.concatenate(distance_parts))
+
+
+class ZoneConfig:
+    """
+    危险区域配置的不可变快照。
+    每次配置变化都会生成一个 version 更大的新快照并整体替换，
+    消费者在一帧内持有同一个快照，不会读到"新区域 + 旧阈值"这样的中间状态。
+
+    danger_zone / safety_distance / loitering_threshold 是全局默认区域（名为 default），
+    没有单独配置区域的流（摄像头、上传视频、RTMP流）都使用它；
+    streams 为按流配置的命名区域列表 {stream: (Zone, ...)}。
+    """
+    __slots__ = ('version', 'danger_zone', 'safety_distance', 'loitering_threshold',
+                 'default_zone', 'streams', '_zone_sets')
+
+    def __init__(self, version, danger_zone, safety_distance, loitering_threshold, streams=None):
+        default_zone = Zone(DEFAULT_ZONE_NAME, danger_zone, safety_distance, loitering_threshold)
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'danger_zone', default_zone.polygon)
+        object.__setattr__(self, 'safety_distance', safety_distance)
+        object.__setattr__(self, 'loitering_threshold', loitering_threshold)
+        object.__setattr__(self, 'default_zone', default_zone)
+        object.__setattr__(self, 'streams', {
+            stream: tuple(zones) for stream, zones in (streams or {}).items()
+        })
+        # 按流缓存的 ZoneSet（含网格索引），新版本快照自带空缓存
+        object.__setattr__(self, '_zone_sets', {})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ZoneConfig 是只读快照，请通过 update_danger_zone/update_thresholds 修改配置")
+
+    @property
+    def geometry(self):
+        return self.default_zone.geometry
+
+    def raster(self, shape):
+        """默认区域在指定分辨率下的栅格"""
+        return self.default_zone.raster(shape)
+
+    def locate(self, points, shape=None):
+        """批量判断点与默认区域的关系，返回 (inside, distances)"""
+        return self.default_zone.locate(points, shape)
+
+    def blend_overlay(self, frame, color, alpha):
+        self.default_zone.blend_overlay(frame, color, alpha)
+
+    def zones_for(self, stream):
+        """流使用的区域列表：有单独配置时使用其命名区域，否则使用全局默认区域"""
+        return self.streams.get(stream) or (self.default_zone,)
+
+    def zone_set(self, stream='camera'):
+        """流的 ZoneSet（带空间索引），按快照缓存"""
+        zone_set = self._zone_sets.get(stream)
+        if zone_set is None:
+            zone_set = ZoneSet(self.zones_for(stream))
+            self._zone_sets[stream] = zone_set
+        return zone_set
+
+    def with_overrides(self, stream, danger_zone=None, safety_distance=None, loitering_threshold=None):
+        """
+        在本快照之上应用临时覆盖，返回 version 为 0 的新快照（不发布、不保存）。
+        默认区域按覆盖值替换；stream 有单独配置的区域时，阈值覆盖到它的每个区域上，
+        给出 danger_zone 时该流改为只使用这一个多边形。其他流的区域保持不变。
+        """
+        safety = self.safety_distance if safety_distance is None else safety_distance
+        loitering = self.loitering_threshold if loitering_threshold is None else loitering_threshold
+        polygon = self.danger_zone.tolist() if danger_zone is None else danger_zone
+        streams = dict(self.streams)
+        if stream in streams:
+            if danger_zone is not None:
+                streams[stream] = (Zone(DEFAULT_ZONE_NAME, polygon, safety, loitering),)
+            else:
+                streams[stream] = tuple(
+                    Zone(zone.name, zone.polygon,
+                         zone.safety_distance if safety_distance is None else safety_distance,
+                         zone.loitering_threshold if loitering_threshold is None else loitering_threshold)
+                    for zone in streams[stream]
+                )
+        return ZoneConfig(0, polygon, safety, loitering, streams)
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'danger_zone': self.danger_zone.tolist(),
+            'safety_distance': self.safety_distance,
+            'loitering_threshold': self.loitering_threshold,
+            'streams': {stream: [zone.to_dict() for zone in zones] for stream, zones in self.streams.items()}
+        }
+
+
+# 当前生效的配置快照及其元数据
+_lock = threading.Lock()
+_current = None
+_file_mtime = None
+_last_mtime_check = 0.0
+
+# 全局变量，作为内存缓存（保留以兼容直接读取模块属性的旧代码）
+DANGER_ZONE = np.array(DEFAULT_DANGER_ZONE)
+SAFETY_DISTANCE = DEFAULT_SAFETY_DISTANCE
+LOITERING_THRESHOLD = DEFAULT_LOITERING_THRESHOLD
+
+
+def _get_file_mtime():
+    try:
+        return os.path.getmtime(ZONE_CONFIG_FILE)
+    except OSError:
+        return None
+
+
+def _parse_zone(data, index=0):
+    """把 JSON 中的区域描述解析为 Zone，缺省阈值使用全局默认值"""
+    polygon = data.get('polygon') or data.get('danger_zone') or []
+    if len(polygon) < 3:
+        raise ValueError(f"区域 {data.get('name', index)} 至少需要3个顶点")
+    return Zone(
+        str(data.get('name') or f"zone_{index + 1}"),
+        polygon,
+        float(data.get('safety_distance', DEFAULT_SAFETY_DISTANCE)),
+        float(data.get('loitering_threshold', DEFAULT_LOITERING_THRESHOLD))
+    )
+
+
+def _parse_streams(streams_data):
+    """解析 {stream: [区域, ...]}，同一路流中的区域名称必须唯一"""
+    streams = {}
+    for stream, zones_data in (streams_data or {}).items():
+        zones = [_parse_zone(zone_data, index) for index, zone_data in enumerate(zones_data)]
+        names = [zone.name for zone in zones]
+        if len(set(names)) != len(names):
+            raise ValueError(f"流 {stream} 中存在重名的区域")
+        if zones:
+            streams[str(stream)] = zones
+    return streams
+
+
+def _publish(danger_zone, safety_distance, loitering_threshold, streams=None):
+    """生成新版本快照并原子替换（调用方需持有 _lock）"""
+    global _current, DANGER_ZONE, SAFETY_DISTANCE, LOITERING_THRESHOLD
+    version = _current.version + 1 if _current is not None else 1
+    snapshot = ZoneConfig(version, danger_zone, safety_distance, loitering_threshold, streams)
+    _current = snapshot
+    DANGER_ZONE = snapshot.danger_zone
+    SAFETY_DISTANCE = snapshot.safety_distance
+    LOITERING_THRESHOLD = snapshot.loitering_threshold
+    return snapshot
+
+
+def get_config():
+    """
+    获取当前生效的配置快照。
+    只在距上次检查超过 MTIME_CHECK_INTERVAL 时才 stat 一次配置文件，
+    文件被外部修改（mtime 变化）时自动重新加载。
+    """
+    global _last_mtime_check
+    now = time.time()
+    if _current is None:
+        load_config(force=True)
+    elif now - _last_mtime_check >= MTIME_CHECK_INTERVAL:
+        _last_mtime_check = now
+        if _get_file_mtime() != _file_mtime:
+            load_config(force=True)
+    return _current
+
+
+def load_config(force=False):
+    """
+    从JSON文件加载配置并发布新版本快照。
+    force=False 时仅在文件 mtime 发生变化时才重新解析。
+    """
+    global _file_mtime
+    with _lock:
+        mtime = _get_file_mtime()
+        if not force and _current is not None and mtime == _file_mtime:
+            return _current
+        try:
+            if mtime is not None:
+                with open(ZONE_CONFIG_FILE, 'r') as f:
+                    config_data = json.load(f)
+                snapshot = _publish(
+                    config_data.get('danger_zone', []),
+                    config_data.get('safety_distance', DEFAULT_SAFETY_DISTANCE),
+                    config_data.get('loitering_threshold', DEFAULT_LOITERING_THRESHOLD),
+                    _parse_streams(config_data.get('streams'))
+                )
+                _file_mtime = mtime
+                logging.info(f"成功从 {ZONE_CONFIG_FILE} 加载危险区域配置 (version {snapshot.version})。")
+            else:
+                # 如果文件不存在，使用默认值并创建文件
+                snapshot = _publish(DEFAULT_DANGER_ZONE, DEFAULT_SAFETY_DISTANCE, DEFAULT_LOITERING_THRESHOLD)
+                save_config(snapshot)
+                logging.warning(f"配置文件 {ZONE_CONFIG_FILE} 不存在，已使用默认值创建。")
+        except (json.JSONDecodeError, IOError, ValueError, TypeError) as e:
+            logging.error(f"加载或创建配置文件 {ZONE_CONFIG_FILE} 时出错: {e}, 使用默认值。")
+            snapshot = _publish(DEFAULT_DANGER_ZONE, DEFAULT_SAFETY_DISTANCE, DEFAULT_LOITERING_THRESHOLD)
+            _file_mtime = mtime
+    return snapshot
+
+
+def save_config(snapshot=None):
+    """将配置快照保存到JSON文件（先写临时文件再替换，避免读到写了一半的文件）"""
+    global _file_mtime
+    snapshot = snapshot or _current
     try:
         config_data = {
             # 将numpy数组转换为原生列表以便JSON序列化
-            'danger_zone': DANGER_ZONE.tolist() if isinstance(DANGER_ZONE, np.ndarray) else DANGER_ZONE,
-            'safety_distance': SAFETY_DISTANCE,
-            'loitering_threshold': LOITERING_THRESHOLD
+            'danger_zone': snapshot.danger_zone.tolist(),
+            'safety_distance': snapshot.safety_distance,
+            'loitering_threshold': snapshot.loitering_threshold
         }
-        with open(ZONE_CONFIG_FILE, 'w') as f:
+        if snapshot.streams:
+            config_data['streams'] = {
+                stream: [zone.to_dict() for zone in zones] for stream, zones in snapshot.streams.items()
+            }
+        tmp_file = ZONE_CONFIG_FILE + '.tmp'
+        with open(tmp_file, 'w') as f:
             json.dump(config_data, f, indent=4)
+        os.replace(tmp_file, ZONE_CONFIG_FILE)
+        # 记录自己写入后的 mtime，避免下次检查时重复加载
+        _file_mtime = _get_file_mtime()
     except IOError as e:
         print(f"Error saving config file: {e}")
 
+
 def update_danger_zone(new_zone):
-    """更新危险区域并保存到文件"""
-    global DANGER_ZONE
-    DANGER_ZONE = np.array(new_zone)
-    save_config()
+    """更新危险区域并保存到文件，返回新版本快照"""
+    get_config()  # 配置文件被外部修改时先重新加载（load_config 自己获取 _lock）
+    with _lock:
+        # 在锁内读取最新快照，并发的两次更新不会基于同一个旧快照而互相覆盖
+        current = _current
+        snapshot = _publish(new_zone, current.safety_distance, current.loitering_threshold, current.streams)
+        save_config(snapshot)
+    return snapshot
+
 
 def update_thresholds(new_safety_distance, new_loitering_threshold):
-    """更新阈值并保存到文件"""
-    global SAFETY_DISTANCE, LOITERING_THRESHOLD
-    SAFETY_DISTANCE = new_safety_distance
-    LOITERING_THRESHOLD = new_loitering_threshold
-    save_config()
+    """更新阈值并保存到文件，返回新版本快照"""
+    get_config()
+    with _lock:
+        current = _current
+        snapshot = _publish(current.danger_zone, new_safety_distance, new_loitering_threshold, current.streams)
+        save_config(snapshot)
+    return snapshot
+
+
+def get_stream_zones(stream):
+    """获取流使用的区域列表（未单独配置时为全局默认区域）"""
+    return get_config().zones_for(stream)
+
+
+def update_stream_zones(stream, zones_data):
+    """
+    设置一路流的命名区域列表并保存到文件，返回新版本快照。
+    zones_data: [{"name", "polygon", "safety_distance", "loitering_threshold"}, ...]，
+    为空列表时删除该流的单独配置，恢复使用全局默认区域。
+    参数无效时抛出 ValueError。
+    """
+    parsed = _parse_streams({stream: zones_data}) if zones_data else {}
+    get_config()
+    with _lock:
+        current = _current
+        streams = dict(current.streams)
+        streams.pop(stream, None)
+        streams.update(parsed)
+        snapshot = _publish(current.danger_zone, current.safety_distance, current.loitering_threshold, streams)
+        save_config(snapshot)
+    return snapshot
 
 # 在模块首次加载时，立即从文件加载配置
-load_config() 
\ No newline at end of file
+load_config(force=True)
@@ -0,0 +1,170 @@
+import atexit
+import queue
+import threading
+import time
+import traceback
+
+from app import db
+
+# 队列容量：写库跟不上时最多积压的记录数
+DEFAULT_QUEUE_SIZE = 2000
+# 攒够这么多行立即写一批
+DEFAULT_BATCH_SIZE = 200
+# 即使没攒够，也最多等待这么久（秒）就写一批
+DEFAULT_FLUSH_INTERVAL = 0.5
+# 队列已满时调用方最多等待的时间（秒），超时则丢弃该记录并计数，保证推理线程不会被数据库拖住
+DEFAULT_PUT_TIMEOUT = 0.05
+
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    后台批量写库线程（write-behind）。
+
+    调用方只把行数据（列名 -> 值的字典）放入有界队列；写入线程攒够 batch_size 行或等待满 flush_interval 秒后，
+    在应用上下文中用一次 executemany INSERT 写入整批并提交，数据库往返从每条一次降为每批一次。
+    队列满时 submit 最多阻塞 put_timeout 秒（背压），仍放不进去则丢弃并计入 dropped。
+    进程退出时自动把队列中剩余的记录写完。
+    """
+
+    def __init__(self, name, model, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, put_timeout=DEFAULT_PUT_TIMEOUT):
+        self.name = name
+        self.model = model
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._app = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0,
+                       'blocked': 0, 'last_batch_rows': 0, 'last_batch_ms': 0.0, 'total_write_ms': 0.0}
+
+    def init_app(self, app):
+        """绑定 Flask 应用，写入线程在该应用的上下文中访问数据库"""
+        self._app = app
+
+    def _get_app(self):
+        if self._app is None:
+            # 未在 create_app 中绑定（例如 Celery worker）时，只创建一次应用
+            from app import create_app
+            self._app = create_app()
+        return self._app
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def submit(self, row):
+        """把一行放入写入队列，返回是否成功入队"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._count('blocked')
+            try:
+                self._queue.put(row, timeout=self.put_timeout)
+            except queue.Full:
+                self._count('dropped')
+                return False
+        self._count('submitted')
+        return True
+
+    def prepare(self, rows):
+        """写库前在写入线程中对整批数据做的处理（子类可覆盖，例如落盘快照）"""
+        return rows
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write(batch)
+            finally:
+                for _ in range(len(batch) + (1 if stop else 0)):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        try:
+            rows = self.prepare(batch)
+            with self._get_app().app_context():
+                try:
+                    db.session.execute(self.model.__table__.insert(), rows)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+        except Exception as e:
+            self._count('failed', len(batch))
+            print(f"[{self.name}] 批量写入 {len(batch)} 条记录失败: {e}")
+            print(traceback.format_exc())
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats['written'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['last_batch_rows'] = len(batch)
+            self._stats['last_batch_ms'] = round(elapsed_ms, 2)
+            self._stats['total_write_ms'] += elapsed_ms
+
+    def flush(self, timeout=None):
+        """等待队列中已提交的记录全部写完，返回是否在超时前完成"""
+        if self._thread is None or not self._thread.is_alive():
+            return self._queue.unfinished_tasks == 0
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=5.0):
+        """写完剩余记录并结束写入线程"""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['queue_capacity'] = self._queue.maxsize
+        stats['avg_batch_ms'] = round(stats.pop('total_write_ms') / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
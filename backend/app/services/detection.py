@@ -2,32 +2,25 @@ import cv2
 import numpy as np
 from ultralytics import YOLO
 import os
-from app.services.danger_zone import DANGER_ZONE, SAFETY_DISTANCE, LOITERING_THRESHOLD, TARGET_CLASSES
+from app.services import danger_zone as danger_zone_service
+from app.services.danger_zone import TARGET_CLASSES
 from app.services.alerts import (
-    add_alert, update_loitering_time, reset_loitering_time, get_loitering_time,
-    update_detection_time, get_alerts, reset_alerts
+    add_alert, evaluate_target_zones, update_detection_time, get_alerts, reset_alerts, drop_stream_state
 )
-from app.utils.geometry import point_in_polygon, distance_to_polygon
-from app.services.dlib_service import dlib_face_service
+from app.services.dlib_service import dlib_face_service, RECOGNITION_THRESHOLD
 from app.services import system_state
+from app.services import track_state
 from app.services.smoking_detection_service import SmokingDetectionService
+from app.services.metrics import metrics
+from app.services import detection_index
 import time
+import copy
+import json
+import threading
+import uuid
+from contextlib import contextmanager
 from concurrent.futures import ThreadPoolExecutor
 from app.services import violenceDetect
-<<<<<<< HEAD
-from .liveness_detection import LivenessDetector
-=======
-# --- 新增：导入config模块以访问其状态 ---
-from app.routes import config as config_state
-# --- 结束新增 ---
-
-
-# --- 快照保存路径 ---
-SNAPSHOTS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'uploads', 'snapshots')
-os.makedirs(SNAPSHOTS_DIR, exist_ok=True)
-
-=======
->>>>>>> parent of 643c11e (Revert "update")
 
 # --- 模型管理 (使用相对路径) ---
 # 路径是相对于 backend/app/services/ 目录的
@@ -43,32 +36,171 @@ FACE_MODEL_PATH = os.path.join(MODEL_DIR, "yolov8n-face-lindevs.pt")
 SMOKING_MODEL_PATH = os.path.join(MODEL_DIR, "smoking_detection.pt")
 
 
+class ModelPool:
+    """
+    进程级的YOLO模型池。
+
+    每种模型的权重只从磁盘加载一次，并以只读方式在所有会话间共享；
+    每个会话通过 acquire() 拿到一个轻量的"会话实例"：它与共享实例使用同一份网络权重，
+    但拥有独立的 predictor（包括追踪器状态）和回调列表，因此不同会话的 track(persist=True) 互不干扰。
+    会话结束后调用 release() 归还实例，追踪器状态被重置后留给下一个会话复用，避免重复构建 predictor。
+    """
+
+    def __init__(self, model_paths, max_idle_per_model=4):
+        self.model_paths = dict(model_paths)
+        self.max_idle_per_model = max_idle_per_model
+        self._lock = threading.Lock()
+        self._shared = {}
+        self._idle = {name: [] for name in self.model_paths}
+        self._leased = {name: 0 for name in self.model_paths}
+        self._load_seconds = {}
+
+    def get_shared(self, name):
+        """获取共享的模型实例（首次调用时加载权重）。只读使用，不要在其上调用 track()。"""
+        model = self._shared.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._shared.get(name)
+            if model is None:
+                if name not in self.model_paths:
+                    raise KeyError(f"未知的模型: {name}")
+                t0 = time.time()
+                model = YOLO(self.model_paths[name])
+                self._load_seconds[name] = time.time() - t0
+                self._shared[name] = model
+                print(f"模型池: 已加载 {name} ({self._load_seconds[name]:.2f}s)")
+        return model
+
+    def _new_session_instance(self, name):
+        """基于共享实例创建会话实例：共享网络权重，独立的 predictor / 追踪器 / 回调"""
+        shared = self.get_shared(name)
+        instance = copy.copy(shared)
+        instance.predictor = None
+        instance.overrides = dict(shared.overrides)
+        # track() 会向 callbacks 注册追踪器回调，必须为每个会话复制一份，避免回调在会话间累积
+        instance.callbacks = {event: list(funcs) for event, funcs in shared.callbacks.items()}
+        return instance
+
+    @staticmethod
+    def _reset_tracker_state(instance):
+        """重置会话实例的追踪器状态，使其可以安全地交给下一个会话"""
+        predictor = getattr(instance, 'predictor', None)
+        for tracker in getattr(predictor, 'trackers', None) or []:
+            try:
+                tracker.reset()
+            except Exception as e:
+                print(f"模型池: 重置追踪器失败: {e}")
+
+    def acquire(self, name):
+        """借出一个会话实例（拥有独立的追踪/预测状态）"""
+        with self._lock:
+            idle = self._idle.setdefault(name, [])
+            instance = idle.pop() if idle else None
+            self._leased[name] = self._leased.get(name, 0) + 1
+        if instance is None:
+            instance = self._new_session_instance(name)
+        return instance
+
+    def release(self, name, instance):
+        """归还会话实例"""
+        if instance is None:
+            return
+        self._reset_tracker_state(instance)
+        with self._lock:
+            self._leased[name] = max(0, self._leased.get(name, 0) - 1)
+            idle = self._idle.setdefault(name, [])
+            if len(idle) < self.max_idle_per_model:
+                idle.append(instance)
+
+    @contextmanager
+    def lease(self, name):
+        """with model_pool.lease('object') as model: ... 用完自动归还"""
+        instance = self.acquire(name)
+        try:
+            yield instance
+        finally:
+            self.release(name, instance)
+
+    def acquire_session(self, names=('object', 'face', 'pose')):
+        """一次借出多个模型的会话实例，返回 {name: instance}"""
+        return {name: self.acquire(name) for name in names}
+
+    def release_session(self, models):
+        """归还 acquire_session() 借出的全部实例"""
+        for name, instance in list(models.items()):
+            self.release(name, instance)
+
+    def memory_report(self):
+        """报告已加载模型的参数内存占用、会话实例数量以及进程常驻内存"""
+        models = {}
+        with self._lock:
+            for name, model in self._shared.items():
+                param_bytes = 0
+                try:
+                    for param in model.model.parameters():
+                        param_bytes += param.numel() * param.element_size()
+                except Exception:
+                    pass
+                models[name] = {
+                    'path': self.model_paths.get(name),
+                    'param_mb': round(param_bytes / (1024 * 1024), 2),
+                    'load_seconds': round(self._load_seconds.get(name, 0.0), 3),
+                    'leased_sessions': self._leased.get(name, 0),
+                    'idle_sessions': len(self._idle.get(name, [])),
+                }
+        return {
+            'models': models,
+            'total_param_mb': round(sum(m['param_mb'] for m in models.values()), 2),
+            'process_rss_mb': _process_rss_mb(),
+        }
+
+
+def _process_rss_mb():
+    """当前进程常驻内存（MB），psutil 不可用时退化为峰值常驻内存"""
+    try:
+        import psutil
+        return round(psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024), 2)
+    except ImportError:
+        pass
+    try:
+        import resource
+        # Linux 下 ru_maxrss 单位为 KB
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2)
+    except ImportError:
+        return None
+
+
+# 全局模型池：权重只加载一次，由实时流、图片/视频上传共享
+model_pool = ModelPool({
+    'object': OBJECT_MODEL_PATH,
+    'face': FACE_MODEL_PATH,
+    'pose': POSE_MODEL_PATH,
+})
+
+# 上传的图片/视频在区域配置中使用的流标识（可在 danger_zone.json 的 streams 中单独配置区域）
+UPLOAD_STREAM = 'upload'
+
+# 会保存检测索引的检测模式 -> (模型池中的模型名, 权重路径)
+INDEX_MODELS = {
+    'object_detection': ('object', OBJECT_MODEL_PATH),
+    'fall_detection': ('pose', POSE_MODEL_PATH),
+}
+
 # 全局变量来持有加载的模型
-pose_model = None
-object_model = None
-face_model = None
 smoking_model = None
 
 def get_pose_model():
-    """获取姿态估计模型实例"""
-    global pose_model
-    if pose_model is None:
-        pose_model = YOLO(POSE_MODEL_PATH)
-    return pose_model
+    """获取姿态估计模型实例（共享实例，只读）"""
+    return model_pool.get_shared('pose')
 
 def get_object_model():
-    """获取通用目标检测模型实例"""
-    global object_model
-    if object_model is None:
-        object_model = YOLO(OBJECT_MODEL_PATH)
-    return object_model
+    """获取通用目标检测模型实例（共享实例，只读）"""
+    return model_pool.get_shared('object')
 
 def get_face_model():
-    """获取人脸检测和追踪模型实例"""
-    global face_model
-    if face_model is None:
-        face_model = YOLO(FACE_MODEL_PATH)
-    return face_model
+    """获取人脸检测和追踪模型实例（共享实例，只读）"""
+    return model_pool.get_shared('face')
 
 def get_smoking_model():
     """获取抽烟检测模型实例"""
@@ -82,8 +214,9 @@ def get_model():
     """获取YOLO模型实例（默认为目标检测）"""
     return get_object_model()
 
-# 用于存储每个人姿态历史信息
-pose_history = {}
+# 每个人的姿态历史按流保存在 track_state 的环形缓冲区中
+FALL_VELOCITY_THRESHOLD = 15  # 判定快速下坠的重心Y速度 (像素/帧，向下为正)
+FALL_ANGLE_THRESHOLD = 45  # 身体主干与水平线夹角小于该角度视为倒地
 FALL_DETECTION_THRESHOLD_SPEED = -15  # 重心Y坐标速度阈值 (像素/帧)
 FALL_DETECTION_THRESHOLD_STATE_FRAMES = 10 # 确认跌倒状态需要的帧数
 
@@ -98,8 +231,9 @@ def process_image(filepath, uploads_dir):
     返回:
         dict: 包含处理结果的字典
     """
-    # 重置警报，以防上次调用的状态残留
-    reset_alerts()
+    # 图片请求在接口线程中直接处理，可能与队列中的视频任务同时运行：
+    # 使用本次请求独立的流标识，不重置、不读取视频任务所在的 upload 流的状态与告警
+    stream = f"{UPLOAD_STREAM}:image:{uuid.uuid4().hex}"
     
     # 读取图片
     img = cv2.imread(filepath)
@@ -108,42 +242,42 @@ def process_image(filepath, uploads_dir):
     
     res_plotted = img.copy() # Start with a copy of the original image
     
-    # --- 修复：为静态图片处理添加模式判断 ---
-    if system_state.DETECTION_MODE == 'face_only':
-        # 在人脸识别模式下，直接调用人脸处理函数
-        # 注意：对于静态图片，我们没有追踪状态，所以创建一个临时的state
-        face_model_local = get_face_model()
-        state = {'face_model': face_model_local}
-        process_faces_only(res_plotted, 1, state) # frame_count 设为 1
-    
-    elif system_state.DETECTION_MODE == 'smoking_detection':
-        # --- FIX: Use fresh, local model instances for stateless image processing ---
-        face_model_local = YOLO(FACE_MODEL_PATH)
-        object_model_local = YOLO(OBJECT_MODEL_PATH)
-        smoking_model = get_smoking_model() # This service is a stateless wrapper, it's fine
+    try:
+        # --- 修复：为静态图片处理添加模式判断 ---
+        if system_state.DETECTION_MODE == 'face_only':
+            # 在人脸识别模式下，直接调用人脸处理函数
+            # 注意：对于静态图片，我们没有追踪状态，所以创建一个临时的state
+            with model_pool.lease('face') as face_model_local:
+                state = {'face_model': face_model_local}
+                process_faces_only(res_plotted, 1, state) # frame_count 设为 1
+        
+        elif system_state.DETECTION_MODE == 'smoking_detection':
+            # --- 使用模型池中的会话实例，避免每次上传都重新加载权重 ---
+            smoking_model = get_smoking_model() # This service is a stateless wrapper, it's fine
 
-        face_results = face_model_local.predict(img, verbose=False)
-        person_results = object_model_local.predict(img, classes=[0], verbose=False)
+            with model_pool.lease('face') as face_model_local, model_pool.lease('object') as object_model_local:
+                face_results = face_model_local.predict(img, verbose=False)
+                person_results = object_model_local.predict(img, classes=[0], verbose=False)
 
-        # Call the processing function with the results, which draws on the frame
-        res_plotted = process_smoking_detection_hybrid(res_plotted, person_results, face_results, smoking_model)
+            # Call the processing function with the results, which draws on the frame
+            res_plotted = process_smoking_detection_hybrid(res_plotted, person_results, face_results, smoking_model,
+                                                           stream=stream)
 
-    elif system_state.DETECTION_MODE == 'violence_detection':
-        # 暴力检测仅支持视频
-        return {"status": "error", "message": "暴力检测仅支持视频文件"}, 400
+        elif system_state.DETECTION_MODE == 'violence_detection':
+            # 暴力检测仅支持视频
+            return {"status": "error", "message": "暴力检测仅支持视频文件"}, 400
 
-    else:
-        # Default execution path must also use a fresh, local instance
-        model_local = YOLO(OBJECT_MODEL_PATH)
-        detections = model_local.predict(img)
-        res_plotted = detections[0].plot()
-        
-        # Draw danger zone overlay on the plotted results
-        danger_zone_pts = DANGER_ZONE.reshape((-1, 1, 2))
-        overlay = res_plotted.copy()
-        cv2.fillPoly(overlay, [danger_zone_pts], (0, 0, 255))
-        cv2.addWeighted(overlay, 0.4, res_plotted, 0.6, 0, res_plotted)
-        cv2.polylines(res_plotted, [danger_zone_pts], True, (0, 0, 255), 3)
+        else:
+            # Default execution path uses a pooled session instance
+            with model_pool.lease('object') as model_local:
+                detections = model_local.predict(img)
+            res_plotted = detections[0].plot()
+            
+            # 与上传视频一致，绘制上传流使用的危险区域（有单独配置时为其命名区域）
+            draw_danger_zone_overlay(res_plotted, danger_zone_service.get_config(), UPLOAD_STREAM)
+        alerts = get_alerts(stream)
+    finally:
+        drop_stream_state(stream)
 
     # 保存处理后的图像
     output_filename = 'processed_' + os.path.basename(filepath)
@@ -159,22 +293,110 @@ def process_image(filepath, uploads_dir):
         "status": "success",
         "media_type": "image",
         "file_url": output_url,
-        "alerts": get_alerts()
+        "alerts": alerts
     }
 
-def process_video(filepath, uploads_dir):
+def create_video_writer(output_path, output_filename, fps, frame_width, frame_height):
+    """
+    创建视频写入器，优先使用H.264编码，不可用时依次回退到MJPG和无损编码。
+
+    返回:
+        (VideoWriter, 实际使用的输出文件名)
+    """
+    # 创建视频写入器 - 使用H.264编码器替代mp4v
+    try:
+        # 尝试使用H.264编码器
+        fourcc = cv2.VideoWriter_fourcc(*"avc1")
+        out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
+        
+        # 如果H.264编码器不可用，回退到MJPG
+        if not out.isOpened():
+            print("警告: H.264编码器不可用，回退到MJPG")
+            output_path_avi = output_path.replace(".mp4", ".avi")
+            fourcc = cv2.VideoWriter_fourcc(*"MJPG")
+            out = cv2.VideoWriter(output_path_avi, fourcc, fps, (frame_width, frame_height))
+            output_filename = output_filename.replace(".mp4", ".avi")
+    except Exception as e:
+        print(f"视频编码器错误: {e}")
+        # 最后的回退选项 - 使用无损编码
+        fourcc = cv2.VideoWriter_fourcc(*"DIB ")
+        out = cv2.VideoWriter(output_path.replace(".mp4", ".avi"), fourcc, fps, (frame_width, frame_height))
+        output_filename = output_filename.replace(".mp4", ".avi")
+    return out, output_filename
+
+
+def draw_danger_zone_overlay(frame, zone_config, stream=None):
+    """在离线视频帧上绘制该流全部危险区域的半透明叠加层和文字"""
+    for zone in zone_config.zones_for(stream or UPLOAD_STREAM):
+        if len(zone.polygon) == 0:
+            continue
+        danger_zone_pts = zone.polygon.reshape((-1, 1, 2))
+        zone.blend_overlay(frame, (0, 0, 255), 0.4)
+        cv2.polylines(frame, [danger_zone_pts], True, (0, 0, 255), 3)
+        
+        # 在危险区域中添加文字（命名区域显示区域名）
+        danger_zone_center = np.mean(zone.polygon, axis=0, dtype=np.int32)
+        text = "Danger Zone" if zone.name == danger_zone_service.DEFAULT_ZONE_NAME else zone.name
+        cv2.putText(frame, text, 
+                    (danger_zone_center[0] - 60, danger_zone_center[1]),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 3)
+
+
+def create_index_writer(filepath, mode, model, fps, frame_width, frame_height):
+    """为支持重放的检测模式创建检测索引写入器；模式不支持或索引已存在时返回 None"""
+    if mode not in INDEX_MODELS:
+        return None
+    kind, model_path = INDEX_MODELS[mode]
+    try:
+        return detection_index.create_writer(filepath, kind, model_path, fps or 30.0,
+                                             frame_width, frame_height, model.names)
+    except Exception as e:
+        print(f"创建检测索引失败: {e}")
+        return None
+
+
+def commit_index_writer(index_writer):
+    """保存检测索引；失败只打印日志，不影响视频处理结果"""
+    if index_writer is None:
+        return
+    try:
+        index_writer.commit()
+    except Exception as e:
+        print(f"保存检测索引失败: {e}")
+
+
+def process_video(filepath, uploads_dir, parallel=None, progress_callback=None,
+                  output='video', sidecar_format='npz', preview_fps=None, mode=None):
     """
     处理视频文件
     
     参数:
         filepath: 视频文件路径
         uploads_dir: 上传文件目录
+        parallel: 是否使用多进程分段推理；为 None 时使用 system_state.VIDEO_PARALLEL_ENABLED。
+                  目前仅目标检测模式支持，其他模式自动回退到逐帧处理
+        progress_callback: 可选，进度回调 progress_callback(已处理帧数, 总帧数)
+        output: 'video' 输出标注后的视频；'sidecar' 只输出逐帧检测结果文件（见 process_video_headless）
+        sidecar_format: output='sidecar' 时的结果文件格式，'npz' 或 'jsonl'
+        preview_fps: output='sidecar' 时可选的低帧率标注预览视频帧率
+        mode: 检测模式；后台任务应在提交时传入当时的模式，整段视频都按该模式处理，
+              不受之后的模式切换影响。为 None 时使用当前的 system_state.DETECTION_MODE
         
     返回:
         dict: 包含处理结果的字典
     """
+    mode = mode or system_state.DETECTION_MODE
+    if output == 'sidecar' and mode in HEADLESS_MODES:
+        return process_video_headless(filepath, uploads_dir, sidecar_format=sidecar_format,
+                                      preview_fps=preview_fps, progress_callback=progress_callback, mode=mode)
+    if parallel is None:
+        parallel = system_state.VIDEO_PARALLEL_ENABLED
+    if parallel and mode == 'object_detection':
+        from app.services.parallel_video import process_video_parallel
+        return process_video_parallel(filepath, uploads_dir, progress_callback=progress_callback)
+
     # 重置警报
-    reset_alerts()
+    reset_alerts(UPLOAD_STREAM)
     
     # 创建输出视频路径
     output_filename = 'processed_' + os.path.basename(filepath)
@@ -191,36 +413,28 @@ def process_video(filepath, uploads_dir):
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_interval = 1.0 / (fps or 30.0)
     
-    # 创建视频写入器 - 使用H.264编码器替代mp4v
-    try:
-        # 尝试使用H.264编码器
-        fourcc = cv2.VideoWriter_fourcc(*"avc1")
-        out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
-        
-        # 如果H.264编码器不可用，回退到MJPG
-        if not out.isOpened():
-            print("警告: H.264编码器不可用，回退到MJPG")
-            output_path_avi = output_path.replace(".mp4", ".avi")
-            fourcc = cv2.VideoWriter_fourcc(*"MJPG")
-            out = cv2.VideoWriter(output_path_avi, fourcc, fps, (frame_width, frame_height))
-            output_filename = output_filename.replace(".mp4", ".avi")
-    except Exception as e:
-        print(f"视频编码器错误: {e}")
-        # 最后的回退选项 - 使用无损编码
-        fourcc = cv2.VideoWriter_fourcc(*"DIB ")
-        out = cv2.VideoWriter(output_path.replace(".mp4", ".avi"), fourcc, fps, (frame_width, frame_height))
-        output_filename = output_filename.replace(".mp4", ".avi")
+    # 创建视频写入器
+    out, output_filename = create_video_writer(output_path, output_filename, fps, frame_width, frame_height)
     
-    # 初始化此视频处理任务专用的YOLOv8模型
-    # 避免在多个后台任务中共享模型实例及其追踪器状态
-    object_model_local = YOLO(OBJECT_MODEL_PATH)
-    pose_model_local = YOLO(POSE_MODEL_PATH)
-    face_model_local = YOLO(FACE_MODEL_PATH)
+    # 从模型池借出此视频处理任务专用的会话实例
+    # 权重共享，但追踪器状态独立，避免在多个后台任务之间互相干扰
+    session_models = model_pool.acquire_session(('object', 'pose', 'face'))
+    object_model_local = session_models['object']
+    pose_model_local = session_models['pose']
+    face_model_local = session_models['face']
     # smoking_model_local = get_smoking_model() # BUG-FIX: 改为按需加载，避免影响其他功能
     
     # 为本次视频处理创建一个新的人脸识别缓存
-    face_recognition_cache = {}
+    face_recognition_cache = {'stream': UPLOAD_STREAM}
+
+    # 目标检测/跌倒检测模式下同时保存逐帧检测索引，修改危险区域或阈值后可直接重放规则
+    index_writer = create_index_writer(
+        filepath, mode,
+        object_model_local if mode == 'object_detection' else pose_model_local,
+        fps, frame_width, frame_height
+    )
     
     # 处理视频帧
     frame_count = 0
@@ -236,56 +450,56 @@ def process_video(filepath, uploads_dir):
         if frame_count % 10 == 0:  # 每10帧打印一次进度
             progress = (frame_count / total_frames) * 100
             print(f"处理视频: {progress:.1f}% 完成")
+            if progress_callback is not None:
+                progress_callback(frame_count, total_frames)
         
-        # 计算时间差
-        time_diff = update_detection_time()
+        # 按视频时间推进上传流的时钟（每帧 1/fps 秒），停留时间不受处理速度影响
+        time_diff = update_detection_time(UPLOAD_STREAM, frame_interval)
         
         # --- 检测模式处理 ---
         processed_frame = frame.copy() # 复制一份用于处理
 
         # 根据当前模式决定处理方式
-        if system_state.DETECTION_MODE == 'object_detection':
+        if mode == 'object_detection':
             # 执行目标追踪
             results = object_model_local.track(processed_frame, persist=True)
+            if index_writer is not None:
+                index_writer.add(results[0])
+            zone_config = danger_zone_service.get_config()
             
             # --- 绘图顺序调整 ---
             # 1. 首先，绘制危险区域的半透明叠加层作为背景
-            overlay = processed_frame.copy()
-            danger_zone_pts = DANGER_ZONE.reshape((-1, 1, 2))
-            cv2.fillPoly(overlay, [danger_zone_pts], (0, 0, 255))
-            cv2.addWeighted(overlay, 0.4, processed_frame, 0.6, 0, processed_frame)
-            cv2.polylines(processed_frame, [danger_zone_pts], True, (0, 0, 255), 3)
-            
-            # 在危险区域中添加文字
-            danger_zone_center = np.mean(DANGER_ZONE, axis=0, dtype=np.int32)
-            cv2.putText(processed_frame, "Danger Zone", 
-                        (danger_zone_center[0] - 60, danger_zone_center[1]),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 3)
+            draw_danger_zone_overlay(processed_frame, zone_config)
             
             # 2. 然后，在已经有了危险区域的帧上，处理检测结果（绘制追踪框、标签等前景）
-            process_object_detection_results(results, processed_frame, time_diff, frame_count)
+            process_object_detection_results(results, processed_frame, time_diff, frame_count, zone_config,
+                                             stream=UPLOAD_STREAM)
         
-        elif system_state.DETECTION_MODE == 'fall_detection':
+        elif mode == 'fall_detection':
             # 执行姿态估计追踪
             pose_results = pose_model_local.track(processed_frame, persist=True)
-            process_pose_estimation_results(pose_results, processed_frame, time_diff, frame_count)
+            if index_writer is not None:
+                index_writer.add(pose_results[0])
+            process_pose_estimation_results(pose_results, processed_frame, time_diff, frame_count,
+                                            stream=UPLOAD_STREAM)
 
-        elif system_state.DETECTION_MODE == 'face_only':
+        elif mode == 'face_only':
             # 优化：传入人脸识别缓存以保存状态
             # 确保人脸模型被正确地传递给处理函数
             if 'face_model' not in face_recognition_cache:
                 face_recognition_cache['face_model'] = face_model_local
             process_faces_only(processed_frame, frame_count, face_recognition_cache)
         
-        elif system_state.DETECTION_MODE == 'smoking_detection':
+        elif mode == 'smoking_detection':
             # --- FIX: Use the local instances created for this specific video task ---
             face_results = face_model_local.predict(processed_frame, verbose=False)
             person_results = object_model_local.track(processed_frame, persist=True, classes=[0], verbose=False)
             process_smoking_detection_hybrid(
-                processed_frame, person_results, face_results, get_smoking_model()
+                processed_frame, person_results, face_results, get_smoking_model(), stream=UPLOAD_STREAM
             )
         
-        elif system_state.DETECTION_MODE == 'violence_detection':
+        elif mode == 'violence_detection':
+            model_pool.release_session(session_models)
             return process_violence_detection(filepath, uploads_dir)
             
         # 写入处理后的帧到输出视频
@@ -297,14 +511,13 @@ def process_video(filepath, uploads_dir):
             elif processed_frame.shape[2] == 4:  # RGBA图像
                 processed_frame = cv2.cvtColor(processed_frame, cv2.COLOR_RGBA2BGR)
             
-            # 打印帧信息，帮助调试
-            print(f"写入帧: 形状={processed_frame.shape}, 类型={processed_frame.dtype}, 最小值={processed_frame.min()}, 最大值={processed_frame.max()}")
-            
             out.write(processed_frame)
     
     # 释放资源
     cap.release()
     out.release()
+    model_pool.release_session(session_models)
+    commit_index_writer(index_writer)
     
     # 使用相对URL路径
     output_url = f"/api/files/{output_filename}"
@@ -314,11 +527,224 @@ def process_video(filepath, uploads_dir):
         "status": "success",
         "media_type": "video",
         "file_url": output_url,
-        "alerts": get_alerts()
+        "alerts": get_alerts(UPLOAD_STREAM)
     }
 
 
-def process_smoking_detection_hybrid(frame, person_results, face_results, smoking_model):
+# 支持无标注快速路径的检测模式
+HEADLESS_MODES = ('object_detection', 'fall_detection')
+
+
+def process_video_headless(filepath, uploads_dir, sidecar_format='npz', preview_fps=None, progress_callback=None,
+                           mode=None):
+    """
+    无标注快速路径：只做推理与规则判断（告警照常产生），不绘制、不重新编码整段视频，
+    把逐帧的检测/追踪结果写入一个结果文件（sidecar）。
+
+    sidecar 格式:
+        npz:   按列存储，每一行是一个检测框：frame, track_id, cls, conf, x1, y1, x2, y2；
+               跌倒检测模式额外包含 keypoints (N, 17, 2)，另有 fps、total_frames、names 元数据
+        jsonl: 每行一帧 {"frame": i, "time": 秒, "detections": [{"id", "cls", "conf", "box"}]}
+
+    preview_fps: 可选，按该帧率额外输出一个标注预览视频（只有预览帧会被绘制和编码）
+    mode: 检测模式，为 None 时使用当前的 system_state.DETECTION_MODE
+    """
+    reset_alerts(UPLOAD_STREAM)
+    mode = mode or system_state.DETECTION_MODE
+    start_time = time.time()
+
+    cap = cv2.VideoCapture(filepath)
+    if not cap.isOpened():
+        return {"status": "error", "message": "Failed to open video"}, 500
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    model_name = 'object' if mode == 'object_detection' else 'pose'
+    model_local = model_pool.acquire(model_name)
+    zone_config = danger_zone_service.get_config()
+    # 按视频时间累计停留时间
+    time_diff = 1.0 / fps
+    index_writer = create_index_writer(filepath, mode, model_local, fps, frame_width, frame_height)
+
+    # 可选的低帧率预览
+    preview_writer = None
+    preview_filename = None
+    preview_step = 0
+    if preview_fps:
+        preview_step = max(1, int(round(fps / preview_fps)))
+        preview_filename = 'preview_' + os.path.basename(filepath)
+        preview_writer, preview_filename = create_video_writer(
+            os.path.join(uploads_dir, preview_filename), preview_filename,
+            fps / preview_step, frame_width, frame_height
+        )
+
+    base_name = os.path.splitext(os.path.basename(filepath))[0]
+    sidecar_filename = f"detections_{base_name}.{'jsonl' if sidecar_format == 'jsonl' else 'npz'}"
+    sidecar_path = os.path.join(uploads_dir, sidecar_filename)
+
+    columns = {key: [] for key in ('frame', 'track_id', 'cls', 'conf', 'box')}
+    keypoints = []
+    jsonl_file = open(sidecar_path, 'w', encoding='utf-8') if sidecar_format == 'jsonl' else None
+
+    frame_count = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_count += 1
+            # 按视频时间推进上传流的时钟，长视频中已消失的目标会被及时回收
+            update_detection_time(UPLOAD_STREAM, time_diff)
+
+            results = model_local.track(frame, persist=True, verbose=False)
+            if index_writer is not None:
+                index_writer.add(results[0])
+            is_preview = preview_writer is not None and (frame_count - 1) % preview_step == 0
+
+            # 规则判断（告警）每帧都执行，只有预览帧才绘制
+            if mode == 'object_detection':
+                if is_preview:
+                    draw_danger_zone_overlay(frame, zone_config)
+                process_object_detection_results(results, frame, time_diff, frame_count, zone_config,
+                                                 draw=is_preview, stream=UPLOAD_STREAM)
+            else:
+                process_pose_estimation_results(results, frame, time_diff, frame_count, draw=is_preview,
+                                                stream=UPLOAD_STREAM)
+            if is_preview:
+                preview_writer.write(frame)
+
+            boxes = results[0].boxes
+            if boxes is not None and boxes.id is not None and len(boxes):
+                xyxy = boxes.xyxy.cpu().numpy().astype(np.float32)
+                ids = boxes.id.int().cpu().numpy().astype(np.int32)
+                cls = boxes.cls.int().cpu().numpy().astype(np.int16)
+                conf = boxes.conf.cpu().numpy().astype(np.float16)
+                if jsonl_file is not None:
+                    jsonl_file.write(json.dumps({
+                        'frame': frame_count,
+                        'time': round((frame_count - 1) / fps, 3),
+                        'detections': [
+                            {'id': int(i), 'cls': int(c), 'conf': round(float(p), 3),
+                             'box': [round(float(v), 1) for v in b]}
+                            for i, c, p, b in zip(ids, cls, conf, xyxy)
+                        ]
+                    }, ensure_ascii=False) + '\n')
+                else:
+                    columns['frame'].append(np.full(len(ids), frame_count, dtype=np.int32))
+                    columns['track_id'].append(ids)
+                    columns['cls'].append(cls)
+                    columns['conf'].append(conf)
+                    columns['box'].append(xyxy)
+                    if mode == 'fall_detection' and results[0].keypoints is not None:
+                        keypoints.append(results[0].keypoints.xy.cpu().numpy().astype(np.float32))
+
+            if progress_callback is not None and frame_count % 10 == 0:
+                progress_callback(frame_count, total_frames)
+    finally:
+        cap.release()
+        model_pool.release(model_name, model_local)
+        if preview_writer is not None:
+            preview_writer.release()
+        if jsonl_file is not None:
+            jsonl_file.close()
+
+    if sidecar_format != 'jsonl':
+        def _stack(key, dtype, shape):
+            return np.concatenate(columns[key]) if columns[key] else np.zeros(shape, dtype=dtype)
+        arrays = {
+            'frame': _stack('frame', np.int32, (0,)),
+            'track_id': _stack('track_id', np.int32, (0,)),
+            'cls': _stack('cls', np.int16, (0,)),
+            'conf': _stack('conf', np.float16, (0,)),
+            'box': _stack('box', np.float32, (0, 4)),
+            'fps': np.float32(fps),
+            'total_frames': np.int32(frame_count),
+            'names': np.array([model_local.names[i] for i in sorted(model_local.names)]),
+        }
+        if keypoints:
+            arrays['keypoints'] = np.concatenate(keypoints)
+        np.savez_compressed(sidecar_path, **arrays)
+    commit_index_writer(index_writer)
+
+    elapsed = time.time() - start_time
+    print(f"无标注处理完成: {frame_count} 帧，耗时 {elapsed:.1f}s ({frame_count / max(elapsed, 1e-6):.1f} fps)")
+    return {
+        "status": "success",
+        "media_type": "detections",
+        "sidecar_url": f"/api/files/{sidecar_filename}",
+        "sidecar_format": 'jsonl' if sidecar_format == 'jsonl' else 'npz',
+        "file_url": f"/api/files/{preview_filename}" if preview_filename else None,
+        "frames": frame_count,
+        "elapsed_seconds": round(elapsed, 2),
+        "alerts": get_alerts(UPLOAD_STREAM)
+    }
+
+
+def reevaluate_video(filepath, mode=None, zone_config=None, progress_callback=None):
+    """
+    用已保存的检测索引重放规则判断（危险区域、徘徊、靠近、跌倒），不重新运行模型推理。
+
+    参数:
+        filepath: 已处理过的视频文件路径
+        mode: 检测模式，默认使用当前模式；仅支持 INDEX_MODELS 中的模式
+        zone_config: 危险区域配置快照，默认使用当前生效的版本（可传入临时快照试算而不保存）
+        progress_callback: 可选，进度回调 progress_callback(已重放帧数, 总帧数)
+
+    返回:
+        dict: status、alerts 以及重放的帧数与耗时；索引不存在时返回 (dict, 404)
+    """
+    from ultralytics.engine.results import Results
+    import torch
+
+    mode = mode or system_state.DETECTION_MODE
+    if mode not in INDEX_MODELS:
+        return {"status": "error", "message": f"检测模式 {mode} 不支持重放"}, 400
+    kind, model_path = INDEX_MODELS[mode]
+    index = detection_index.open_index(filepath, kind, model_path)
+    if index is None:
+        return {"status": "error", "message": "该视频没有当前模型版本的检测索引，请先上传处理"}, 404
+
+    reset_alerts(UPLOAD_STREAM)
+    start_time = time.time()
+    zone_config = zone_config or danger_zone_service.get_config()
+    time_diff = 1.0 / (index.fps or 30.0)
+    names = index.names
+    # Results 只用到原图尺寸，用零步长的只读视图代替真实帧，不占内存
+    blank = np.broadcast_to(np.zeros(1, dtype=np.uint8), index.shape + (3,))
+    total_frames = len(index)
+
+    for i in range(total_frames):
+        update_detection_time(UPLOAD_STREAM, time_diff)
+        rows, keypoints = index.frame(i)
+        if len(rows) and (mode == 'object_detection' or keypoints is not None):
+            result = Results(orig_img=blank, path=filepath, names=names, boxes=torch.as_tensor(rows),
+                             keypoints=torch.as_tensor(keypoints) if keypoints is not None else None)
+            if mode == 'object_detection':
+                process_object_detection_results([result], None, time_diff, i + 1, zone_config,
+                                                 draw=False, stream=UPLOAD_STREAM)
+            else:
+                process_pose_estimation_results([result], None, time_diff, i + 1, draw=False,
+                                                stream=UPLOAD_STREAM)
+        if progress_callback is not None and (i + 1) % 100 == 0:
+            progress_callback(i + 1, total_frames)
+
+    elapsed = time.time() - start_time
+    print(f"规则重放完成: {total_frames} 帧，耗时 {elapsed:.2f}s")
+    return {
+        "status": "success",
+        "media_type": "alerts",
+        "mode": mode,
+        "zone_version": zone_config.version,
+        "model_version": index.meta.get('model_version'),
+        "frames": total_frames,
+        "elapsed_seconds": round(elapsed, 3),
+        "alerts": get_alerts(UPLOAD_STREAM)
+    }
+
+
+def process_smoking_detection_hybrid(frame, person_results, face_results, smoking_model, stream='camera'):
     """
     Refactored hybrid detection to avoid tracker state conflicts.
     This function now receives pre-computed detection results.
@@ -351,7 +777,7 @@ def process_smoking_detection_hybrid(frame, person_results, face_results, smokin
 
                 smoking_results = smoking_model.predict(roi_crop, imgsz=640, verbose=False)
                 if len(smoking_results[0].boxes) > 0:
-                    add_alert("Smoking Detected (High-Confidence)")
+                    add_alert("Smoking Detected (High-Confidence)", event_type="smoking_detection", stream=stream)
                     for s_box in smoking_results[0].boxes:
                         s_xyxy = s_box.xyxy.cpu().numpy().astype(int)[0]
                         abs_x1, abs_y1 = s_xyxy[0] + roi_x1, s_xyxy[1] + roi_y1
@@ -374,7 +800,7 @@ def process_smoking_detection_hybrid(frame, person_results, face_results, smokin
 
         smoking_results = smoking_model.predict(upper_body_crop, imgsz=1024, verbose=False)
         if len(smoking_results[0].boxes) > 0:
-            add_alert("Smoking Detected (Low-Confidence/Distant)")
+            add_alert("Smoking Detected (Low-Confidence/Distant)", event_type="smoking_detection", stream=stream)
             for s_box in smoking_results[0].boxes:
                 s_xyxy = s_box.xyxy.cpu().numpy().astype(int)[0]
                 abs_x1, abs_y1 = s_xyxy[0] + px1, s_xyxy[1] + py1
@@ -385,11 +811,18 @@ def process_smoking_detection_hybrid(frame, person_results, face_results, smokin
     return frame
 
 
-def process_object_detection_results(results, frame, time_diff, frame_count):
+def process_object_detection_results(results, frame, time_diff, frame_count, zone_config=None, draw=True,
+                                     stream='camera'):
     """
     处理通用目标检测结果（危险区域、徘徊等）
     (这是您之前的 process_detection_results 函数，已重命名并保留)
+
+    zone_config: 危险区域配置快照，默认使用当前生效的版本
+    draw: 为 False 时只执行规则判断与告警，不在画面上绘制（frame 可以为 None）
+    stream: 流标识，决定使用哪一组命名区域（未单独配置时为全局默认区域）
     """
+    if zone_config is None:
+        zone_config = danger_zone_service.get_config()
     # 如果有追踪结果，在画面上显示追踪ID和危险区域告警
     if hasattr(results[0], 'boxes') and hasattr(results[0].boxes, 'id') and results[0].boxes.id is not None:
         boxes = results[0].boxes.xyxy.cpu().numpy()
@@ -398,8 +831,14 @@ def process_object_detection_results(results, frame, time_diff, frame_count):
         
         # 获取类别名称
         class_names = results[0].names
+
+        # 一次批量查询所有目标底部中心点与该流各区域的关系：
+        # 网格预筛选出候选区域，再按该分辨率缓存的栅格查表
+        foot_points = np.stack([((boxes[:, 0] + boxes[:, 2]) / 2).astype(int), boxes[:, 3].astype(int)], axis=1)
+        zone_set = zone_config.zone_set(stream)
+        hits_by_target = zone_set.query(foot_points, results[0].orig_shape).by_point(len(foot_points))
         
-        for box, id, cls in zip(boxes, ids, classes):
+        for index, (box, id, cls) in enumerate(zip(boxes, ids, classes)):
             x1, y1, x2, y2 = box
             class_name = class_names[int(cls)]
             
@@ -408,64 +847,58 @@ def process_object_detection_results(results, frame, time_diff, frame_count):
             # 在目标检测模式下，我们不再进行人脸识别，直接使用类别名
             display_name = class_name
             
-            # 计算目标的底部中心点
-            foot_point = (int((x1 + x2) / 2), int(y2))
+            # 目标的底部中心点
+            foot_point = (int(foot_points[index, 0]), int(foot_points[index, 1]))
             
-            # 检查是否在危险区域内
-            in_danger_zone = point_in_polygon(foot_point, DANGER_ZONE)
-            
-            # 计算到危险区域的距离
-            distance = distance_to_polygon(foot_point, DANGER_ZONE)
+            # 更新各区域内的停留时间（离开的区域自动重置），得到画面展示用的区域及超过阈值的告警事件
+            zone, in_danger_zone, distance, loitering_time, events = evaluate_target_zones(
+                id, hits_by_target[index], time_diff, stream
+            )
+            zone = zone or zone_set.zones[0]
+            for event, event_zone, value in events:
+                if event == 'intrusion':
+                    add_alert(f"ID:{id} ({display_name}) staying in danger zone{_zone_suffix(event_zone)} for {value:.1f}s",
+                              event_type="danger_zone_intrusion", stream=stream, track_id=int(id), zone=event_zone.name)
+                else:
+                    add_alert(f"ID:{id} ({display_name}) too close to danger zone{_zone_suffix(event_zone)} ({value:.1f}px)",
+                              event_type="proximity_warning", stream=stream, track_id=int(id), zone=event_zone.name)
             
-            # 确定标签颜色和告警状态
+            # 确定标签颜色
             label_color = (0, 255, 0)  # 默认绿色
-            alert_status = None
-            
-            # 如果在危险区域内，更新停留时间
             if in_danger_zone:
-                loitering_time = update_loitering_time(id, time_diff)
-                
-                # 如果停留时间超过阈值，标记为红色并记录告警
-                if loitering_time >= LOITERING_THRESHOLD:
-                    # 使用纯红色
+                if loitering_time >= zone.loitering_threshold:
+                    # 停留时间超过阈值，使用纯红色
                     label_color = (0, 0, 255)  # BGR格式：红色
-                    alert_status = f"ID:{id} ({display_name}) staying in danger zone for {loitering_time:.1f}s"
-                    add_alert(alert_status)
                 else:
                     # 根据停留时间从橙色到红色渐变
-                    ratio = min(1.0, loitering_time / LOITERING_THRESHOLD)
+                    ratio = min(1.0, loitering_time / zone.loitering_threshold)
                     # 从橙色(0,165,255)到红色(0,0,255)
                     label_color = (0, int(165 * (1 - ratio)), 255)
-            else:
-                # 如果不在区域内，重置停留时间
-                reset_loitering_time(id)
-
-                # 如果距离小于安全距离，根据距离设置颜色从绿色到黄色
-                if distance < SAFETY_DISTANCE:
-                    # 计算距离比例
-                    ratio = distance / SAFETY_DISTANCE
-                    # 从黄色(0,255,255)到绿色(0,255,0)渐变
-                    label_color = (0, 255, int(255 * (1 - ratio)))
-                    
-                    alert_status = f"ID:{id} ({display_name}) too close to danger zone ({distance:.1f}px)"
-                    add_alert(alert_status)
+            elif distance < zone.safety_distance:
+                # 距离小于安全距离，根据距离设置颜色从绿色到黄色
+                ratio = distance / zone.safety_distance
+                # 从黄色(0,255,255)到绿色(0,255,0)渐变
+                label_color = (0, 255, int(255 * (1 - ratio)))
+            
+            if not draw:
+                continue
             
             # 在每个目标上方显示ID和类别
             label = f"ID:{id} {display_name}"
 
             if in_danger_zone:
-                label += f" time:{get_loitering_time(id):.1f}s"
-            elif distance < SAFETY_DISTANCE:
+                label += f" time:{loitering_time:.1f}s"
+            elif distance < zone.safety_distance:
                 label += f" dist:{distance:.1f}px"
             
             # 根据危险程度调整边框粗细
             thickness = 2  # 默认粗细
             if in_danger_zone:
                 # 在危险区域内，根据停留时间增加边框粗细
-                thickness = max(2, int(4 * min(1.0, get_loitering_time(id) / LOITERING_THRESHOLD)))
+                thickness = max(2, int(4 * min(1.0, loitering_time / zone.loitering_threshold)))
                 
                 # 如果停留时间超过阈值，添加警告标记
-                if get_loitering_time(id) >= LOITERING_THRESHOLD:
+                if loitering_time >= zone.loitering_threshold:
                     # 在目标上方绘制警告三角形
                     triangle_height = 20
                     triangle_base = 20
@@ -485,9 +918,9 @@ def process_object_detection_results(results, frame, time_diff, frame_count):
                     cv2.putText(frame, "!", 
                                 (triangle_center_x - 3, triangle_top_y + triangle_height - 5), 
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            elif distance < SAFETY_DISTANCE:
+            elif distance < zone.safety_distance:
                 # 不在危险区域但接近时，根据距离增加边框粗细
-                thickness = max(1, int(3 * (1 - distance / SAFETY_DISTANCE)))
+                thickness = max(1, int(3 * (1 - distance / zone.safety_distance)))
             
             # 绘制边框
             cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), label_color, thickness)
@@ -501,289 +934,188 @@ def process_object_detection_results(results, frame, time_diff, frame_count):
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
             
             # 在目标底部位置画一个点
-            foot_point = (int((x1 + x2) / 2), int(y2))
             cv2.circle(frame, foot_point, 5, label_color, -1)
             
             # 如果不在危险区域内但距离小于安全距离的2倍，绘制到危险区域的连接线
-            if not in_danger_zone and distance < SAFETY_DISTANCE * 2:
-                draw_distance_line(frame, foot_point, distance)
+            if not in_danger_zone and distance < zone.safety_distance * 2:
+                draw_distance_line(frame, foot_point, distance, zone)
+
+
+def _zone_suffix(zone):
+    """告警文字中的区域名称；全局默认区域不加名称，保持原有告警文字不变"""
+    return '' if zone.name == danger_zone_service.DEFAULT_ZONE_NAME else f" '{zone.name}'"
+
 
-def process_pose_estimation_results(results, frame, time_diff, frame_count):
+def process_pose_estimation_results(results, frame, time_diff, frame_count, draw=True, stream='camera'):
     """
     处理姿态估计结果，进行跌倒检测
+    draw: 为 False 时只执行跌倒判断与告警，不在画面上绘制（frame 可以为 None）
+    stream: 目标所属的流，姿态历史按流分别保存
     """
     # 如果有追踪结果，则进行跌倒检测
     if hasattr(results[0], 'boxes') and hasattr(results[0].boxes, 'id') and results[0].boxes.id is not None:
         boxes = results[0].boxes.xyxy.cpu().numpy()
         ids = results[0].boxes.id.int().cpu().numpy()
-        keypoints = results[0].keypoints.xy.cpu().numpy()  # 获取关键点
+        keypoints = results[0].keypoints.xy.cpu().numpy()  # 获取关键点 (N, 17, 2)
 
         # 首先，让YOLOv8的plot函数绘制基本的骨架和边界框
-        frame[:] = results[0].plot()
-
-        for person_id, box, kps in zip(ids, boxes, keypoints):
-            # --- 跌倒检测逻辑 ---
-            velocity_y = 0
-            angle = 90 # 默认为垂直
-
-            # 1. 计算人体中心点（质心）
-            visible_kps = kps[kps[:, 1] > 0] 
-            if len(visible_kps) > 4:
-                centroid_y = np.mean(visible_kps[:, 1])
-
-                # 2. 更新历史记录并计算垂直速度
-                if person_id in pose_history:
-                    prev_centroid_y, _ = pose_history[person_id][-1]
-                    velocity_y = centroid_y - prev_centroid_y
-                    
-                    pose_history[person_id].append((centroid_y, velocity_y))
-                    if len(pose_history[person_id]) > 30:
-                        pose_history[person_id].pop(0)
-
-                    # 3. 判断是否快速下坠 (速度为正表示向下,因为图像坐标系Y轴向下)
-                    if velocity_y > 15: # 阈值需要调试
-                        
-                        # 4. 确认跌倒状态: 检查身体主干角度
-                        left_shoulder, right_shoulder = kps[5], kps[6]
-                        left_hip, right_hip = kps[11], kps[12]
-
-                        # 确保关键点都可见
-                        if left_shoulder[1] > 0 and right_shoulder[1] > 0 and left_hip[1] > 0 and right_hip[1] > 0:
-                            shoulder_center = (left_shoulder + right_shoulder) / 2
-                            hip_center = (left_hip + right_hip) / 2
-                            body_vector = hip_center - shoulder_center
-                            
-                            # 避免除以零的错误
-                            if body_vector[0] != 0:
-                                # 计算身体与水平线的夹角
-                                angle = np.degrees(np.arctan(abs(body_vector[1] / body_vector[0])))
-                                
-                                # 角度小于45度，意味着身体更趋向于水平
-                                if angle < 45: 
-                                    alert_message = f"警告: 人员 {person_id} 可能已跌倒!"
-                                    add_alert(alert_message) # 修正：只传递一个参数
-                                    # 在人的边界框上方用红色字体标注
-                                    cv2.putText(frame, f"FALL DETECTED: ID {person_id}", 
-                                                (int(box[0]), int(box[1] - 10)),
-                                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-                else:
-                    # 初始化这个人的姿态历史记录
-                    pose_history[person_id] = [(centroid_y, 0)]
+        if draw:
+            frame[:] = results[0].plot()
+
+        # --- 跌倒检测逻辑（所有人一次向量化计算） ---
+        # 1. 计算人体中心点（质心）：可见关键点超过4个时取其Y坐标均值，否则本帧不记录
+        visible = keypoints[:, :, 1] > 0
+        visible_count = visible.sum(axis=1)
+        centroid_y = np.where(visible, keypoints[:, :, 1], 0).sum(axis=1) / np.maximum(visible_count, 1)
+        centroid_y[visible_count <= 4] = np.nan
+
+        # 2. 写入本流的环形历史缓冲区，得到相对上一次记录的垂直速度
+        table = track_state.get_table(stream)
+        velocity_y, has_previous = table.pose.update(ids, centroid_y, table.now)
+
+        # 3. 快速下坠（速度为正表示向下,因为图像坐标系Y轴向下）且肩、髋关键点都可见时，检查身体主干角度
+        torso = keypoints[:, [5, 6, 11, 12]]
+        body_vector = (torso[:, 2] + torso[:, 3]) / 2 - (torso[:, 0] + torso[:, 1]) / 2
+        check = (has_previous & (velocity_y > FALL_VELOCITY_THRESHOLD)
+                 & (torso[:, :, 1] > 0).all(axis=1) & (body_vector[:, 0] != 0))  # 避免除以零的错误
+        angle = np.full(len(ids), 90.0)  # 默认为垂直
+        angle[check] = np.degrees(np.arctan(np.abs(body_vector[check, 1] / body_vector[check, 0])))
+
+        # 4. 角度小于45度，意味着身体更趋向于水平
+        fallen = check & (angle < FALL_ANGLE_THRESHOLD)
+
+        for person_id, box, velocity, person_angle, is_fallen in zip(ids, boxes, velocity_y, angle, fallen):
+            if is_fallen:
+                alert_message = f"警告: 人员 {person_id} 可能已跌倒!"
+                add_alert(alert_message, event_type="fall_detection", stream=stream, track_id=int(person_id))
+                # 在人的边界框上方用红色字体标注
+                if draw:
+                    cv2.putText(frame, f"FALL DETECTED: ID {person_id}", 
+                                (int(box[0]), int(box[1] - 10)),
+                                cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
 
             # --- 在画面上显示调试信息 ---
-            debug_text = f"ID:{person_id} V:{velocity_y:.1f} A:{angle:.1f}"
-            cv2.putText(frame, debug_text,
-                        (int(box[0]), int(box[1] - 35)), # 显示在FALL DETECTED文字的上方
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+            if draw:
+                debug_text = f"ID:{person_id} V:{velocity:.1f} A:{person_angle:.1f}"
+                cv2.putText(frame, debug_text,
+                            (int(box[0]), int(box[1] - 35)), # 显示在FALL DETECTED文字的上方
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
 
 
 # 为了保持兼容，我们将旧的函数重命名
 process_detection_results = process_object_detection_results
 
 
-# --- 新的、带结果黏滞和多线程优化的高频人脸识别逻辑 ---
+# --- 绑定追踪ID的人脸身份缓存 ---
+
+# 未知人脸的初始置信度，较低以便在较少帧后重新尝试识别
+FACE_UNKNOWN_CONFIDENCE = 0.6
+
+
+def _identity_confidence(name, distance):
+    """由匹配距离估计身份置信度：已知人脸距离越小越高（0.5~1），未知人脸为固定的较低值"""
+    if name == "Unknown":
+        return FACE_UNKNOWN_CONFIDENCE
+    return float(np.clip(1.0 - 0.5 * distance / RECOGNITION_THRESHOLD, 0.5, 1.0))
+
 
 def process_faces_only(frame, frame_count, state):
     """
     只进行人脸检测和识别的处理。
     使用 YOLOv8 进行检测，使用 Dlib 进行识别。
     这个函数现在直接在传入的 frame 上绘图，不再返回新的 frame。
-<<<<<<< HEAD
-    
-    优化点：
-    1. 每N帧才运行一次完整识别
-    2. 结果缓存，减少不必要的重复识别
-    3. 检测区域缩放以提高性能
-    """
-    # 添加识别结果缓存到状态
-    if 'recognized_faces' not in state:
-        state['recognized_faces'] = {}
-    if 'last_full_recognition_frame' not in state:
-        state['last_full_recognition_frame'] = 0
-    
-    # 获取本地人脸模型
-
-    global unknown_faces_tracking
-=======
->>>>>>> parent of 643c11e (Revert "update")
     
     优化点：
-    1. 每N帧才运行一次完整识别
-    2. 结果缓存，减少不必要的重复识别
+    1. 视频流中人脸检测使用追踪模式，识别结果绑定到追踪ID（state['identities']）
+    2. 只对新出现的、置信度衰减过低的或到达刷新间隔的人脸重新提取 dlib 特征，其余沿用缓存
     3. 检测区域缩放以提高性能
     """
-    # 添加识别结果缓存到状态
-    if 'recognized_faces' not in state:
-        state['recognized_faces'] = {}
-    if 'last_full_recognition_frame' not in state:
-        state['last_full_recognition_frame'] = 0
-    
     # 获取本地人脸模型
     face_model_local = state.get('face_model')
     if face_model_local is None:
-        face_model_local = YOLO(FACE_MODEL_PATH)
+        face_model_local = model_pool.acquire('face')
         state['face_model'] = face_model_local
+    stream = state.get('stream', 'camera')
     
     # 1. 处理缩放的图像进行检测（提高性能）
     # 仅对于实时视频流进行优化，静态图像保持原样
     frame_height, frame_width = frame.shape[:2]
     scaled_frame = frame
     scale_factor = 1.0
+    is_video = frame_count > 1  # frame_count > 1 表示是视频流
     
     # 对于高分辨率图像，进行缩放处理
-    if frame_width > 640 and frame_count > 1:  # frame_count > 1 表示是视频流
+    if frame_width > 640 and is_video:
         scale_factor = 640 / frame_width
         scaled_width = 640
         scaled_height = int(frame_height * scale_factor)
         scaled_frame = cv2.resize(frame, (scaled_width, scaled_height))
     
-    # 2. 确定是否执行完整识别
-    # 优化策略：静态图像执行完整识别，视频流每5帧执行一次
-    do_full_recognition = False
-    
-    if frame_count <= 1:  # 静态图像
-        do_full_recognition = True
-    elif frame_count - state['last_full_recognition_frame'] >= 5:  # 每5帧执行一次
-        do_full_recognition = True
-        state['last_full_recognition_frame'] = frame_count
-    
     # --- 性能诊断：步骤1 ---
     t0 = time.time()
-<<<<<<< HEAD
-    
-    # 3. 执行人脸检测
-    face_results = face_model_local.predict(scaled_frame, verbose=False)
-    boxes = [box.xyxy[0].tolist() for box in face_results[0].boxes]  # 获取所有检测框
-    
-    # 如果没有检测到人脸，清空陌生人跟踪记录并直接返回
-    if not boxes:
-        unknown_faces_tracking = {}
-        return
-    
-    t1 = time.time()
-    
-    # 4. 将缩放坐标转回原始坐标
-    if scale_factor != 1.0:
-        boxes = [[b[0]/scale_factor, b[1]/scale_factor, 
-                 b[2]/scale_factor, b[3]/scale_factor] for b in boxes]
-    
-    # 5. 根据策略决定是完整识别还是使用缓存
-    recognized_faces = []
     
-    if do_full_recognition:
-        # --- 性能诊断：步骤2 ---
-        t2 = time.time()
-        
-        # 执行完整的人脸识别
-        recognized_faces = dlib_face_service.identify_faces(frame, boxes)
-        
-        # 更新缓存
-        for name, box in recognized_faces:
-            box_key = f"{int(box[0])},{int(box[1])},{int(box[2])},{int(box[3])}"
-            state['recognized_faces'][box_key] = name
-            
-        t3 = time.time()
-        # --- 打印诊断日志 ---
-        print(f"DIAGNOSTICS - YOLO Detection: {t1-t0:.4f}s, Dlib Recognition: {t3-t2:.4f}s")
+    # 2. 执行人脸检测：视频流使用追踪模式，为每张人脸分配稳定的追踪ID
+    if is_video:
+        face_results = face_model_local.track(scaled_frame, persist=True, verbose=False)
     else:
-        # 使用缓存结果+框位置匹配
-        for box in boxes:
-            # 找到最接近的缓存框
-            closest_match = None
-            min_distance = float('inf')
-            
-            for cached_box_str, cached_name in state['recognized_faces'].items():
-                cached_coords = [int(c) for c in cached_box_str.split(',')]
-                
-                # 计算框中心点距离
-                current_center = ((box[0] + box[2])/2, (box[1] + box[3])/2)
-                cached_center = ((cached_coords[0] + cached_coords[2])/2, 
-                                (cached_coords[1] + cached_coords[3])/2)
-                
-                distance = ((current_center[0] - cached_center[0])**2 + 
-                           (current_center[1] - cached_center[1])**2)**0.5
-                
-                if distance < min_distance and distance < 50:  # 50像素阈值
-                    min_distance = distance
-                    closest_match = cached_name
-            
-            if closest_match:
-                recognized_faces.append((closest_match, box))
-            else:
-                recognized_faces.append(("Unknown", box))
-    
-    # 6. 在帧上绘制结果
-    # 当前时间
-    current_time = time.time()
-    
-    # 创建当前帧检测到的陌生人列表，用于更新跟踪状态
-    current_unknown_faces = []
-    
-    # 3. 在帧上绘制结果
-=======
+        face_results = face_model_local.predict(scaled_frame, verbose=False)
+    detected = face_results[0].boxes
+    boxes = detected.xyxy.tolist() if detected is not None else []  # 获取所有检测框
+    if detected is not None and detected.id is not None:
+        track_ids = detected.id.int().tolist()
+    else:
+        track_ids = [None] * len(boxes)
     
-    # 3. 执行人脸检测
-    face_results = face_model_local.predict(scaled_frame, verbose=False)
-    boxes = [box.xyxy[0].tolist() for box in face_results[0].boxes]  # 获取所有检测框
+    t1 = time.time()
+    metrics.observe('model:face', t1 - t0, stream, 'face_only')
+
+    identities = state.get('identities')
+    if identities is None:
+        identities = state['identities'] = track_state.IdentityCache()
+    identities.evict(frame_count)
     
     # 如果没有检测到人脸，直接返回
     if not boxes:
         return
     
-    t1 = time.time()
-    
-    # 4. 将缩放坐标转回原始坐标
+    # 3. 将缩放坐标转回原始坐标
     if scale_factor != 1.0:
         boxes = [[b[0]/scale_factor, b[1]/scale_factor, 
                  b[2]/scale_factor, b[3]/scale_factor] for b in boxes]
     
-    # 5. 根据策略决定是完整识别还是使用缓存
-    recognized_faces = []
-    
-    if do_full_recognition:
+    # 4. 只为需要的人脸重新识别，其余沿用绑定在追踪ID上的身份
+    pending = identities.due(track_ids, frame_count) if is_video else list(range(len(boxes)))
+    names = [None] * len(boxes)
+    if pending:
         # --- 性能诊断：步骤2 ---
         t2 = time.time()
-        
-        # 执行完整的人脸识别
-        recognized_faces = dlib_face_service.identify_faces(frame, boxes)
-        
-        # 更新缓存
-        for name, box in recognized_faces:
-            box_key = f"{int(box[0])},{int(box[1])},{int(box[2])},{int(box[3])}"
-            state['recognized_faces'][box_key] = name
-            
+        pending_boxes = [boxes[i] for i in pending]
+        recognized = True
+        if len(dlib_face_service.index) > 0:
+            try:
+                features = dlib_face_service.compute_descriptors(frame, pending_boxes)
+                pending_names, distances = dlib_face_service.match_descriptors(features)
+            except Exception as e:
+                # 与 identify_faces 一致：识别出错时本帧按 Unknown 显示，不中断视频流；
+                # 也不写入身份缓存，下一帧重新识别
+                print(f"人脸识别出错: {e}")
+                recognized = False
+                pending_names, distances = ["Unknown"] * len(pending), np.full(len(pending), np.inf)
+        else:
+            pending_names, distances = ["Unknown"] * len(pending), np.full(len(pending), np.inf)
+        for i, name, distance in zip(pending, pending_names, distances.tolist()):
+            names[i] = name
+            if recognized:
+                identities.update(track_ids[i], name, distance, _identity_confidence(name, distance), frame_count)
         t3 = time.time()
-        # --- 打印诊断日志 ---
-        print(f"DIAGNOSTICS - YOLO Detection: {t1-t0:.4f}s, Dlib Recognition: {t3-t2:.4f}s")
-    else:
-        # 使用缓存结果+框位置匹配
-        for box in boxes:
-            # 找到最接近的缓存框
-            closest_match = None
-            min_distance = float('inf')
-            
-            for cached_box_str, cached_name in state['recognized_faces'].items():
-                cached_coords = [int(c) for c in cached_box_str.split(',')]
-                
-                # 计算框中心点距离
-                current_center = ((box[0] + box[2])/2, (box[1] + box[3])/2)
-                cached_center = ((cached_coords[0] + cached_coords[2])/2, 
-                                (cached_coords[1] + cached_coords[3])/2)
-                
-                distance = ((current_center[0] - cached_center[0])**2 + 
-                           (current_center[1] - cached_center[1])**2)**0.5
-                
-                if distance < min_distance and distance < 50:  # 50像素阈值
-                    min_distance = distance
-                    closest_match = cached_name
-            
-            if closest_match:
-                recognized_faces.append((closest_match, box))
-            else:
-                recognized_faces.append(("Unknown", box))
+        # --- 记录识别阶段耗时 ---
+        metrics.observe('recognition:dlib', t3 - t2, stream, 'face_only')
+    for i, track_id in enumerate(track_ids):
+        if names[i] is None:
+            names[i] = identities.get(track_id).name
+    recognized_faces = list(zip(names, boxes))
     
-    # 6. 在帧上绘制结果
->>>>>>> parent of 643c11e (Revert "update")
+    # 5. 在帧上绘制结果
     for name, box in recognized_faces:
         # 双重保险：再次确保坐标是整数
         left, top, right, bottom = [int(p) for p in box]
@@ -793,10 +1125,6 @@ def process_faces_only(frame, frame_count, state):
         face_size = max(right - left, bottom - top)
         thickness = 2 if face_size > 100 else 1
                 
-        # 减少绘图操作：对小人脸使用更细的线条
-        face_size = max(right - left, bottom - top)
-        thickness = 2 if face_size > 100 else 1
-                
         # 绘制边界框
         cv2.rectangle(frame, (left, top), (right, bottom), color, thickness)
         
@@ -828,29 +1156,12 @@ def process_faces_only(frame, frame_count, state):
             # 对于极小人脸，只在上方显示简单文字，不加背景
             cv2.putText(frame, label, (left, top - 5), 
                        cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
-<<<<<<< HEAD
-
-            # 空间充足，放在外部
-            cv2.rectangle(frame, (left, top - label_bg_height), (left + label_width + 4, top), color, -1)
-            cv2.putText(frame, label, (left + 2, top - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-    
-    # 清理不再出现的陌生人记录（超过5秒未见）
-    faces_to_remove = []
-    for face_id in unknown_faces_tracking:
-        if face_id not in current_unknown_faces:
-            if current_time - unknown_faces_tracking[face_id]['last_seen'] > 5.0:
-                faces_to_remove.append(face_id)
-    
-    for face_id in faces_to_remove:
-        del unknown_faces_tracking[face_id]
-=======
->>>>>>> parent of 643c11e (Revert "update")
     
     # 不再返回 frame，因为是直接在原图上修改
     # return frame
 
 
-def draw_distance_line(frame, foot_point, distance):
+def draw_distance_line(frame, foot_point, distance, zone_config=None, nearest_point=None):
     """
     绘制从目标到危险区域的连接线
     
@@ -858,41 +1169,24 @@ def draw_distance_line(frame, foot_point, distance):
         frame: 当前视频帧
         foot_point: 目标的底部中心点
         distance: 目标到危险区域的距离
+        zone_config: 危险区域配置快照或单个命名区域 Zone (可选，需提供 geometry 与 safety_distance)
+        nearest_point: 危险区域边缘上的最近点 (可选，未提供时现场计算)
     """
+    if zone_config is None:
+        zone_config = danger_zone_service.get_config()
     # 找到危险区域上最近的点
-    min_dist = float('inf')
-    closest_point = None
-    for i in range(len(DANGER_ZONE)):
-        p1 = DANGER_ZONE[i]
-        p2 = DANGER_ZONE[(i + 1) % len(DANGER_ZONE)]
-        
-        # 计算点到线段的最近点
-        line_vec = p2 - p1
-        line_len = np.linalg.norm(line_vec)
-        line_unitvec = line_vec / line_len
-        
-        pt_vec = np.array(foot_point) - p1
-        proj_len = np.dot(pt_vec, line_unitvec)
-        
-        if proj_len < 0:
-            closest_pt = p1
-        elif proj_len > line_len:
-            closest_pt = p2
-        else:
-            closest_pt = p1 + line_unitvec * proj_len
-        
-        d = np.linalg.norm(np.array(foot_point) - closest_pt)
-        if d < min_dist:
-            min_dist = d
-            closest_point = tuple(map(int, closest_pt))
+    if nearest_point is None:
+        _, nearest_points = zone_config.geometry.nearest([foot_point])
+        nearest_point = nearest_points[0]
+    closest_point = tuple(map(int, nearest_point)) if np.all(np.isfinite(nearest_point)) else None
     
     # 绘制从目标到危险区域的连接线，颜色根据距离变化
     if closest_point:
         # 根据距离调整线条粗细和样式
-        line_thickness = max(1, int(3 * (1 - distance / (SAFETY_DISTANCE * 2))))
+        line_thickness = max(1, int(3 * (1 - distance / (zone_config.safety_distance * 2))))
         
         # 绘制主线
-        label_color = (0, 255, int(255 * (1 - distance / SAFETY_DISTANCE))) if distance < SAFETY_DISTANCE else (0, 255, 0)
+        label_color = (0, 255, int(255 * (1 - distance / zone_config.safety_distance))) if distance < zone_config.safety_distance else (0, 255, 0)
         cv2.line(frame, foot_point, closest_point, label_color, line_thickness)
         
         # 在线上显示距离数字
@@ -903,7 +1197,7 @@ def draw_distance_line(frame, foot_point, distance):
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, label_color, 1)
         
         # 如果距离小于安全距离，添加虚线效果
-        if distance < SAFETY_DISTANCE:
+        if distance < zone_config.safety_distance:
             # 计算线段长度
             line_length = np.linalg.norm(np.array(foot_point) - np.array(closest_point))
             # 计算单位向量
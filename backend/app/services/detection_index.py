@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+# 索引存放目录：backend/uploads/index/<文件哈希>_<模型类型>_<模型版本>/
+INDEX_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'uploads', 'index')
+INDEX_FORMAT_VERSION = 1
+# 追踪结果每行: x1, y1, x2, y2, track_id, conf, cls（与 ultralytics boxes.data 一致）
+ROW_WIDTH = 7
+
+_digest_cache = {}
+_digest_lock = threading.Lock()
+
+
+def _sha256_file(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_digest(path):
+    """文件内容哈希；按 (路径, 大小, mtime) 缓存，同一文件不会重复计算"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+    with _digest_lock:
+        digest = _digest_cache.get(key)
+    if digest is None:
+        digest = _sha256_file(path)
+        with _digest_lock:
+            _digest_cache[key] = digest
+    return digest
+
+
+def model_version(model_path):
+    """模型版本 = 权重文件名 + 权重内容哈希前缀，换了权重文件索引自动失效"""
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    try:
+        return f"{name}-{file_digest(model_path)[:12]}"
+    except OSError:
+        return name
+
+
+def index_key(video_digest, kind, version):
+    return f"{video_digest[:32]}_{kind}_{version}"
+
+
+class DetectionIndex:
+    """
+    一个视频的逐帧检测/追踪结果索引（只读）。
+
+    目录结构:
+        meta.json      fps、帧数、分辨率、类别名、源文件名等
+        offsets.npy    (帧数 + 1,) int64，第 i 帧的结果为 rows[offsets[i]:offsets[i + 1]]
+        rows.npy       (N, 7) float32，x1, y1, x2, y2, track_id, conf, cls
+        keypoints.npy  (N, K, 3) float32，仅姿态模型
+    数组以 mmap 方式打开，按帧随机访问，不需要把整个索引读进内存。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r')
+        self.rows = np.load(os.path.join(directory, 'rows.npy'), mmap_mode='r')
+        keypoints_path = os.path.join(directory, 'keypoints.npy')
+        self.keypoints = np.load(keypoints_path, mmap_mode='r') if os.path.exists(keypoints_path) else None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def fps(self):
+        return self.meta['fps']
+
+    @property
+    def names(self):
+        # JSON 的键是字符串，还原为 ultralytics 使用的 int 键
+        return {int(k): v for k, v in self.meta['names'].items()}
+
+    @property
+    def shape(self):
+        return self.meta['height'], self.meta['width']
+
+    def frame(self, index):
+        """第 index 帧（从 0 开始）的 (rows, keypoints)，keypoints 可能为 None"""
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        rows = np.array(self.rows[start:end])
+        keypoints = np.array(self.keypoints[start:end]) if self.keypoints is not None else None
+        return rows, keypoints
+
+
+class DetectionIndexWriter:
+    """处理视频时逐帧追加检测结果，commit() 时一次性写入索引目录（先写临时目录再改名）"""
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = dict(meta)
+        self._rows = []
+        self._keypoints = []
+        self._counts = []
+
+    def add(self, result):
+        """追加一帧的 ultralytics Results（未追踪到目标时记为空帧）"""
+        boxes = result.boxes
+        if boxes is None or boxes.id is None or len(boxes) == 0:
+            self.add_rows(None)
+            return
+        keypoints = getattr(result, 'keypoints', None)
+        self.add_rows(boxes.data.cpu().numpy(),
+                      keypoints.data.cpu().numpy() if keypoints is not None else None)
+
+    def add_rows(self, rows, keypoints=None):
+        """追加一帧的 (N, 7) 追踪结果"""
+        if rows is None or len(rows) == 0:
+            self._counts.append(0)
+            return
+        self._rows.append(np.asarray(rows, dtype=np.float32).reshape(-1, ROW_WIDTH))
+        if keypoints is not None:
+            self._keypoints.append(np.asarray(keypoints, dtype=np.float32))
+        self._counts.append(len(rows))
+
+    def commit(self):
+        offsets = np.zeros(len(self._counts) + 1, dtype=np.int64)
+        np.cumsum(self._counts, out=offsets[1:])
+        rows = np.concatenate(self._rows) if self._rows else np.zeros((0, ROW_WIDTH), dtype=np.float32)
+
+        tmp_dir = f"{self.directory}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+            np.save(os.path.join(tmp_dir, 'rows.npy'), rows)
+            # 只有每个检测框都带关键点时才保存，保证与 rows 一一对应
+            if self._keypoints and sum(len(k) for k in self._keypoints) == len(rows):
+                np.save(os.path.join(tmp_dir, 'keypoints.npy'), np.concatenate(self._keypoints))
+            meta = dict(self.meta, frames=len(self._counts), detections=len(rows),
+                        format=INDEX_FORMAT_VERSION, created_at=time.time())
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            if os.path.exists(self.directory):
+                # 其他任务已经写好了同一个索引
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            else:
+                os.rename(tmp_dir, self.directory)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        print(f"检测索引已保存: {self.directory} ({len(self._counts)} 帧, {len(rows)} 个检测框)")
+        return DetectionIndex(self.directory)
+
+
+def _index_directory(filepath, kind, model_path, index_dir=None):
+    return os.path.join(index_dir or INDEX_DIR,
+                        index_key(file_digest(filepath), kind, model_version(model_path)))
+
+
+def open_index(filepath, kind, model_path, index_dir=None):
+    """查找视频在当前模型版本下的索引，不存在时返回 None"""
+    directory = _index_directory(filepath, kind, model_path, index_dir)
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        return None
+    try:
+        return DetectionIndex(directory)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"读取检测索引失败 {directory}: {e}")
+        return None
+
+
+def create_writer(filepath, kind, model_path, fps, width, height, names, index_dir=None):
+    """为视频创建索引写入器；同一文件与模型版本的索引已存在时返回 None（只保存一次）"""
+    try:
+        directory = _index_directory(filepath, kind, model_path, index_dir)
+    except OSError as e:
+        print(f"无法为 {filepath} 创建检测索引: {e}")
+        return None
+    if os.path.exists(os.path.join(directory, 'meta.json')):
+        return None
+    os.makedirs(os.path.dirname(directory), exist_ok=True)
+    return DetectionIndexWriter(directory, {
+        'source': os.path.basename(filepath),
+        'kind': kind,
+        'model_version': model_version(model_path),
+        'fps': float(fps),
+        'width': int(width),
+        'height': int(height),
+        'names': {str(k): v for k, v in dict(names).items()},
+    })
@@ -1,11 +1,12 @@
 import dlib
 import numpy as np
 import cv2
-import pandas as pd
 import os
 import logging
-import csv
-from concurrent.futures import ThreadPoolExecutor
+
+from app.services.face_gallery import PrototypeGallery
+from app.services.face_index import create_index, evaluate_index
+from app.services.face_store import FaceEmbeddingStore
 
 # --- Dlib 模型和数据路径定义 ---
 # 所有路径都应相对于 `backend/dlib_data` 目录构建
@@ -18,8 +19,15 @@ FACE_REC_MODEL_PATH = os.path.join(DLIB_BASE_DIR, 'data_dlib', 'dlib_face_recogn
 # 注册的人脸图片存储在 dlib_data/data_faces_from_camera/
 FACES_DIR = os.path.join(DLIB_BASE_DIR, 'data_faces_from_camera')
 
-# 特征文件位于 dlib_data/
+# 旧版特征文件位于 dlib_data/，仅用于首次迁移到二进制特征存储
 FEATURES_CSV_PATH = os.path.join(DLIB_BASE_DIR, 'features_all.csv')
+# 二进制特征存储位于 dlib_data/face_store/
+FACE_STORE_DIR = os.path.join(DLIB_BASE_DIR, 'face_store')
+
+# 最近邻索引类型: 'exact' 精确检索 / 'ivf' 近似检索 / 'auto' 人脸库较大时自动切换为 IVF
+FACE_INDEX_BACKEND = 'auto'
+# 与最近的已知人脸 L2 距离小于该值时判定为同一人
+RECOGNITION_THRESHOLD = 0.42
 
 
 # --- Dlib 人脸识别服务类 ---
@@ -29,14 +37,6 @@ class DlibFaceService:
         初始化服务，加载所有必要的模型和数据。
         """
         logging.info("正在初始化 Dlib 人脸识别服务...")
-        
-        # --- 新增：为并行处理创建一个可复用的线程池 ---
-        # CPU核心数的一半是一个比较合理的线程数，避免过度竞争
-        cpu_count = os.cpu_count()
-        if cpu_count is None:
-            cpu_count = 2  # 默认值，避免None
-        max_workers = max(1, cpu_count // 2)
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
 
         # 1. 加载 Dlib 模型
         try:
@@ -49,103 +49,93 @@ class DlibFaceService:
             raise RuntimeError(f"无法加载Dlib模型，请检查路径: {SHAPE_PREDICTOR_PATH} 和 {FACE_REC_MODEL_PATH}")
 
         # 2. 加载已知人脸特征数据库
-        self.face_feature_known_list = []
+        self.store = FaceEmbeddingStore(FACE_STORE_DIR)
         self.face_name_known_list = []
-        # 添加特征向量缓存，提高性能
-        self.feature_array = None
+        self.face_id_known_list = np.zeros(0, dtype=np.int64)
+        # 特征矩阵 (N, 128)，直接使用特征存储的 mmap
+        self.feature_array = np.zeros((0, 128), dtype=np.float32)
+        self._name_by_id = {}
+        # 最近邻索引，识别时只查询索引而不再与全部特征逐一计算距离
+        self.index = create_index(FACE_INDEX_BACKEND)
+        # 每人压缩为少量原型的人脸库，匹配时先只查原型，接近阈值时再回退到上面的全量索引
+        self.gallery = PrototypeGallery(RECOGNITION_THRESHOLD)
         self.load_face_database()
     
     def load_face_database(self):
         """
-        从 features_all.csv 加载所有已知的人脸特征到内存中。
-        """
-        if os.path.exists(FEATURES_CSV_PATH) and os.path.getsize(FEATURES_CSV_PATH) > 0:
-            try:
-                csv_rd = pd.read_csv(FEATURES_CSV_PATH, header=None)
-                self.face_name_known_list = []
-                self.face_feature_known_list = []
-                for i in range(csv_rd.shape[0]):
-                    # 第一列是姓名
-                    self.face_name_known_list.append(csv_rd.iloc[i][0])
-                    # 后面的128列是特征
-                    features = [float(x) for x in csv_rd.iloc[i][1:].values]
-                    self.face_feature_known_list.append(features)
-                
-                # 优化: 预先将特征列表转换为NumPy数组，加速后续运算
-                self.feature_array = np.array(self.face_feature_known_list)
-                logging.info(f"成功从 CSV 加载 {len(self.face_name_known_list)} 个已知人脸特征。")
-            except Exception as e:
-                logging.error(f"从 CSV 加载特征时出错: {e}")
-        else:
-            logging.warning(f"特征文件 '{FEATURES_CSV_PATH}' 不存在或为空。")
-
-    def _recognize_single_face(self, args):
-        """
-        [内部工作函数] 在单个线程中处理一张人脸。
-        优化版本：使用缓存的特征数组，避免重复转换。
+        打开二进制特征存储（mmap，与人脸数量基本无关）；存储不存在时创建，并从旧版 features_all.csv 迁移一次。
         """
-        frame, box, feature_array = args
-        left, top, right, bottom = [int(p) for p in box]
-        
         try:
-            # 创建dlib矩形
-            dlib_rect = dlib.rectangle(left, top, right, bottom)
-            
-            # 提取人脸特征
-            shape = self.predictor(frame, dlib_rect)
-            features = self.face_reco_model.compute_face_descriptor(frame, shape)
-            features = np.array(features)
-            
-            # 使用向量化操作计算距离
-            if len(feature_array) > 0:
-                # 计算L2距离
-                distances = np.linalg.norm(feature_array - features, axis=1)
-                min_index = np.argmin(distances)
-                min_distance = distances[min_index]
-                
-                # 优化阈值调整，可根据实际情况调整
-                if min_distance < 0.42:  # 略微调高阈值，提高匹配率
-                    return (self.face_name_known_list[min_index], box)
+            if self.store.exists():
+                self.store.load()
+            else:
+                self.store.create()
+                if os.path.exists(FEATURES_CSV_PATH) and os.path.getsize(FEATURES_CSV_PATH) > 0:
+                    imported = self.store.import_csv(FEATURES_CSV_PATH)
+                    logging.info(f"已从 '{FEATURES_CSV_PATH}' 迁移 {imported} 个人脸特征到 {FACE_STORE_DIR}。")
+            self._refresh_known_faces()
+            self.index.build(self.face_id_known_list, self.feature_array)
+            self.gallery.rebuild(self.face_name_known_list, self.feature_array)
+            logging.info(f"成功加载 {len(self.face_name_known_list)} 个已知人脸特征，索引: {self.index.stats()}")
         except Exception as e:
-            logging.error(f"人脸识别出错: {e}")
-        
-        return ("Unknown", box)
+            logging.error(f"加载人脸特征存储时出错: {e}")
+
+    def _refresh_known_faces(self):
+        """从特征存储刷新内存中的姓名列表、ID 与特征矩阵"""
+        self.face_name_known_list, self.face_id_known_list, self.feature_array = self.store.live()
+        self._name_by_id = dict(zip(self.face_id_known_list.tolist(), self.face_name_known_list))
+
+    def compute_descriptors(self, frame, face_boxes):
+        """
+        批量提取人脸特征：先为所有人脸框计算68点关键点并放入同一个 full_object_detections，
+        再调用一次批量版 compute_face_descriptor。返回 (人脸数, 128) 的 float32 矩阵。
+        """
+        shapes = dlib.full_object_detections()
+        for box in face_boxes:
+            left, top, right, bottom = [int(p) for p in box]
+            shapes.append(self.predictor(frame, dlib.rectangle(left, top, right, bottom)))
+        descriptors = self.face_reco_model.compute_face_descriptor(frame, shapes)
+        return np.array([np.array(d) for d in descriptors], dtype=np.float32).reshape(-1, 128)
+
+    def match_descriptors(self, features):
+        """
+        为每个特征查找最近的已知人脸（所有人脸一次查询）：先与各人员的原型比较，
+        原型无法确定结果（接近阈值）的再到全量特征索引中精确查找。
+        返回 (姓名列表, L2距离数组)，距离不小于阈值的为 "Unknown"。
+        """
+        if len(features) == 0:
+            return [], np.zeros(0, dtype=np.float32)
+        names, distances, fallback = self.gallery.match(features)
+        rows = np.flatnonzero(fallback)
+        if len(rows):
+            raw_distances, ids = self.index.search(features[rows], 1)
+            for row, face_id, distance in zip(rows.tolist(), ids[:, 0].tolist(), raw_distances[:, 0].tolist()):
+                distances[row] = distance
+                if face_id >= 0 and distance < RECOGNITION_THRESHOLD:
+                    names[row] = self._name_by_id.get(int(face_id), "Unknown")
+        return names, distances
 
     def identify_faces(self, frame, face_boxes):
         """
-        在给定的图像帧中识别人脸 (已使用多线程优化)。
+        在给定的图像帧中识别人脸：批量提取所有人脸的特征，再一次性与人脸库比对。
+        返回与 face_boxes 顺序一致的 [(姓名, 人脸框), ...]。
         """
-        if not self.face_name_known_list or not face_boxes:
+        if len(self.index) == 0 or not face_boxes:
             return [("Unknown", box) for box in face_boxes]
 
-        # 优化1: 减少处理人脸的数量，如果人脸太多可能会影响性能
-        if len(face_boxes) > 10:
-            # 根据人脸大小排序，只处理最大的10个
-            face_boxes = sorted(face_boxes, key=lambda box: (box[2]-box[0])*(box[3]-box[1]), reverse=True)[:10]
-
-        # 优化2: 批量准备任务，包括预先缓存的特征数组
-        feature_array = self.feature_array
-        tasks = [(frame, box, feature_array) for box in face_boxes]
-        
-        # 优化3: 调整并行策略，根据人脸数量决定是否使用多线程
         try:
-            if len(tasks) <= 3:
-                # 人脸较少时，不使用多线程以减少开销
-                results = [self._recognize_single_face(task) for task in tasks]
-            else:
-                # 人脸较多时使用多线程
-                results = list(self.executor.map(self._recognize_single_face, tasks))
-            return results
+            features = self.compute_descriptors(frame, face_boxes)
+            names, _ = self.match_descriptors(features)
+            return list(zip(names, face_boxes))
         except Exception as e:
-            logging.error(f"人脸识别多线程处理出错: {e}")
-            # 如果多线程出错，回退到单线程模式以保证可用性
-            return [self._recognize_single_face(task) for task in tasks]
+            logging.error(f"人脸识别出错: {e}")
+            return [("Unknown", box) for box in face_boxes]
 
     def get_all_registered_names(self):
         """
-        从内存中返回所有不重复的已注册姓名。
+        返回所有不重复的已注册姓名。
         """
-        return sorted(list(set(self.face_name_known_list)))
+        return sorted(self.store.names())
 
     def delete_face_by_name(self, name):
         """
@@ -166,21 +156,15 @@ class DlibFaceService:
             shutil.rmtree(person_dir)
             logging.info(f"已删除图片目录: {person_dir}")
 
-            # 2. 从内存中移除该人员的特征
-            indices_to_remove = [i for i, person_name in enumerate(self.face_name_known_list) if person_name == name]
-            
-            # 从后往前删除，避免索引错误
-            for i in sorted(indices_to_remove, reverse=True):
-                del self.face_name_known_list[i]
-                del self.face_feature_known_list[i]
+            # 2. 在特征存储中把该人员的特征标记为已删除（墓碑），删除较多时自动压缩
+            removed = self.store.delete_name(name)
 
-            # 3. 更新预计算特征数组
-            self.feature_array = np.array(self.face_feature_known_list)
-            
-            # 4. 重建 features_all.csv 文件
-            self._rebuild_features_csv()
+            # 3. 从索引中移除这些特征，并刷新内存中的特征矩阵
+            self.index.remove(removed)
+            self.gallery.remove_name(name)
+            self._refresh_known_faces()
             
-            logging.info(f"成功删除人员 '{name}' 并重建了特征文件。")
+            logging.info(f"成功删除人员 '{name}' 的 {len(removed)} 个人脸特征。")
             return True
         except Exception as e:
             logging.error(f"删除人员 '{name}' 时发生错误: {e}")
@@ -231,30 +215,26 @@ class DlibFaceService:
         cropped_face = frame[top:bottom, left:right]
         cv2.imwrite(img_path, cropped_face)
 
-        # 将新特征追加到 CSV 和内存数据库
-        with open(FEATURES_CSV_PATH, "a", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            row_to_write = [name] + list(features)
-            writer.writerow(row_to_write)
-
-        self.face_name_known_list.append(name)
-        self.face_feature_known_list.append(list(features))
-        
-        # 更新特征数组缓存
-        self.feature_array = np.array(self.face_feature_known_list)
+        # 将新特征原地追加到特征存储并加入索引，刷新内存中的特征矩阵
+        features = np.array(features, dtype=np.float32)
+        face_id = self.store.add(name, features)
+        self.index.add([face_id], features[None])
+        # 增量压缩：只重新计算该人员的原型
+        self.gallery.update_name(name, self.store.vectors_for(name)[1])
+        self._refresh_known_faces()
 
         logging.info(f"为 '{name}' 成功捕获并保存了第 {img_num} 张人脸特征。")
         return {"status": "success", "message": f"成功捕获第 {img_num} 张图片", "count": img_num}
 
-    def _rebuild_features_csv(self):
+    def index_report(self, evaluate=False, sample=200):
         """
-        使用内存中的特征数据完全重写 features_all.csv 文件。
+        返回最近邻索引的状态；evaluate 为 True 时，以精确检索为基准评估召回率与查询延迟。
         """
-        with open(FEATURES_CSV_PATH, "w", newline="") as csvfile:
-            writer = csv.writer(csvfile)
-            for name, features in zip(self.face_name_known_list, self.face_feature_known_list):
-                writer.writerow([name] + features)
-        logging.info("已成功从内存重建 features_all.csv 文件。")
+        report = {'index': self.index.stats(), 'gallery': self.gallery.stats(), 'threshold': RECOGNITION_THRESHOLD}
+        if evaluate:
+            _, ids, vectors = self.store.live()
+            report['evaluation'] = evaluate_index(self.index, ids, vectors, sample=sample)
+        return report
 
 
 # 创建一个单例
@@ -0,0 +1,159 @@
+import threading
+
+import numpy as np
+
+from app.services.face_index import ExactIndex
+
+# 每个原型覆盖的最大 L2 半径，超出时为该人员增加一个原型
+PROTOTYPE_RADIUS = 0.2
+# 每个人员最多保留的原型数
+MAX_PROTOTYPES = 5
+MEDOID_ITERATIONS = 5
+# 匹配时取最近的这么多个原型来估计其他人员的距离下界
+PROTOTYPE_CANDIDATES = 8
+
+
+def select_prototypes(vectors, radius=PROTOTYPE_RADIUS, max_prototypes=MAX_PROTOTYPES):
+    """
+    k-medoids 选取原型：从总距离最小的一行开始，每轮以离现有原型最远的一行作为新原型，
+    并重新分配、更新各簇的 medoid，直到所有行与最近原型的距离都不超过 radius 或原型数达到上限。
+    返回 (原型行号数组, 各原型覆盖半径数组)。原型都是真实的特征行。
+    """
+    vectors = np.asarray(vectors, dtype=np.float64)
+    norms = np.einsum('ij,ij->i', vectors, vectors)
+    d = np.sqrt(np.maximum(norms[:, None] + norms[None, :] - 2.0 * (vectors @ vectors.T), 0))
+    medoids = [int(np.argmin(d.sum(axis=1)))]
+    while True:
+        for _ in range(MEDOID_ITERATIONS):
+            assign = np.argmin(d[:, medoids], axis=1)
+            updated = []
+            for c, medoid in enumerate(medoids):
+                members = np.flatnonzero(assign == c)
+                if len(members) == 0:
+                    updated.append(medoid)
+                    continue
+                updated.append(int(members[np.argmin(d[np.ix_(members, members)].sum(axis=1))]))
+            updated = list(dict.fromkeys(updated))
+            if updated == medoids:
+                break
+            medoids = updated
+        nearest = d[:, medoids].min(axis=1)
+        if nearest.max() <= radius or len(medoids) >= max_prototypes:
+            break
+        medoids.append(int(np.argmax(nearest)))
+    assign = np.argmin(d[:, medoids], axis=1)
+    radii = np.array([d[assign == c, medoid].max() for c, medoid in enumerate(medoids)])
+    return np.array(medoids, dtype=np.int64), radii
+
+
+class PrototypeGallery:
+    """
+    多原型人脸库：每个人员的所有注册特征被压缩为少量原型（k-medoids），匹配时先只与原型比较。
+
+    原型本身是该人员的真实特征行，且记录了覆盖半径 r（簇内所有行到原型的最大距离），
+    由三角不等式，任何其他人员的特征行与查询的距离不小于 d(查询, 其原型) - r。因此对最近原型距离 d1：
+    - d1 < threshold 且其他人员的距离下界都不小于 d1：结果一定是该人员
+    - 所有原型的距离下界都不小于 threshold：结果一定是 Unknown
+    其余（距离接近阈值或与其他人员难以区分）的查询标记为需要回退到原始特征行精确比较。
+    """
+
+    def __init__(self, threshold, dim=128, radius=PROTOTYPE_RADIUS, max_prototypes=MAX_PROTOTYPES):
+        self.threshold = threshold
+        self.dim = dim
+        self.radius = radius
+        self.max_prototypes = max_prototypes
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.index = ExactIndex(self.dim)
+            self._name_of = {}      # {原型ID: 姓名}
+            self._radius_of = {}    # {原型ID: 覆盖半径}
+            self._by_name = {}      # {姓名: [原型ID]}
+            self._rows = {}         # {姓名: 原始特征行数}
+            self._next_id = 1
+            self.matched = 0
+            self.fallbacks = 0
+
+    def rebuild(self, names, vectors):
+        """用全部特征（姓名列表与对应的特征矩阵）重建所有人员的原型"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self.reset()
+            if len(names) == 0:
+                return
+            labels, inverse = np.unique(np.asarray(names, dtype=object), return_inverse=True)
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.searchsorted(inverse[order], np.arange(len(labels) + 1))
+            for label, name in enumerate(labels):
+                self.update_name(name, vectors[order[bounds[label]:bounds[label + 1]]])
+
+    def update_name(self, name, vectors):
+        """重新压缩某人员的原型（注册新特征后增量调用），返回原型数"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            self.remove_name(name)
+            if len(vectors) == 0:
+                return 0
+            rows, radii = select_prototypes(vectors, self.radius, self.max_prototypes)
+            ids = list(range(self._next_id, self._next_id + len(rows)))
+            self._next_id += len(rows)
+            self.index.add(ids, vectors[rows])
+            for proto_id, radius in zip(ids, radii.tolist()):
+                self._name_of[proto_id] = name
+                self._radius_of[proto_id] = radius
+            self._by_name[name] = ids
+            self._rows[name] = len(vectors)
+            return len(ids)
+
+    def remove_name(self, name):
+        with self._lock:
+            ids = self._by_name.pop(name, [])
+            self._rows.pop(name, None)
+            self.index.remove(ids)
+            for proto_id in ids:
+                self._name_of.pop(proto_id, None)
+                self._radius_of.pop(proto_id, None)
+            return len(ids)
+
+    def match(self, features):
+        """
+        只与原型比较。返回 (姓名列表, 距离数组, 回退掩码)：
+        回退掩码为 True 的查询无法由原型确定结果，需要调用方与原始特征行精确比较。
+        """
+        features = np.asarray(features, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            count = len(self.index)
+            names = ["Unknown"] * len(features)
+            fallback = np.zeros(len(features), dtype=bool)
+            if count == 0:
+                return names, np.full(len(features), np.inf, dtype=np.float32), fallback
+            k = min(PROTOTYPE_CANDIDATES, count)
+            distances, ids = self.index.search(features, k)
+            max_radius = max(self._radius_of.values())
+            for q in range(len(features)):
+                d1 = float(distances[q, 0])
+                if d1 - max_radius >= self.threshold:
+                    continue
+                candidates = ids[q].tolist()
+                name = self._name_of[candidates[0]]
+                # 各候选原型所在簇的距离下界；候选之外的原型距离不小于第 k 个，用最大半径估计
+                lower = distances[q] - np.array([self._radius_of[proto_id] for proto_id in candidates])
+                tail = float(distances[q, -1]) - max_radius if count > k else np.inf
+                other = min([tail] + [float(lower[j]) for j in range(1, k)
+                                      if self._name_of[candidates[j]] != name])
+                if d1 < self.threshold and other >= d1:
+                    names[q] = name
+                elif min(float(lower.min()), tail) < self.threshold:
+                    fallback[q] = True
+            self.matched += len(features)
+            self.fallbacks += int(fallback.sum())
+            return names, distances[:, 0].copy(), fallback
+
+    def stats(self):
+        with self._lock:
+            rows = sum(self._rows.values())
+            return {'identities': len(self._by_name), 'rows': rows, 'prototypes': len(self.index),
+                    'compression': round(rows / len(self.index), 2) if len(self.index) else 0.0,
+                    'matched': self.matched, 'fallbacks': self.fallbacks}
@@ -0,0 +1,376 @@
+import threading
+import time
+
+import numpy as np
+
+# 人脸数达到该规模后 auto 模式才使用 IVF 索引，更小的人脸库精确检索已经足够快
+IVF_MIN_SIZE = 5000
+# IVF 索引规模增长到上次训练时的这么多倍后重新训练聚类中心
+IVF_RETRAIN_GROWTH = 4.0
+KMEANS_ITERATIONS = 10
+# 训练聚类中心时每个中心最多使用的样本数
+KMEANS_SAMPLES_PER_LIST = 64
+
+
+def _squared_distances(queries, vectors, vector_norms):
+    """||q - v||^2 = ||q||^2 + ||v||^2 - 2 q·v，一次矩阵乘法得到 (Q, N) 的平方距离"""
+    query_norms = np.einsum('ij,ij->i', queries, queries)
+    d2 = query_norms[:, None] + vector_norms[None, :] - 2.0 * (queries @ vectors.T)
+    np.maximum(d2, 0, out=d2)
+    return d2
+
+
+def _nearest(vectors, centroids, centroid_norms, chunk=4096):
+    """每个向量最近的中心序号；分块计算，避免一次生成 (N, nlist) 的大矩阵"""
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        part = vectors[start:start + chunk]
+        assign[start:start + chunk] = np.argmin(_squared_distances(part, centroids, centroid_norms), axis=1)
+    return assign
+
+
+def _top_k(d2, ids, k):
+    """每行取距离最小的 k 个，不足 k 个时用 (inf, -1) 补齐"""
+    count = d2.shape[1]
+    distances = np.full((len(d2), k), np.inf, dtype=np.float32)
+    result_ids = np.full((len(d2), k), -1, dtype=np.int64)
+    if count == 0:
+        return distances, result_ids
+    kk = min(k, count)
+    part = np.argpartition(d2, kk - 1, axis=1)[:, :kk] if kk < count else np.tile(np.arange(count), (len(d2), 1))
+    part_d2 = np.take_along_axis(d2, part, axis=1)
+    order = np.argsort(part_d2, axis=1)
+    part = np.take_along_axis(part, order, axis=1)
+    distances[:, :kk] = np.sqrt(np.take_along_axis(part_d2, order, axis=1))
+    result_ids[:, :kk] = ids[part]
+    return distances, result_ids
+
+
+class _VectorBlock:
+    """可增删的向量块：连续数组 + 预先计算的平方范数，删除时用最后一行填补空位"""
+    __slots__ = ('vectors', 'norms', 'ids', 'count', 'row_of')
+
+    def __init__(self, dim, capacity=16):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.norms = np.zeros(capacity, dtype=np.float32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+        self.row_of = {}
+
+    def add(self, ids, vectors):
+        n = len(ids)
+        if self.count + n > len(self.ids):
+            capacity = max(16, len(self.ids))
+            while capacity < self.count + n:
+                capacity *= 2
+            for name in ('vectors', 'norms', 'ids'):
+                old = getattr(self, name)
+                new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                new[:self.count] = old[:self.count]
+                setattr(self, name, new)
+        start, end = self.count, self.count + n
+        self.vectors[start:end] = vectors
+        self.norms[start:end] = np.einsum('ij,ij->i', vectors, vectors)
+        self.ids[start:end] = ids
+        for row, face_id in enumerate(ids, start):
+            self.row_of[int(face_id)] = row
+        self.count = end
+
+    def remove(self, face_id):
+        row = self.row_of.pop(int(face_id), None)
+        if row is None:
+            return False
+        last = self.count - 1
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.norms[row] = self.norms[last]
+            self.ids[row] = self.ids[last]
+            self.row_of[int(self.ids[row])] = row
+        self.count = last
+        return True
+
+    def view(self):
+        n = self.count
+        return self.vectors[:n], self.norms[:n], self.ids[:n]
+
+
+class FaceIndex:
+    """
+    人脸特征最近邻索引接口。距离均为 L2 距离，与 dlib 的识别阈值一致。
+
+    - build(ids, vectors): 用全部特征重建
+    - add(ids, vectors) / remove(ids): 增量增删
+    - search(queries, k): 返回 (distances (Q, k), ids (Q, k))，不足 k 个时 id 为 -1
+    """
+    name = None
+
+    def __init__(self, dim=128):
+        self.dim = dim
+        self._lock = threading.RLock()
+
+    def _prepare(self, ids, vectors):
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        return ids, vectors
+
+    def stats(self):
+        return {'backend': self.name, 'size': len(self)}
+
+
+class ExactIndex(FaceIndex):
+    """精确检索：向量与平方范数预先计算好，每次查询只做一次 BLAS 矩阵乘法 + argpartition 取 top-k"""
+    name = 'exact'
+
+    def __init__(self, dim=128):
+        super().__init__(dim)
+        self._block = _VectorBlock(dim)
+
+    def __len__(self):
+        return self._block.count
+
+    def build(self, ids, vectors):
+        ids, vectors = self._prepare(ids, vectors)
+        with self._lock:
+            self._block = _VectorBlock(self.dim, max(16, len(ids)))
+            self._block.add(ids, vectors)
+
+    def add(self, ids, vectors):
+        ids, vectors = self._prepare(ids, vectors)
+        with self._lock:
+            self._block.add(ids, vectors)
+
+    def remove(self, ids):
+        with self._lock:
+            return sum(self._block.remove(face_id) for face_id in np.asarray(ids).reshape(-1))
+
+    def search(self, queries, k=1):
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            vectors, norms, ids = self._block.view()
+            return _top_k(_squared_distances(queries, vectors, norms), ids, k)
+
+
+class IVFIndex(FaceIndex):
+    """
+    倒排文件（IVF）近似检索，纯 NumPy 实现。
+
+    用 k-means 把特征划分为 nlist 个簇，每个簇一个倒排列表；查询时先与所有簇中心比较，
+    只在最近的 nprobe 个簇中做精确距离计算。nlist 约为 4·sqrt(N)，单次查询的计算量约为
+    nlist + N·nprobe/nlist，随人脸库规模亚线性增长。
+    新增的特征直接分配到最近的簇；规模增长到上次训练的 IVF_RETRAIN_GROWTH 倍后自动重新训练。
+    """
+    name = 'ivf'
+
+    def __init__(self, dim=128, nlist=None, nprobe=8, seed=0):
+        super().__init__(dim)
+        self.fixed_nlist = nlist
+        self.nprobe = nprobe
+        self._rng = np.random.default_rng(seed)
+        self._centroids = np.zeros((0, dim), dtype=np.float32)
+        self._centroid_norms = np.zeros(0, dtype=np.float32)
+        self._lists = []
+        self._list_of = {}
+        self._trained_size = 0
+
+    def __len__(self):
+        return len(self._list_of)
+
+    def _choose_nlist(self, n):
+        """簇数不能超过特征数（k-means 从样本中无放回地选取初始中心），人脸库很小时每个特征自成一簇"""
+        nlist = self.fixed_nlist or int(np.clip(4 * np.sqrt(n), 1, 4096))
+        return min(nlist, n)
+
+    def _train(self, vectors):
+        nlist = self._choose_nlist(len(vectors))
+        sample_size = min(len(vectors), nlist * KMEANS_SAMPLES_PER_LIST)
+        sample = vectors[self._rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[self._rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assign = _nearest(sample, centroids, np.einsum('ij,ij->i', centroids, centroids))
+            counts = np.bincount(assign, minlength=nlist)
+            # 按簇排序后分段求和
+            order = np.argsort(assign, kind='stable')
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            filled = counts > 0
+            sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+            centroids[filled] = sums / counts[filled, None]
+            # 空簇用随机样本重新播种
+            empty = np.flatnonzero(~filled)
+            if len(empty):
+                centroids[empty] = sample[self._rng.choice(len(sample), len(empty), replace=False)]
+        self._centroids = centroids.astype(np.float32)
+        self._centroid_norms = np.einsum('ij,ij->i', self._centroids, self._centroids)
+
+    def _assign(self, vectors):
+        return _nearest(vectors, self._centroids, self._centroid_norms)
+
+    def _fill(self, ids, vectors):
+        assign = self._assign(vectors)
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(len(self._lists) + 1))
+        for list_index in range(len(self._lists)):
+            rows = order[bounds[list_index]:bounds[list_index + 1]]
+            if len(rows):
+                self._lists[list_index].add(ids[rows], vectors[rows])
+                for face_id in ids[rows].tolist():
+                    self._list_of[face_id] = list_index
+
+    def build(self, ids, vectors):
+        ids, vectors = self._prepare(ids, vectors)
+        with self._lock:
+            self._list_of = {}
+            if len(ids) == 0:
+                self._centroids = np.zeros((0, self.dim), dtype=np.float32)
+                self._centroid_norms = np.zeros(0, dtype=np.float32)
+                self._lists = []
+                self._trained_size = 0
+                return
+            self._train(vectors)
+            self._lists = [_VectorBlock(self.dim) for _ in range(len(self._centroids))]
+            self._fill(ids, vectors)
+            self._trained_size = len(ids)
+
+    def _all(self):
+        blocks = [block.view() for block in self._lists if block.count]
+        if not blocks:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.dim), dtype=np.float32)
+        return np.concatenate([b[2] for b in blocks]), np.concatenate([b[0] for b in blocks])
+
+    def add(self, ids, vectors):
+        ids, vectors = self._prepare(ids, vectors)
+        with self._lock:
+            if not self._lists or len(self) + len(ids) >= self._trained_size * IVF_RETRAIN_GROWTH:
+                all_ids, all_vectors = self._all()
+                self.build(np.concatenate([all_ids, ids]), np.concatenate([all_vectors, vectors]))
+            else:
+                self._fill(ids, vectors)
+
+    def remove(self, ids):
+        removed = 0
+        with self._lock:
+            for face_id in np.asarray(ids).reshape(-1).tolist():
+                list_index = self._list_of.pop(face_id, None)
+                if list_index is not None:
+                    removed += self._lists[list_index].remove(face_id)
+        return removed
+
+    def search(self, queries, k=1, nprobe=None):
+        queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        nprobe = nprobe or self.nprobe
+        with self._lock:
+            distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+            result_ids = np.full((len(queries), k), -1, dtype=np.int64)
+            if not self._lists:
+                return distances, result_ids
+            probe = min(nprobe, len(self._lists))
+            coarse = _squared_distances(queries, self._centroids, self._centroid_norms)
+            nearest_lists = np.argpartition(coarse, probe - 1, axis=1)[:, :probe]
+            for q, list_indices in enumerate(nearest_lists):
+                blocks = [self._lists[i].view() for i in list_indices if self._lists[i].count]
+                if not blocks:
+                    continue
+                vectors = np.concatenate([b[0] for b in blocks])
+                norms = np.concatenate([b[1] for b in blocks])
+                ids = np.concatenate([b[2] for b in blocks])
+                d, i = _top_k(_squared_distances(queries[q:q + 1], vectors, norms), ids, k)
+                distances[q], result_ids[q] = d[0], i[0]
+            return distances, result_ids
+
+    def stats(self):
+        sizes = [block.count for block in self._lists]
+        return dict(super().stats(), nlist=len(self._lists), nprobe=self.nprobe,
+                    trained_size=self._trained_size, max_list_size=max(sizes) if sizes else 0)
+
+
+class AutoIndex(FaceIndex):
+    """人脸库较小时使用精确检索，达到 IVF_MIN_SIZE 后切换为 IVF"""
+    name = 'auto'
+
+    def __init__(self, dim=128, min_size=IVF_MIN_SIZE, **ivf_options):
+        super().__init__(dim)
+        self.min_size = min_size
+        self.ivf_options = ivf_options
+        self.backend = ExactIndex(dim)
+
+    def __len__(self):
+        return len(self.backend)
+
+    def _select(self, size):
+        wanted = IVFIndex if size >= self.min_size else ExactIndex
+        return None if isinstance(self.backend, wanted) else wanted
+
+    def build(self, ids, vectors):
+        with self._lock:
+            wanted = self._select(len(np.asarray(ids).reshape(-1))) or type(self.backend)
+            self.backend = IVFIndex(self.dim, **self.ivf_options) if wanted is IVFIndex else ExactIndex(self.dim)
+            self.backend.build(ids, vectors)
+
+    def add(self, ids, vectors):
+        with self._lock:
+            if self._select(len(self) + len(np.asarray(ids).reshape(-1))) is IVFIndex:
+                # 规模跨过阈值时用全部特征重建为 IVF
+                all_vectors, _, all_ids = self.backend._block.view()
+                ids, vectors = self._prepare(ids, vectors)
+                self.build(np.concatenate([all_ids, ids]), np.concatenate([all_vectors, vectors]))
+            else:
+                self.backend.add(ids, vectors)
+
+    def remove(self, ids):
+        with self._lock:
+            return self.backend.remove(ids)
+
+    def search(self, queries, k=1):
+        return self.backend.search(queries, k)
+
+    def stats(self):
+        return dict(self.backend.stats(), backend=f"auto:{self.backend.name}")
+
+
+INDEX_BACKENDS = {'exact': ExactIndex, 'ivf': IVFIndex, 'auto': AutoIndex}
+
+
+def create_index(backend='auto', dim=128, **options):
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"未知的人脸索引类型: {backend}，可选: {', '.join(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](dim, **options)
+
+
+def evaluate_index(index, ids, vectors, queries=None, sample=200, k=1, noise=0.02, seed=0):
+    """
+    用精确检索作为基准评估索引：返回 recall@k 以及两者的单次查询平均/95分位延迟（毫秒）。
+    未提供 queries 时，从人脸库中随机抽样并加入少量噪声作为查询。
+    """
+    ids, vectors = np.asarray(ids, dtype=np.int64), np.asarray(vectors, dtype=np.float32)
+    if len(ids) == 0:
+        return {'queries': 0, 'k': k, 'recall': None}
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(vectors), min(sample, len(vectors)), replace=False)
+        queries = vectors[rows] + rng.normal(0, noise, (len(rows), vectors.shape[1])).astype(np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+
+    reference = ExactIndex(vectors.shape[1])
+    reference.build(ids, vectors)
+
+    def run(target):
+        latencies, found = [], []
+        for query in queries:
+            start = time.perf_counter()
+            _, result = target.search(query[None], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append(result[0])
+        return np.array(found), np.array(latencies)
+
+    expected, reference_latency = run(reference)
+    actual, latency = run(index)
+    hits = sum(len(set(e[e >= 0]) & set(a[a >= 0])) for e, a in zip(expected, actual))
+    total = int((expected >= 0).sum())
+    return {
+        'queries': len(queries),
+        'k': k,
+        'recall': round(hits / total, 4) if total else None,
+        'latency_ms': {'mean': round(float(latency.mean()), 3), 'p95': round(float(np.percentile(latency, 95)), 3)},
+        'exact_latency_ms': {'mean': round(float(reference_latency.mean()), 3),
+                             'p95': round(float(np.percentile(reference_latency, 95)), 3)},
+        'index': index.stats(),
+    }
@@ -0,0 +1,273 @@
+import csv
+import json
+import logging
+import os
+import shutil
+import threading
+
+import numpy as np
+
+# 已删除行超过该比例（且至少 COMPACT_MIN_TOMBSTONES 行）时自动压缩
+COMPACT_TOMBSTONE_RATIO = 0.25
+COMPACT_MIN_TOMBSTONES = 64
+# 初始容量（行），不够时按倍数扩容
+INITIAL_CAPACITY = 256
+STORE_FORMAT_VERSION = 1
+
+
+class FaceEmbeddingStore:
+    """
+    人脸特征的二进制存储。
+
+    目录结构:
+        header.json    维度、行数、容量、已删除行数、下一个ID；最后写入，行数以它为准
+        embeddings.npy (容量, dim) float32，以 mmap 打开，新特征直接写入下一行
+        labels.npy     (容量,) int32，每行对应 names.txt 中的姓名序号
+        ids.npy        (容量,) int64，每行的稳定ID（压缩后不变）
+        alive.npy      (容量,) uint8，删除时只把该行置 0（墓碑），由 compact() 统一回收
+        names.txt      姓名表，每行一个姓名，只追加
+    加载时只需打开 mmap 和读取姓名表，与行数基本无关。
+    """
+
+    ARRAYS = ('embeddings', 'labels', 'ids', 'alive')
+
+    def __init__(self, directory, dim=128):
+        self.directory = directory
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._names = []          # 姓名表
+        self._name_index = {}     # {姓名: 序号}
+        self._row_names = []      # 每行的姓名（包含已删除行）
+        self.count = 0
+        self.capacity = 0
+        self.tombstones = 0
+        self.next_id = 1
+        self.embeddings = self.labels = self.ids = self.alive = None
+
+    # --- 文件读写 ---
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        return os.path.exists(self._path('header.json'))
+
+    def _write_header(self):
+        header = {'format': STORE_FORMAT_VERSION, 'dim': self.dim, 'count': self.count,
+                  'capacity': self.capacity, 'tombstones': self.tombstones, 'next_id': self.next_id}
+        tmp = self._path('header.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        os.replace(tmp, self._path('header.json'))
+
+    def _open_arrays(self):
+        self.embeddings = np.load(self._path('embeddings.npy'), mmap_mode='r+')
+        self.labels = np.load(self._path('labels.npy'), mmap_mode='r+')
+        self.ids = np.load(self._path('ids.npy'), mmap_mode='r+')
+        self.alive = np.load(self._path('alive.npy'), mmap_mode='r+')
+
+    def _close_arrays(self):
+        # 释放 mmap 引用后才能替换文件（Windows 下被映射的文件不能覆盖）
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            if isinstance(array, np.memmap):
+                array.flush()
+            setattr(self, name, None)
+
+    def _write_arrays(self, directory, capacity, embeddings, labels, ids, alive):
+        """在 directory 中创建容量为 capacity 的数组文件，并写入已有数据"""
+        specs = {
+            'embeddings': ((capacity, self.dim), np.float32, embeddings),
+            'labels': ((capacity,), np.int32, labels),
+            'ids': ((capacity,), np.int64, ids),
+            'alive': ((capacity,), np.uint8, alive),
+        }
+        for name, (shape, dtype, data) in specs.items():
+            array = np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+',
+                                              dtype=dtype, shape=shape)
+            if data is not None and len(data):
+                array[:len(data)] = data
+            array.flush()
+            del array
+
+    def _replace_arrays(self, capacity, embeddings, labels, ids, alive):
+        """先写入临时目录再逐个替换，替换前关闭当前 mmap"""
+        tmp_dir = self._path('.rebuild')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        self._write_arrays(tmp_dir, capacity, embeddings, labels, ids, alive)
+        self._close_arrays()
+        for name in self.ARRAYS:
+            os.replace(os.path.join(tmp_dir, f'{name}.npy'), self._path(f'{name}.npy'))
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.capacity = capacity
+        self._open_arrays()
+
+    def create(self, capacity=INITIAL_CAPACITY):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._write_arrays(self.directory, capacity, None, None, None, None)
+            open(self._path('names.txt'), 'w', encoding='utf-8').close()
+            self._names, self._name_index, self._row_names = [], {}, []
+            self.count, self.capacity, self.tombstones, self.next_id = 0, capacity, 0, 1
+            self._write_header()
+            self._open_arrays()
+
+    def load(self):
+        """打开已有的存储"""
+        with self._lock:
+            with open(self._path('header.json'), 'r', encoding='utf-8') as f:
+                header = json.load(f)
+            if header['dim'] != self.dim:
+                raise ValueError(f"特征维度不一致: 存储为 {header['dim']}，期望 {self.dim}")
+            self.count = header['count']
+            self.capacity = header['capacity']
+            self.tombstones = header['tombstones']
+            self.next_id = header['next_id']
+            with open(self._path('names.txt'), 'r', encoding='utf-8') as f:
+                self._names = [line.rstrip('\n') for line in f]
+            self._name_index = {name: i for i, name in enumerate(self._names)}
+            self._open_arrays()
+            names = np.array(self._names, dtype=object)
+            self._row_names = names[self.labels[:self.count]].tolist() if self.count else []
+
+    def import_csv(self, csv_path):
+        """从旧版 features_all.csv（姓名 + 128 维特征）导入，返回导入的行数"""
+        names, vectors = [], []
+        try:
+            with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+        except UnicodeDecodeError:
+            # 旧版本按系统默认编码写入
+            with open(csv_path, 'r', newline='') as f:
+                rows = list(csv.reader(f))
+        for row in rows:
+            if len(row) < self.dim + 1:
+                continue
+            names.append(row[0])
+            vectors.append(row[1:self.dim + 1])
+        if names:
+            self.add_many(names, np.asarray(vectors, dtype=np.float32))
+        return len(names)
+
+    # --- 修改 ---
+
+    def _label_for(self, name):
+        label = self._name_index.get(name)
+        if label is None:
+            label = self._name_index[name] = len(self._names)
+            self._names.append(name)
+            with open(self._path('names.txt'), 'a', encoding='utf-8') as f:
+                f.write(name + '\n')
+        return label
+
+    def _reserve(self, rows):
+        if self.count + rows <= self.capacity:
+            return
+        capacity = max(INITIAL_CAPACITY, self.capacity)
+        while capacity < self.count + rows:
+            capacity *= 2
+        n = self.count
+        self._replace_arrays(capacity, np.array(self.embeddings[:n]), np.array(self.labels[:n]),
+                             np.array(self.ids[:n]), np.array(self.alive[:n]))
+
+    def add(self, name, vector):
+        """追加一个特征，返回其ID"""
+        return self.add_many([name], np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+
+    def add_many(self, names, vectors):
+        """批量追加特征（原地写入 mmap 的后续行），返回 ID 列表"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        # 姓名表按行存储，姓名中不能含换行
+        names = [str(name).replace('\n', ' ') for name in names]
+        with self._lock:
+            self._reserve(len(vectors))
+            start, end = self.count, self.count + len(vectors)
+            ids = np.arange(self.next_id, self.next_id + len(vectors), dtype=np.int64)
+            self.embeddings[start:end] = vectors
+            self.labels[start:end] = [self._label_for(name) for name in names]
+            self.ids[start:end] = ids
+            self.alive[start:end] = 1
+            for name in self.ARRAYS:
+                getattr(self, name).flush()
+            self._row_names.extend(names)
+            self.count = end
+            self.next_id += len(vectors)
+            # 数据落盘之后再更新 header，中途崩溃时未写完的行不会被读到
+            self._write_header()
+            return ids.tolist()
+
+    def delete_name(self, name):
+        """把某人的所有特征标记为已删除，返回被删除的ID列表"""
+        with self._lock:
+            label = self._name_index.get(name)
+            if label is None or self.count == 0:
+                return []
+            rows = np.flatnonzero((self.labels[:self.count] == label) & (self.alive[:self.count] == 1))
+            if len(rows) == 0:
+                return []
+            self.alive[rows] = 0
+            self.alive.flush()
+            self.tombstones += len(rows)
+            self._write_header()
+            removed = self.ids[rows].tolist()
+        self.maybe_compact()
+        return removed
+
+    def maybe_compact(self):
+        with self._lock:
+            if self.tombstones >= COMPACT_MIN_TOMBSTONES and self.tombstones >= self.count * COMPACT_TOMBSTONE_RATIO:
+                self.compact()
+
+    def compact(self):
+        """回收已删除的行（ID 保持不变），返回回收的行数"""
+        with self._lock:
+            if self.tombstones == 0:
+                return 0
+            keep = np.flatnonzero(self.alive[:self.count] == 1)
+            removed = self.count - len(keep)
+            capacity = max(INITIAL_CAPACITY, self.capacity)
+            self._replace_arrays(capacity, np.array(self.embeddings[keep]), np.array(self.labels[keep]),
+                                 np.array(self.ids[keep]), np.ones(len(keep), dtype=np.uint8))
+            self._row_names = [self._row_names[i] for i in keep]
+            self.count = len(keep)
+            self.tombstones = 0
+            self._write_header()
+            logging.info(f"人脸特征存储已压缩，回收 {removed} 行")
+            return removed
+
+    # --- 读取 ---
+
+    def live(self):
+        """
+        返回当前有效的 (姓名列表, ID 数组, 特征矩阵)。
+        特征矩阵总是复制到内存中：调用方会长期持有它，若返回 mmap 的切片，
+        扩容或压缩替换文件时映射仍未释放，Windows 上 os.replace 会失败。
+        """
+        with self._lock:
+            n = self.count
+            if self.tombstones == 0:
+                return list(self._row_names), np.array(self.ids[:n]), np.array(self.embeddings[:n])
+            rows = np.flatnonzero(self.alive[:n] == 1)
+            return ([self._row_names[i] for i in rows], np.array(self.ids[rows]),
+                    np.array(self.embeddings[rows]))
+
+    def vectors_for(self, name):
+        """某人员当前有效的 (ID 数组, 特征矩阵)"""
+        with self._lock:
+            label = self._name_index.get(name)
+            if label is None or self.count == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros((0, self.dim), dtype=np.float32)
+            rows = np.flatnonzero((self.labels[:self.count] == label) & (self.alive[:self.count] == 1))
+            return np.array(self.ids[rows]), np.array(self.embeddings[rows])
+
+    def names(self):
+        """所有仍有有效特征的姓名"""
+        with self._lock:
+            if self.count == 0:
+                return []
+            labels = np.unique(self.labels[:self.count][self.alive[:self.count] == 1])
+            return [self._names[label] for label in labels]
+
+    def __len__(self):
+        return self.count - self.tombstones
@@ -0,0 +1,202 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+
+class FrameChannel:
+    """
+    单路视频流的广播通道。
+    生产者每帧只编码一次并发布到通道（"最新帧 + 序号"），任意数量的订阅者通过条件变量等待新帧。
+    通道保留最近 history 帧，供 every 模式的订阅者在短暂落后时补齐。
+    """
+
+    def __init__(self, key, history=8):
+        self.key = key
+        self._cond = threading.Condition()
+        self._frames = deque(maxlen=history)  # [(seq, data), ...]
+        self._seq = 0
+        self._closed = False
+        self._subscribers = {}
+        self._subscriber_ids = itertools.count(1)
+        self.created_at = time.time()
+        self.last_publish_time = None
+
+    @property
+    def seq(self):
+        return self._seq
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def publish(self, data):
+        """发布一帧（已编码的数据），唤醒所有等待中的订阅者"""
+        with self._cond:
+            if self._closed:
+                return self._seq
+            self._seq += 1
+            self._frames.append((self._seq, data))
+            self.last_publish_time = time.time()
+            self._cond.notify_all()
+            return self._seq
+
+    def wait_for_frame(self, after_seq, every=False, timeout=1.0):
+        """
+        等待序号大于 after_seq 的帧。
+        every=False: 直接跳到最新帧；every=True: 返回紧接着的下一帧（若已被挤出历史，则从最旧的可用帧继续）。
+        返回 (seq, data)，超时返回 (None, None)，通道关闭且无新帧时返回 (None, None)。
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > after_seq or self._closed, timeout)
+            if self._seq <= after_seq:
+                return None, None
+            if not every:
+                return self._frames[-1]
+            for seq, data in self._frames:
+                if seq > after_seq:
+                    return seq, data
+            return self._frames[-1]
+
+    def close(self):
+        """关闭通道，所有订阅者在取完剩余帧后退出"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _attach(self, subscriber):
+        with self._cond:
+            subscriber.id = next(self._subscriber_ids)
+            self._subscribers[subscriber.id] = subscriber
+
+    def _detach(self, subscriber):
+        with self._cond:
+            self._subscribers.pop(subscriber.id, None)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def backlog(self):
+        """订阅者中最大的积压帧数（已发布但该订阅者尚未取走的帧数）"""
+        subscribers = list(self._subscribers.values())
+        if not subscribers:
+            return 0
+        return max(self._seq - sub.last_seq for sub in subscribers)
+
+    def stats(self):
+        return {
+            'key': self.key,
+            'seq': self._seq,
+            'closed': self._closed,
+            'subscriber_count': len(self._subscribers),
+            'last_publish_time': self.last_publish_time,
+            'subscribers': [sub.stats() for sub in list(self._subscribers.values())],
+        }
+
+
+class Subscriber:
+    """
+    通道的一个订阅者（通常对应一个浏览器标签页）。
+    mode='latest' 时总是拿最新帧，跟不上就跳帧；mode='every' 时尽量逐帧接收。
+    记录每个订阅者的投递数、跳帧数和落后帧数（lag）。
+    """
+
+    def __init__(self, channel, mode='latest', name=None):
+        self.channel = channel
+        self.mode = mode
+        self.name = name
+        self.id = None
+        self.last_seq = channel.seq  # 只接收订阅之后发布的帧
+        self.delivered = 0
+        self.skipped = 0
+        self.lag = 0
+        self.max_lag = 0
+        self.last_wait_ms = 0.0
+        self.subscribed_at = time.time()
+        self._closed = False
+        channel._attach(self)
+
+    def frames(self, timeout=1.0):
+        """生成器：持续产出订阅到的帧数据，直到通道关闭或订阅被关闭"""
+        every = self.mode == 'every'
+        while not self._closed:
+            t0 = time.time()
+            seq, data = self.channel.wait_for_frame(self.last_seq, every=every, timeout=timeout)
+            if seq is None:
+                if self.channel.closed:
+                    break
+                continue
+            self.last_wait_ms = (time.time() - t0) * 1000
+            self.skipped += seq - self.last_seq - 1
+            self.last_seq = seq
+            self.lag = self.channel.seq - seq
+            self.max_lag = max(self.max_lag, self.lag)
+            self.delivered += 1
+            yield data
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.channel._detach(self)
+
+    def stats(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'mode': self.mode,
+            'delivered': self.delivered,
+            'skipped': self.skipped,
+            'lag': self.lag,
+            'max_lag': self.max_lag,
+            'last_wait_ms': round(self.last_wait_ms, 2),
+            'connected_seconds': round(time.time() - self.subscribed_at, 1),
+        }
+
+
+class BroadcastHub:
+    """按流标识管理广播通道：生产者 publish，观看者 subscribe"""
+
+    def __init__(self, history=8):
+        self.history = history
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def get_channel(self, key, create=True):
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None and create:
+                channel = FrameChannel(key, history=self.history)
+                self._channels[key] = channel
+            return channel
+
+    def publish(self, key, data):
+        return self.get_channel(key).publish(data)
+
+    def subscribe(self, key, mode='latest', name=None):
+        if mode not in ('latest', 'every'):
+            raise ValueError(f"无效的订阅模式: {mode}")
+        return Subscriber(self.get_channel(key), mode=mode, name=name)
+
+    def subscriber_count(self, key):
+        channel = self.get_channel(key, create=False)
+        return channel.subscriber_count() if channel else 0
+
+    def backlog(self, key):
+        channel = self.get_channel(key, create=False)
+        return channel.backlog() if channel else 0
+
+    def close_channel(self, key):
+        """关闭并移除通道；之后对同一 key 的订阅会得到一个新通道"""
+        with self._lock:
+            channel = self._channels.pop(key, None)
+        if channel is not None:
+            channel.close()
+
+    def stats(self):
+        with self._lock:
+            channels = list(self._channels.values())
+        return {channel.key: channel.stats() for channel in channels}
+
+
+# 全局广播中心：实时摄像头与所有RTMP流共用
+broadcast_hub = BroadcastHub()
@@ -0,0 +1,176 @@
+import threading
+import time
+
+from app.services.metrics import metrics
+
+
+class LatestFrameSlot:
+    """
+    只保留最新一帧的单槽缓冲区。
+    生产者写入新帧时，若上一帧还没被取走，则直接覆盖并计为丢帧，
+    这样消费者拿到的永远是最新的画面，不会积压过期帧。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+
+    def put(self, item):
+        """写入新帧（覆盖未被消费的旧帧）"""
+        with self._cond:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self.put_count += 1
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """取走最新帧；超时或槽已关闭时返回 None"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._item is not None or self._closed, timeout)
+            item = self._item
+            self._item = None
+            return item
+
+    def close(self):
+        """关闭槽位，唤醒所有等待者"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class FramePipeline:
+    """
+    采集 / 推理 / 编码 三段式流水线。
+
+    - 采集线程：持续调用 cap.read()，只把最新帧放入 capture_slot，及时清空摄像头缓冲区
+    - 推理线程：从 capture_slot 取最新帧，调用 process_fn 完成推理与绘制，结果放入 output_slot
+    - 编码/输出阶段：由调用方在自己的线程里迭代 frames()，负责 JPEG 编码与 yield
+
+    任何一段变慢都只会导致中间帧被丢弃（并计数），而不会让其它阶段等待，
+    因此显示帧率与模型延迟解耦，画面延迟最多一帧。
+    """
+
+    def __init__(self, cap, process_fn, is_active=None, name="camera", mode_fn=None):
+        self.cap = cap
+        self.process_fn = process_fn
+        self.is_active = is_active or (lambda: True)
+        self.name = name
+        # 返回当前检测模式，用作采集/解码指标的 mode 标签
+        self.mode_fn = mode_fn or (lambda: '')
+
+        self.capture_slot = LatestFrameSlot()
+        self.output_slot = LatestFrameSlot()
+        self._stop_event = threading.Event()
+        self._threads = []
+
+        self.started_at = None
+        self.processed = 0
+        self.emitted = 0
+        self.read_failures = 0
+        self.last_inference_ms = 0.0
+        self._inference_ms_total = 0.0
+
+    def start(self):
+        """启动采集线程和推理线程"""
+        self.started_at = time.time()
+        for target, suffix in ((self._capture_loop, "capture"), (self._inference_loop, "inference")):
+            thread = threading.Thread(target=target, name=f"{self.name}-{suffix}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def running(self):
+        return not self._stop_event.is_set() and self.is_active()
+
+    def _capture_loop(self):
+        """采集线程：只保留最新帧"""
+        try:
+            while self.running():
+                # grab 与 retrieve 分开计时，分别对应采集与解码
+                t0 = time.perf_counter()
+                ret = self.cap.grab()
+                t1 = time.perf_counter()
+                frame = None
+                if ret:
+                    ret, frame = self.cap.retrieve()
+                    mode = self.mode_fn()
+                    metrics.observe('capture', t1 - t0, self.name, mode)
+                    metrics.observe('decode', time.perf_counter() - t1, self.name, mode)
+                if not ret:
+                    self.read_failures += 1
+                    print(f"[Pipeline:{self.name}] 读取帧失败，采集线程退出。")
+                    break
+                self.capture_slot.put(frame)
+        finally:
+            # 采集结束后关闭槽位，推理线程随之退出
+            self.capture_slot.close()
+
+    def _inference_loop(self):
+        """推理线程：处理最新帧，并把结果交给编码阶段"""
+        try:
+            while self.running():
+                frame = self.capture_slot.get(timeout=0.5)
+                if frame is None:
+                    if self.capture_slot.closed:
+                        break
+                    continue
+
+                t0 = time.time()
+                try:
+                    processed_frame = self.process_fn(frame)
+                except Exception as e:
+                    print(f"[Pipeline:{self.name}] 推理阶段出错: {e}")
+                    processed_frame = frame
+                self.last_inference_ms = (time.time() - t0) * 1000
+                self._inference_ms_total += self.last_inference_ms
+                self.processed += 1
+
+                if processed_frame is not None:
+                    self.output_slot.put(processed_frame)
+        finally:
+            self.output_slot.close()
+
+    def frames(self):
+        """编码/输出阶段使用的生成器，每次产出当前最新的处理结果"""
+        while self.running():
+            processed_frame = self.output_slot.get(timeout=0.5)
+            if processed_frame is None:
+                if self.output_slot.closed:
+                    break
+                continue
+            self.emitted += 1
+            yield processed_frame
+
+    def stop(self, timeout=2.0):
+        """停止流水线并等待线程退出（调用方应在此之后再释放 cap）"""
+        self._stop_event.set()
+        self.capture_slot.close()
+        self.output_slot.close()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def stats(self):
+        """返回流水线运行统计，包括各阶段的丢帧数"""
+        elapsed = max(time.time() - self.started_at, 1e-6) if self.started_at else 0.0
+        return {
+            'name': self.name,
+            'running': self.running(),
+            'captured': self.capture_slot.put_count,
+            'processed': self.processed,
+            'emitted': self.emitted,
+            'capture_dropped': self.capture_slot.dropped,
+            'output_dropped': self.output_slot.dropped,
+            'read_failures': self.read_failures,
+            'capture_fps': round(self.capture_slot.put_count / elapsed, 2) if elapsed else 0.0,
+            'output_fps': round(self.emitted / elapsed, 2) if elapsed else 0.0,
+            'last_inference_ms': round(self.last_inference_ms, 2),
+            'avg_inference_ms': round(self._inference_ms_total / self.processed, 2) if self.processed else 0.0,
+        }
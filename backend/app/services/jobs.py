@@ -0,0 +1,161 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from app import socketio
+
+# 同时运行的任务数。离线视频任务共用 upload 流的目标状态与告警（reset_alerts/get_alerts），
+# 并发运行会让不同任务的告警互相覆盖，因此默认逐个执行，其余任务排队
+DEFAULT_MAX_WORKERS = 1
+# 内存中最多保留的已结束任务数
+MAX_FINISHED_JOBS = 100
+# 进度推送的最小间隔（秒）
+PROGRESS_EMIT_INTERVAL = 0.5
+JOBS_NAMESPACE = '/jobs'
+
+
+class Job:
+    """一个后台处理任务及其进度"""
+
+    def __init__(self, kind, filename=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.status = 'queued'  # queued / running / succeeded / failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.frames_done = 0
+        self.total_frames = 0
+        self.fps = 0.0
+        self.eta_seconds = None
+        self.result = None
+        self.error = None
+        self._last_emit = 0.0
+
+    @property
+    def finished(self):
+        return self.status in ('succeeded', 'failed')
+
+    def update_progress(self, frames_done, total_frames):
+        """由处理函数回调，更新帧进度并计算处理速度与剩余时间"""
+        self.frames_done = frames_done
+        self.total_frames = total_frames
+        elapsed = time.time() - (self.started_at or time.time())
+        if elapsed > 0 and frames_done > 0:
+            self.fps = frames_done / elapsed
+            if total_frames > frames_done:
+                self.eta_seconds = (total_frames - frames_done) / self.fps
+            else:
+                self.eta_seconds = 0.0
+
+    def to_dict(self, include_result=True):
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'filename': self.filename,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': {
+                'frames_done': self.frames_done,
+                'total_frames': self.total_frames,
+                'percent': round(self.frames_done / self.total_frames * 100, 1) if self.total_frames else 0.0,
+                'fps': round(self.fps, 2),
+                'eta_seconds': round(self.eta_seconds, 1) if self.eta_seconds is not None else None,
+            },
+            'error': self.error,
+        }
+        if include_result:
+            data['result'] = self.result
+        return data
+
+
+class JobQueue:
+    """
+    本地任务队列：提交后立即返回任务ID，任务在有界线程池中执行，
+    进度通过 Socket.IO 的 /jobs 命名空间推送（job_progress / job_update 事件）。
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_finished=MAX_FINISHED_JOBS):
+        self.max_workers = max_workers
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-worker')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def submit(self, fn, *args, kind='video', filename=None, **kwargs):
+        """
+        提交任务。fn 需接受 progress_callback(frames_done, total_frames) 关键字参数。
+        返回 Job 对象。
+        """
+        job = Job(kind, filename)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        self._emit('job_update', job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict(include_result=False) for job in reversed(jobs)]
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = 'running'
+        job.started_at = time.time()
+        self._emit('job_update', job)
+
+        def progress_callback(frames_done, total_frames):
+            job.update_progress(frames_done, total_frames)
+            now = time.time()
+            if now - job._last_emit >= PROGRESS_EMIT_INTERVAL:
+                job._last_emit = now
+                self._emit('job_progress', job)
+
+        try:
+            result = fn(*args, progress_callback=progress_callback, **kwargs)
+            # 处理函数以 (dict, 状态码) 或 status=error 的形式返回失败
+            if isinstance(result, tuple):
+                result = result[0]
+            if isinstance(result, dict) and result.get('status') == 'error':
+                job.status = 'failed'
+                job.error = result.get('message', '处理失败')
+            else:
+                job.status = 'succeeded'
+                job.result = result
+                if job.total_frames:
+                    job.frames_done = job.total_frames
+                    job.eta_seconds = 0.0
+        except Exception as e:
+            print(f"任务 {job.id} 执行失败: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._emit('job_update', job)
+
+    def _prune(self):
+        """只保留最近的 max_finished 个已结束任务（调用方需持有 _lock）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _emit(event, job):
+        try:
+            socketio.emit(event, job.to_dict(include_result=job.finished), namespace=JOBS_NAMESPACE)
+        except Exception as e:
+            print(f"推送任务进度失败: {e}")
+
+
+# 全局任务队列
+job_queue = JobQueue()
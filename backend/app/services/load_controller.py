@@ -0,0 +1,255 @@
+import threading
+import time
+
+# 每种检测模式的目标帧率与单次推理延迟预算（毫秒）
+DEFAULT_MODE_BUDGETS = {
+    'object_detection': {'target_fps': 20, 'latency_budget_ms': 60},
+    'fall_detection': {'target_fps': 15, 'latency_budget_ms': 80},
+    'face_only': {'target_fps': 15, 'latency_budget_ms': 80},
+    'smoking_detection': {'target_fps': 10, 'latency_budget_ms': 120},
+    'violence_detection': {'target_fps': 10, 'latency_budget_ms': 200},
+    'face_anti_spoofing': {'target_fps': 15, 'latency_budget_ms': 80},
+}
+FALLBACK_BUDGET = {'target_fps': 15, 'latency_budget_ms': 80}
+
+# 可调节的档位（从高质量到低质量）
+IMGSZ_LEVELS = [640, 512, 416, 320]
+JPEG_QUALITY_LEVELS = [80, 70, 60, 50]
+MIN_DETECT_INTERVAL = 1
+MAX_DETECT_INTERVAL = 8
+
+# 两次调整之间的最小间隔（秒），避免来回抖动
+ADJUST_PERIOD = 1.0
+# 指数滑动平均系数
+EWMA_ALPHA = 0.2
+# 延迟低于预算的该比例、且帧率达标时才尝试升档
+UPGRADE_HEADROOM = 0.6
+# 推理（按间隔摊到每帧）+ 编码耗时占实际帧间隔的比例超过该值时，才认为帧率不足是本流处理造成的
+BOTTLENECK_RATIO = 0.8
+
+
+def _ewma(current, value):
+    return value if current is None else current + EWMA_ALPHA * (value - current)
+
+
+class AdaptiveController:
+    """
+    单路流的自适应降载控制器。
+
+    测量推理延迟与编码耗时（EWMA）、输出帧率和观看端积压（订阅者落后帧数），
+    超出预算时按 "检测间隔 -> 输入分辨率 -> JPEG质量" 的顺序逐级降档，
+    有余量时按相反顺序逐级恢复，从而把每路流维持在所属检测模式的目标帧率与延迟预算内。
+    """
+
+    def __init__(self, name, mode, base_interval=1):
+        self.name = name
+        self._lock = threading.Lock()
+        self.mode = None
+        self.set_mode(mode, base_interval)
+
+    def set_mode(self, mode, base_interval=1):
+        """切换检测模式时重置预算与档位"""
+        with self._lock:
+            if mode == self.mode:
+                return
+            self.mode = mode
+            self.base_interval = max(MIN_DETECT_INTERVAL, base_interval)
+            self.detect_interval = self.base_interval
+            self.imgsz_level = 0
+            self.jpeg_level = 0
+            self.ewma_inference_ms = None
+            self.ewma_encode_ms = None
+            self.ewma_fps = None
+            self.queue_depth = 0
+            self.last_frame_time = None
+            self.last_adjust_time = time.time()
+            self.last_decision = 'reset'
+            self.adjustments = 0
+
+    @property
+    def budget(self):
+        return load_controller.get_budget(self.mode)
+
+    @property
+    def imgsz(self):
+        return IMGSZ_LEVELS[self.imgsz_level]
+
+    @property
+    def jpeg_quality(self):
+        return JPEG_QUALITY_LEVELS[self.jpeg_level]
+
+    def should_detect(self, frame_count):
+        """当前帧是否需要执行推理"""
+        return frame_count % self.detect_interval == 0
+
+    def record_inference(self, elapsed_ms):
+        """记录一次推理耗时"""
+        with self._lock:
+            self.ewma_inference_ms = _ewma(self.ewma_inference_ms, elapsed_ms)
+
+    def record_encode(self, elapsed_ms):
+        """记录一次JPEG编码耗时"""
+        with self._lock:
+            self.ewma_encode_ms = _ewma(self.ewma_encode_ms, elapsed_ms)
+
+    def record_frame(self, queue_depth=0):
+        """
+        每输出一帧调用一次，记录帧率与观看端积压，并在需要时调整档位。
+        queue_depth 应在发布本帧之前采样，否则只要有观看者积压就至少为 1。
+        """
+        now = time.time()
+        with self._lock:
+            if self.last_frame_time is not None:
+                dt = now - self.last_frame_time
+                if dt > 0:
+                    self.ewma_fps = _ewma(self.ewma_fps, 1.0 / dt)
+            self.last_frame_time = now
+            self.queue_depth = queue_depth
+            if now - self.last_adjust_time >= ADJUST_PERIOD:
+                self.last_adjust_time = now
+                self._adjust()
+
+    def _adjust(self):
+        """根据测量值升档或降档（调用方需持有 _lock）"""
+        if self.ewma_inference_ms is None or self.ewma_fps is None:
+            return
+        budget = self.budget
+        latency_budget = budget['latency_budget_ms']
+        target_fps = budget['target_fps']
+
+        # 推理按间隔执行，摊到每帧的推理耗时不应超过单帧时间
+        amortized_ms = self.ewma_inference_ms / self.detect_interval
+        frame_budget_ms = 1000.0 / target_fps
+        # 本流每帧的处理耗时与实际帧间隔：输出帧率低于目标时，只有处理耗时占满帧间隔才是本流的瓶颈；
+        # 否则是视频源本身较慢（如 15fps 的摄像头），降档不会提高帧率
+        work_ms = amortized_ms + (self.ewma_encode_ms or 0.0)
+        frame_period_ms = 1000.0 / self.ewma_fps
+        fps_bound = self.ewma_fps < target_fps * 0.9 and work_ms >= frame_period_ms * BOTTLENECK_RATIO
+
+        overloaded = (
+            self.ewma_inference_ms > latency_budget
+            or amortized_ms > frame_budget_ms
+            or fps_bound
+            or self.queue_depth > 1
+        )
+        comfortable = (
+            self.ewma_inference_ms < latency_budget * UPGRADE_HEADROOM
+            and (self.ewma_fps >= target_fps or work_ms < frame_period_ms * UPGRADE_HEADROOM)
+            and self.queue_depth == 0
+        )
+
+        if overloaded:
+            self.last_decision = self._degrade(amortized_ms > frame_budget_ms or fps_bound)
+        elif comfortable:
+            self.last_decision = self._upgrade()
+        else:
+            self.last_decision = 'hold'
+
+    def _degrade(self, fps_bound):
+        # 帧率不足时优先拉大检测间隔；单次推理超预算时优先降低输入分辨率
+        if fps_bound and self.detect_interval < MAX_DETECT_INTERVAL:
+            self.detect_interval += 1
+            decision = f'detect_interval -> {self.detect_interval}'
+        elif self.imgsz_level < len(IMGSZ_LEVELS) - 1:
+            self.imgsz_level += 1
+            decision = f'imgsz -> {self.imgsz}'
+        elif self.detect_interval < MAX_DETECT_INTERVAL:
+            self.detect_interval += 1
+            decision = f'detect_interval -> {self.detect_interval}'
+        elif self.jpeg_level < len(JPEG_QUALITY_LEVELS) - 1:
+            self.jpeg_level += 1
+            decision = f'jpeg_quality -> {self.jpeg_quality}'
+        else:
+            return 'saturated'
+        self.adjustments += 1
+        return decision
+
+    def _upgrade(self):
+        if self.jpeg_level > 0:
+            self.jpeg_level -= 1
+            decision = f'jpeg_quality -> {self.jpeg_quality}'
+        elif self.imgsz_level > 0:
+            self.imgsz_level -= 1
+            decision = f'imgsz -> {self.imgsz}'
+        elif self.detect_interval > self.base_interval:
+            self.detect_interval -= 1
+            decision = f'detect_interval -> {self.detect_interval}'
+        else:
+            return 'hold'
+        self.adjustments += 1
+        return decision
+
+    def decisions(self):
+        """当前档位与测量值"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'mode': self.mode,
+                'budget': self.budget,
+                'detect_interval': self.detect_interval,
+                'imgsz': self.imgsz,
+                'jpeg_quality': self.jpeg_quality,
+                'ewma_inference_ms': round(self.ewma_inference_ms, 2) if self.ewma_inference_ms is not None else None,
+                'ewma_encode_ms': round(self.ewma_encode_ms, 2) if self.ewma_encode_ms is not None else None,
+                'ewma_fps': round(self.ewma_fps, 2) if self.ewma_fps is not None else None,
+                'queue_depth': self.queue_depth,
+                'last_decision': self.last_decision,
+                'adjustments': self.adjustments,
+            }
+
+
+class LoadControllerRegistry:
+    """按流名管理自适应控制器，并保存每种检测模式的预算配置"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._controllers = {}
+        self._budgets = {mode: dict(budget) for mode, budget in DEFAULT_MODE_BUDGETS.items()}
+
+    def get(self, name, mode, base_interval=1):
+        """获取（必要时创建）某路流的控制器，模式变化时自动重置"""
+        with self._lock:
+            controller = self._controllers.get(name)
+            if controller is None:
+                controller = AdaptiveController(name, mode, base_interval)
+                self._controllers[name] = controller
+                return controller
+        controller.set_mode(mode, base_interval)
+        return controller
+
+    def remove(self, name):
+        with self._lock:
+            self._controllers.pop(name, None)
+
+    def get_budget(self, mode):
+        return self._budgets.get(mode, FALLBACK_BUDGET)
+
+    def get_budgets(self):
+        return {mode: dict(budget) for mode, budget in self._budgets.items()}
+
+    def set_budget(self, mode, target_fps=None, latency_budget_ms=None):
+        """修改某检测模式的目标帧率/延迟预算，返回修改后的预算"""
+        if target_fps is not None and target_fps <= 0:
+            raise ValueError("target_fps 必须大于0")
+        if latency_budget_ms is not None and latency_budget_ms <= 0:
+            raise ValueError("latency_budget_ms 必须大于0")
+        with self._lock:
+            budget = dict(self._budgets.get(mode, FALLBACK_BUDGET))
+            if target_fps is not None:
+                budget['target_fps'] = target_fps
+            if latency_budget_ms is not None:
+                budget['latency_budget_ms'] = latency_budget_ms
+            self._budgets[mode] = budget
+            return dict(budget)
+
+    def snapshot(self):
+        with self._lock:
+            controllers = list(self._controllers.values())
+        return {
+            'budgets': self.get_budgets(),
+            'streams': {controller.name: controller.decisions() for controller in controllers},
+        }
+
+
+# 全局控制器注册表：实时摄像头与所有RTMP流共用
+load_controller = LoadControllerRegistry()
@@ -1,7 +1,11 @@
 from app import db
 from app.models.system_log import SystemLog
+from app.services.db_writer import BatchWriter
+from datetime import datetime
+import threading
 import traceback
 import logging
+import uuid
 
 # 配置基本日志
 logging.basicConfig(level=logging.INFO, 
@@ -43,66 +47,98 @@ def log_to_db(level, module, message, details=None, user_id=None):
         logger.error(traceback.format_exc())
         return None
 
-def log_with_app_context(level, module, message, details=None, user_id=None):
+# 各级别写入数据库的采样比例（1.0 表示全部写入），控制台日志不受影响
+LOG_SAMPLE_RATES = {
+    'DEBUG': 0.0,
+    'INFO': 1.0,
+    'WARNING': 1.0,
+    'ERROR': 1.0,
+    'CRITICAL': 1.0,
+}
+
+
+class DatabaseLogHandler(logging.Handler):
     """
-    使用应用上下文记录日志到数据库
-    
-    参数:
-        level: 日志级别 (INFO/WARNING/ERROR/CRITICAL)
-        module: 模块名称
-        message: 日志消息
-        details: 详细信息 (可选)
-        user_id: 操作用户ID (可选)
-    
-    返回:
-        SystemLog: 创建的日志对象
+    把日志记录写入 system_logs 表的 logging.Handler。
+
+    emit() 只做采样判断并把行数据放入后台写入队列，由写入线程在同一个长期存在的应用上下文中批量 INSERT，
+    请求线程不再访问数据库。采样按级别确定性执行（比例为 0.5 时每两条写入一条），被采样丢弃与队列满丢弃分别计数。
     """
-    try:
-        # 导入应用并创建上下文
-        from app import create_app
-        app = create_app()
-        with app.app_context():
-            return log_to_db(level, module, message, details, user_id)
-    except Exception as e:
-        logger.error(f"创建应用上下文失败: {e}")
-        logger.error(traceback.format_exc())
-        # 记录到标准日志
-        logger.log(
-            logging.INFO if level == "INFO" else
-            logging.WARNING if level == "WARNING" else
-            logging.ERROR if level == "ERROR" else
-            logging.CRITICAL,
-            f"[{module}] {message} - {details if details else ''}"
-        )
-        return None
+
+    def __init__(self, writer, sample_rates=None, level=logging.NOTSET):
+        super().__init__(level)
+        self.writer = writer
+        self.sample_rates = dict(LOG_SAMPLE_RATES if sample_rates is None else sample_rates)
+        self._seen = {}
+        self.sampled_out = {}
+        self._counter_lock = threading.Lock()
+
+    def _sample(self, level):
+        rate = self.sample_rates.get(level, 1.0)
+        if rate >= 1.0:
+            return True
+        with self._counter_lock:
+            seen = self._seen.get(level, 0) + 1
+            self._seen[level] = seen
+            keep = int(seen * rate) > int((seen - 1) * rate)
+            if not keep:
+                self.sampled_out[level] = self.sampled_out.get(level, 0) + 1
+        return keep
+
+    def emit(self, record):
+        try:
+            if not self._sample(record.levelname):
+                return
+            self.writer.submit({
+                'log_id': str(uuid.uuid4()),
+                'log_time': datetime.utcfromtimestamp(record.created),
+                'log_level': record.levelname,
+                'module': getattr(record, 'db_module', record.name)[:50],
+                'message': getattr(record, 'db_message', None) or record.getMessage(),
+                'details': getattr(record, 'details', None),
+                'user_id': getattr(record, 'user_id', None),
+            })
+        except Exception:
+            self.handleError(record)
+
+    def stats(self):
+        with self._counter_lock:
+            sampled_out = dict(self.sampled_out)
+        return dict(self.writer.stats(), sampled_out=sampled_out, sample_rates=dict(self.sample_rates))
+
+
+log_writer = BatchWriter('system_logs', SystemLog)
+db_log_handler = DatabaseLogHandler(log_writer)
+
+# 业务日志专用 logger：控制台输出沿用根 logger 的配置，同时经 db_log_handler 写入数据库
+db_logger = logging.getLogger('app.system_logs')
+db_logger.setLevel(logging.INFO)
+db_logger.addHandler(db_log_handler)
+
+
+def _log(level, module, message, details=None, user_id=None):
+    db_logger.log(level, f"[{module}] {message}",
+                  extra={'db_module': module, 'db_message': message, 'details': details, 'user_id': user_id})
 
 def log_info(module, message, details=None, user_id=None):
-    """记录INFO级别日志"""
-    # 记录到标准日志
-    logger.info(f"[{module}] {message}")
-    # 尝试记录到数据库，使用应用上下文
-    return log_with_app_context("INFO", module, message, details, user_id)
+    """记录INFO级别日志（控制台立即输出，数据库由后台线程批量写入）"""
+    _log(logging.INFO, module, message, details, user_id)
 
 def log_warning(module, message, details=None, user_id=None):
     """记录WARNING级别日志"""
-    # 记录到标准日志
-    logger.warning(f"[{module}] {message}")
-    # 尝试记录到数据库，使用应用上下文
-    return log_with_app_context("WARNING", module, message, details, user_id)
+    _log(logging.WARNING, module, message, details, user_id)
 
 def log_error(module, message, details=None, user_id=None):
     """记录ERROR级别日志"""
-    # 记录到标准日志
-    logger.error(f"[{module}] {message}")
-    # 尝试记录到数据库，使用应用上下文
-    return log_with_app_context("ERROR", module, message, details, user_id)
+    _log(logging.ERROR, module, message, details, user_id)
 
 def log_critical(module, message, details=None, user_id=None):
     """记录CRITICAL级别日志"""
-    # 记录到标准日志
-    logger.critical(f"[{module}] {message}")
-    # 尝试记录到数据库，使用应用上下文
-    return log_with_app_context("CRITICAL", module, message, details, user_id)
+    _log(logging.CRITICAL, module, message, details, user_id)
+
+def get_log_sink_stats():
+    """数据库日志写入的队列、吞吐、采样与丢弃统计"""
+    return db_log_handler.stats()
 
 def get_logs(page=1, per_page=20, level=None, module=None, start_date=None, end_date=None):
     """
@@ -0,0 +1,140 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 固定的延迟分桶上界（秒），与 Prometheus histogram 的 le 标签对应
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+STAGE_METRIC = 'vm_stage_latency_seconds'
+STAGE_HELP = 'Latency of each processing stage (capture, decode, model calls, rules, draw, encode)'
+FRAMES_METRIC = 'vm_frames_total'
+FRAMES_HELP = 'Frames emitted per stream and detection mode'
+
+
+class _Shard:
+    """
+    单个线程私有的计数分片。
+    只有所属线程会写入，因此记录时不需要加锁；读取时把所有分片合并。
+    """
+    __slots__ = ('thread', 'histograms', 'counters')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.histograms = {}  # (stage, stream, mode) -> [bucket_counts..., +Inf], sum
+        self.counters = {}    # (stream, mode) -> count
+
+
+class MetricsRegistry:
+    """按线程分片的直方图与计数器，导出为 Prometheus 文本格式"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._local = threading.local()
+        self._lock = threading.Lock()  # 只在注册新分片与导出时使用
+        self._shards = []
+        # 已退出线程的分片合并到这里，避免分片无限增长
+        self._retired = _Shard(None)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = _Shard(threading.current_thread())
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, stage, seconds, stream='camera', mode=''):
+        """记录一次阶段耗时（秒）"""
+        histograms = self._shard().histograms
+        key = (stage, stream, mode or '')
+        entry = histograms.get(key)
+        if entry is None:
+            entry = [[0] * (len(self.buckets) + 1), 0.0]
+            histograms[key] = entry
+        entry[0][bisect_left(self.buckets, seconds)] += 1
+        entry[1] += seconds
+
+    def inc_frames(self, stream='camera', mode='', amount=1):
+        counters = self._shard().counters
+        key = (stream, mode or '')
+        counters[key] = counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, stage, stream='camera', mode=''):
+        """上下文管理器：记录 with 块的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, stream, mode)
+
+    @staticmethod
+    def _merge_into(target, shard):
+        for key, (counts, total) in list(shard.histograms.items()):
+            entry = target.histograms.get(key)
+            if entry is None:
+                target.histograms[key] = [list(counts), total]
+            else:
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+        for key, value in list(shard.counters.items()):
+            target.counters[key] = target.counters.get(key, 0) + value
+
+    def collect(self):
+        """合并所有分片，返回一个汇总分片"""
+        merged = _Shard(None)
+        with self._lock:
+            alive = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                else:
+                    self._merge_into(self._retired, shard)
+            self._shards = alive
+            self._merge_into(merged, self._retired)
+            for shard in alive:
+                self._merge_into(merged, shard)
+        return merged
+
+    def summary(self):
+        """按阶段汇总的调用次数与平均耗时（毫秒），便于在接口或日志中查看"""
+        merged = self.collect()
+        result = {}
+        for (stage, stream, mode), (counts, total) in sorted(merged.histograms.items()):
+            count = sum(counts)
+            result.setdefault(stream, {}).setdefault(mode, {})[stage] = {
+                'count': count,
+                'avg_ms': round(total / count * 1000, 3) if count else 0.0,
+            }
+        return result
+
+    def render_prometheus(self):
+        """导出 Prometheus 文本格式"""
+        merged = self.collect()
+        lines = [f'# HELP {STAGE_METRIC} {STAGE_HELP}', f'# TYPE {STAGE_METRIC} histogram']
+        for (stage, stream, mode), (counts, total) in sorted(merged.histograms.items()):
+            labels = f'stage="{_escape(stage)}",stream="{_escape(stream)}",mode="{_escape(mode)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{STAGE_METRIC}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{STAGE_METRIC}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'{STAGE_METRIC}_sum{{{labels}}} {total:.6f}')
+            lines.append(f'{STAGE_METRIC}_count{{{labels}}} {cumulative}')
+
+        lines.append(f'# HELP {FRAMES_METRIC} {FRAMES_HELP}')
+        lines.append(f'# TYPE {FRAMES_METRIC} counter')
+        for (stream, mode), value in sorted(merged.counters.items()):
+            lines.append(f'{FRAMES_METRIC}{{stream="{_escape(stream)}",mode="{_escape(mode)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
@@ -0,0 +1,399 @@
+import os
+import time
+import cv2
+import numpy as np
+import tensorflow as tf
+from collections import deque
+
+from app.services import detection as detection_service
+from app.services import danger_zone as danger_zone_service
+from app.services.alerts import add_alert
+from app.services.metrics import metrics
+from app.services.violenceDetect import load_model_safely, process_frame as violence_process_frame
+from app.services.face_anti_spoofing_service import FaceAntiSpoofingService
+# --- 导入config模块以访问编辑模式状态 ---
+from app.routes import config as config_state
+
+
+class ModeContext:
+    """
+    单个视频会话的上下文，由所有模式处理器共享。
+    保存会话内的模型实例、帧计数、时间差，以及处理器请求的副作用（如告警录像）。
+    """
+
+    def __init__(self, models, smoking_model=None, stream='camera'):
+        self.models = models  # {'object': YOLO, 'face': YOLO, 'pose': YOLO}
+        self.stream = stream  # 指标中的流标识
+        self.mode = None
+        self.smoking_model = smoking_model
+        self.frame_count = 0
+        self.time_diff = 0.0
+        self.record_requested = False
+        # 由自适应控制器决定的推理输入分辨率（None 表示使用模型默认值）
+        self.imgsz = None
+
+    def timer(self, stage):
+        """记录当前流、当前模式下某个阶段的耗时"""
+        return metrics.timer(stage, self.stream, self.mode)
+
+    def infer_kwargs(self):
+        """传给 YOLO 推理调用的额外参数"""
+        return {'imgsz': self.imgsz} if self.imgsz else {}
+
+
+class ModeHandler:
+    """
+    检测模式处理器基类。
+
+    - setup(ctx):    切换到该模式时调用一次，用于加载模型等
+    - process(frame, ctx): 对需要推理的帧执行检测并直接在 frame 上绘制，返回输出帧
+    - redraw(frame, ctx):  跳帧（不推理）时调用，可用于重绘上一次的结果
+    - teardown(ctx): 切换离开该模式或会话结束时调用，用于释放资源
+    """
+    mode = None
+    # 每 N 帧执行一次推理，其余帧只调用 redraw
+    process_every_n_frames = 1
+
+    def setup(self, ctx):
+        pass
+
+    def process(self, frame, ctx):
+        return frame
+
+    def redraw(self, frame, ctx):
+        return frame
+
+    def teardown(self, ctx):
+        pass
+
+
+class AnnotationLayer:
+    """
+    处理器在一帧上绘制的标注（与绘制前画面不同的像素）。
+    跳帧时把上一次的标注原样贴回，检测框、标签等不会在不推理的帧上闪烁消失。
+    """
+
+    def __init__(self):
+        self.mask = None
+        self.pixels = None
+
+    def capture(self, before, after):
+        """比较绘制前后的画面，记录被改动的像素"""
+        if before.shape != after.shape:
+            self.mask = self.pixels = None
+            return
+        self.mask = np.any(before != after, axis=2)
+        self.pixels = after[self.mask]
+
+    def apply(self, frame):
+        if self.mask is not None and self.mask.shape == frame.shape[:2]:
+            frame[self.mask] = self.pixels
+        return frame
+
+
+# 模式名 -> 处理器类
+MODE_HANDLERS = {}
+
+
+def register_mode_handler(handler_cls):
+    """注册检测模式处理器（可作为类装饰器使用）"""
+    MODE_HANDLERS[handler_cls.mode] = handler_cls
+    return handler_cls
+
+
+def create_mode_handler(mode):
+    """根据模式名创建处理器实例，未注册的模式返回 None"""
+    handler_cls = MODE_HANDLERS.get(mode)
+    return handler_cls() if handler_cls else None
+
+
+class ModeDispatcher:
+    """
+    每帧只执行一次当前模式的处理器。
+    检测模式发生变化时自动 teardown 旧处理器并 setup 新处理器。
+    传入 controller（AdaptiveController）时，推理间隔与输入分辨率由控制器动态决定，
+    处理器的 process_every_n_frames 作为间隔下限。
+    跳帧时 ctx.time_diff 被累加，推理帧拿到的是距上一次推理的总时长，停留时间不会因跳帧而少算。
+    """
+
+    def __init__(self, ctx, controller=None):
+        self.ctx = ctx
+        self.controller = controller
+        self.mode = None
+        self.handler = None
+        self._frames_since_process = 0
+        self._pending_time = 0.0
+
+    def _switch(self, mode):
+        if self.handler is not None:
+            try:
+                self.handler.teardown(self.ctx)
+            except Exception as e:
+                print(f"模式 {self.mode} 清理失败: {e}")
+        self.mode = mode
+        self.ctx.mode = mode
+        self.handler = create_mode_handler(mode)
+        self._frames_since_process = 0
+        self._pending_time = 0.0
+        if self.controller is not None:
+            base_interval = self.handler.process_every_n_frames if self.handler is not None else 1
+            self.controller.set_mode(mode, base_interval)
+        if self.handler is not None:
+            self.handler.setup(self.ctx)
+            print(f"已切换到检测模式: {mode}")
+        else:
+            print(f"未注册的检测模式: {mode}，仅输出原始画面")
+
+    def process(self, frame, mode):
+        """处理一帧并返回输出帧"""
+        if mode != self.mode:
+            self._switch(mode)
+        if self.handler is None:
+            return frame
+
+        interval = self.handler.process_every_n_frames
+        if self.controller is not None:
+            interval = max(interval, self.controller.detect_interval)
+            self.ctx.imgsz = self.controller.imgsz
+
+        self._frames_since_process += 1
+        self._pending_time += self.ctx.time_diff
+        if self._frames_since_process >= interval:
+            self._frames_since_process = 0
+            self.ctx.time_diff, self._pending_time = self._pending_time, 0.0
+            t0 = time.time()
+            output = self.handler.process(frame, self.ctx)
+            if self.controller is not None:
+                self.controller.record_inference((time.time() - t0) * 1000)
+            return output
+        return self.handler.redraw(frame, self.ctx)
+
+    def close(self):
+        """会话结束时释放当前处理器"""
+        if self.handler is not None:
+            try:
+                self.handler.teardown(self.ctx)
+            except Exception as e:
+                print(f"模式 {self.mode} 清理失败: {e}")
+        self.handler = None
+        self.mode = None
+
+
+@register_mode_handler
+class ObjectDetectionHandler(ModeHandler):
+    mode = 'object_detection'
+
+    def setup(self, ctx):
+        self.layer = AnnotationLayer()
+
+    def process(self, frame, ctx):
+        # 先在干净的画面上追踪，避免危险区域的半透明叠加层影响检测
+        with ctx.timer('model:object'):
+            outputs = ctx.models['object'].track(frame, persist=True, **ctx.infer_kwargs())
+
+        # 使用内存中的配置快照，只有配置更新或文件 mtime 变化时才会重新加载；
+        # 同一帧内的绘制与规则判断都基于这一个版本
+        zone_config = danger_zone_service.get_config()
+        self._draw_zones(frame, ctx, zone_config)
+
+        before = frame.copy()
+        with ctx.timer('rules'):
+            detection_service.process_object_detection_results(outputs, frame, ctx.time_diff, ctx.frame_count, zone_config,
+                                                               stream=ctx.stream)
+        self.layer.capture(before, frame)
+        return frame
+
+    def redraw(self, frame, ctx):
+        # 危险区域是半透明叠加，必须在当前画面上重新混合；目标框与标签贴回上一次的结果
+        self._draw_zones(frame, ctx, danger_zone_service.get_config())
+        return self.layer.apply(frame)
+
+    @staticmethod
+    def _draw_zones(frame, ctx, zone_config):
+        # --- V3 混合驱动：仅在非编辑模式下由后端绘制危险区域 ---
+        if config_state.edit_mode:
+            return
+        with ctx.timer('draw'):
+            for zone in zone_config.zones_for(ctx.stream):
+                if len(zone.polygon) == 0:
+                    continue
+                danger_zone_pts = zone.polygon.reshape((-1, 1, 2))
+                # 使用黄色进行绘制（掩码按配置版本与分辨率缓存）
+                zone.blend_overlay(frame, (0, 255, 255), 0.4)
+                cv2.polylines(frame, [danger_zone_pts], True, (0, 255, 255), 3)
+
+
+@register_mode_handler
+class FallDetectionHandler(ModeHandler):
+    mode = 'fall_detection'
+
+    def setup(self, ctx):
+        self.layer = AnnotationLayer()
+
+    def process(self, frame, ctx):
+        with ctx.timer('model:pose'):
+            pose_results = ctx.models['pose'].track(frame, persist=True, **ctx.infer_kwargs())
+        before = frame.copy()
+        with ctx.timer('rules'):
+            detection_service.process_pose_estimation_results(pose_results, frame, ctx.time_diff, ctx.frame_count,
+                                                              stream=ctx.stream)
+        self.layer.capture(before, frame)
+        return frame
+
+    def redraw(self, frame, ctx):
+        return self.layer.apply(frame)
+
+
+@register_mode_handler
+class FaceOnlyHandler(ModeHandler):
+    mode = 'face_only'
+
+    def setup(self, ctx):
+        # 人脸识别缓存（识别结果、上次完整识别的帧号等）
+        self.state = {'face_model': ctx.models['face'], 'stream': ctx.stream}
+        self.layer = AnnotationLayer()
+
+    def process(self, frame, ctx):
+        before = frame.copy()
+        detection_service.process_faces_only(frame, ctx.frame_count, self.state)
+        self.layer.capture(before, frame)
+        return frame
+
+    def redraw(self, frame, ctx):
+        return self.layer.apply(frame)
+
+    def teardown(self, ctx):
+        self.state = {}
+
+
+@register_mode_handler
+class SmokingDetectionHandler(ModeHandler):
+    mode = 'smoking_detection'
+
+    def setup(self, ctx):
+        self.layer = AnnotationLayer()
+
+    def process(self, frame, ctx):
+        before = frame.copy()
+        with ctx.timer('model:face'):
+            face_results = ctx.models['face'].predict(frame, verbose=False, **ctx.infer_kwargs())
+        # --- 问题修复：不限制 classes，以允许检测所有类型的物体，并避免状态污染 ---
+        with ctx.timer('model:object'):
+            person_results = ctx.models['object'].track(frame, persist=True, verbose=False, **ctx.infer_kwargs())
+        with ctx.timer('rules'):
+            detection_service.process_smoking_detection_hybrid(
+                frame, person_results, face_results, ctx.smoking_model, stream=ctx.stream
+            )
+        self.layer.capture(before, frame)
+        return frame
+
+    def redraw(self, frame, ctx):
+        return self.layer.apply(frame)
+
+
+@register_mode_handler
+class ViolenceDetectionHandler(ModeHandler):
+    mode = 'violence_detection'
+    process_every_n_frames = 2  # 暴力检测模式需要连续帧
+    buffer_size = 20
+    infer_interval = 10  # 每10帧推理一次
+
+    def setup(self, ctx):
+        model_path = os.path.join(os.path.dirname(__file__), 'vd.hdf5')
+        self.violence_model = load_model_safely(model_path)
+        try:
+            vgg_model = tf.keras.applications.VGG16(include_top=True, weights='imagenet')
+        except Exception:
+            vgg_model = tf.keras.applications.VGG16(include_top=True, weights=None)
+        transfer_layer = vgg_model.get_layer('fc2')
+        self.image_model_transfer = tf.keras.models.Model(inputs=vgg_model.input, outputs=transfer_layer.output)
+        self.buffer = deque(maxlen=self.buffer_size)
+        self.status = "unknown"
+        self.prob = 0.0
+        self.last_infer_frame = -100
+
+    def process(self, frame, ctx):
+        # 处理帧并加入缓冲区
+        self.buffer.append(violence_process_frame(frame))
+        # 每N帧推理一次
+        if len(self.buffer) == self.buffer_size and (ctx.frame_count - self.last_infer_frame >= self.infer_interval):
+            self.last_infer_frame = ctx.frame_count
+            try:
+                with ctx.timer('model:vgg16'):
+                    transfer_values = self.image_model_transfer.predict(np.array(self.buffer), verbose=0)
+                with ctx.timer('model:violence'):
+                    prediction = self.violence_model.predict(np.array([transfer_values]), verbose=0)
+                self.prob = float(prediction[0][0])
+                # 状态判断
+                if self.prob <= 0.5:
+                    self.status = "safe"
+                elif self.prob <= 0.7:
+                    self.status = "caution"
+                    add_alert("caution: 检测到可能的暴力行为",
+                              event_type="violence_detection",
+                              details=f"检测到可能的暴力行为，置信度 {self.prob:.2f}",
+                              stream=ctx.stream)
+                    ctx.record_requested = True
+                else:
+                    self.status = "warning"
+                    add_alert("warning: 检测到高概率暴力行为!",
+                              event_type="violence_detection",
+                              details=f"检测到高概率暴力行为，置信度 {self.prob:.2f}",
+                              stream=ctx.stream)
+                    ctx.record_requested = True
+            except Exception as e:
+                self.status = "error"
+                self.prob = 0.0
+                print(f"暴力检测推理异常: {e}")
+        return self.redraw(frame, ctx)
+
+    def redraw(self, frame, ctx):
+        # 叠加状态到画面
+        color = (0, 255, 0) if self.status == "safe" else (0, 255, 255) if self.status == "caution" else (0, 0, 255)
+        cv2.putText(frame, f"state: {self.status}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        cv2.putText(frame, f"violenceProbability: {self.prob:.4f}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+        return frame
+
+    def teardown(self, ctx):
+        self.violence_model = None
+        self.image_model_transfer = None
+        self.buffer = deque(maxlen=self.buffer_size)
+        # For TensorFlow models, clearing the session is crucial
+        tf.keras.backend.clear_session()
+
+
+@register_mode_handler
+class FaceAntiSpoofingHandler(ModeHandler):
+    mode = 'face_anti_spoofing'
+
+    def setup(self, ctx):
+        self.service = None
+        try:
+            self.service = FaceAntiSpoofingService()
+            self.service.start_verification()
+            print("Successfully created face anti-spoofing service instance")
+        except Exception as e:
+            print(f"Failed to create face anti-spoofing service: {e}")
+
+    def process(self, frame, ctx):
+        if self.service is None:
+            cv2.putText(frame, "Face Anti-Spoofing Mode - Initialization Failed", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            return frame
+        try:
+            with ctx.timer('model:anti_spoofing'):
+                processed_frame, status, current_question = self.service.process_frame(frame)
+            # Add alerts based on status
+            if status == "success":
+                add_alert("Face anti-spoofing verification passed!", stream=ctx.stream)
+            elif status == "fail":
+                add_alert("Face anti-spoofing verification failed!", stream=ctx.stream)
+            return processed_frame
+        except Exception as e:
+            print(f"Failed to process face anti-spoofing frame: {e}")
+            cv2.putText(frame, f"Processing failed: {str(e)[:30]}", (10, 60),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            return frame
+
+    def teardown(self, ctx):
+        self.service = None
@@ -0,0 +1,324 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+# 每段之前额外处理的重叠帧数：用于让追踪器热身，并在段边界上对齐追踪ID
+OVERLAP_FRAMES = 15
+# 每段的最少帧数，视频太短时不值得拆分
+MIN_SEGMENT_FRAMES = 60
+# 段边界上认为是同一目标的最小 IoU
+MATCH_IOU = 0.5
+
+# 进程池常驻，worker 中的模型在多次上传之间保持加载
+_executor = None
+_executor_lock = threading.Lock()
+_executor_workers = 0
+
+# --- worker 进程内的全局状态 ---
+_worker_model = None
+
+
+def default_worker_count():
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _init_worker(model_path, threads_per_worker):
+    """worker 进程初始化：加载一次模型，并限制每个进程的计算线程数，避免多进程之间争抢CPU"""
+    global _worker_model
+    import torch
+    from ultralytics import YOLO
+    torch.set_num_threads(threads_per_worker)
+    cv2.setNumThreads(1)
+    _worker_model = YOLO(model_path)
+
+
+def _reset_worker_tracker():
+    """每段开始前重置追踪器，保证各段的追踪互不影响"""
+    predictor = getattr(_worker_model, 'predictor', None)
+    for tracker in getattr(predictor, 'trackers', None) or []:
+        tracker.reset()
+
+
+def _open_at(filepath, frame_index):
+    """
+    打开视频并定位到第 frame_index 帧。
+    先按帧号 seek；OpenCV 的 FFmpeg 后端对含 B 帧或可变帧率的文件 seek 不一定准确，
+    seek 后报告的位置与目标不一致时，重新打开并从头逐帧 grab 到目标位置。
+    """
+    cap = cv2.VideoCapture(filepath)
+    if frame_index == 0:
+        return cap
+    cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_index:
+        return cap
+    cap.release()
+    cap = cv2.VideoCapture(filepath)
+    for _ in range(frame_index):
+        if not cap.grab():
+            break
+    return cap
+
+
+def _track_segment(filepath, read_start, end, imgsz=None):
+    """
+    worker 进程：对 [read_start, end) 帧执行目标追踪，只做推理不做绘制。
+
+    返回:
+        (read_start, [每帧的追踪结果 ndarray(N, 7): x1, y1, x2, y2, track_id, conf, cls], 耗时秒数)
+    """
+    t0 = time.time()
+    _reset_worker_tracker()
+    cap = _open_at(filepath, read_start)
+    kwargs = {'persist': True, 'verbose': False}
+    if imgsz:
+        kwargs['imgsz'] = imgsz
+    tracks = []
+    try:
+        for _ in range(read_start, end):
+            ret, frame = cap.read()
+            if not ret:
+                break
+            results = _worker_model.track(frame, **kwargs)
+            boxes = results[0].boxes
+            if boxes is not None and boxes.id is not None:
+                tracks.append(boxes.data.cpu().numpy().astype(np.float32))
+            else:
+                tracks.append(np.zeros((0, 7), dtype=np.float32))
+    finally:
+        cap.release()
+    return read_start, tracks, time.time() - t0
+
+
+def _get_executor(workers, model_path):
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+            # 使用 spawn，避免在已加载 torch/TensorFlow 的 Flask 进程中 fork
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(model_path, threads_per_worker)
+            )
+            _executor_workers = workers
+        return _executor
+
+
+def plan_segments(total_frames, workers, overlap=OVERLAP_FRAMES, min_segment_frames=MIN_SEGMENT_FRAMES):
+    """
+    把视频均分为若干段。
+
+    返回:
+        [(read_start, start, end), ...]：worker 从 read_start 开始读取（含重叠帧），
+        结果中只有 [start, end) 属于本段
+    """
+    if total_frames <= 0:
+        return []
+    count = max(1, min(workers, total_frames // min_segment_frames))
+    bounds = np.linspace(0, total_frames, count + 1).astype(int)
+    segments = []
+    for i in range(count):
+        start, end = int(bounds[i]), int(bounds[i + 1])
+        read_start = max(0, start - overlap) if i > 0 else 0
+        segments.append((read_start, start, end))
+    return segments
+
+
+def _iou_matrix(a, b):
+    """a: (N, 4), b: (M, 4) 的 xyxy 框两两 IoU"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def reconcile_track_ids(segment_results, segments):
+    """
+    把各段的局部追踪ID统一为全局ID，并拼接成按帧号排列的结果。
+
+    第一段的ID保持不变；之后每段在重叠帧上与上一段（已映射为全局ID）的同类框做 IoU 匹配，
+    按多数投票把局部ID映射到全局ID，未匹配的局部ID分配新的全局ID。
+    """
+    frames = []
+    next_id = 1
+    for index, ((read_start, start, end), tracks) in enumerate(zip(segments, segment_results)):
+        overlap = start - read_start
+        # worker 提前读到文件末尾时补齐空结果，保证帧号对齐
+        expected = end - read_start
+        if len(tracks) < expected:
+            tracks = list(tracks) + [np.zeros((0, 7), dtype=np.float32)] * (expected - len(tracks))
+        if index == 0:
+            for det in tracks:
+                if len(det):
+                    next_id = max(next_id, int(det[:, 4].max()) + 1)
+            frames.extend(tracks[:end - start])
+            continue
+
+        # 在重叠帧上投票
+        votes = {}
+        for offset in range(min(overlap, len(tracks))):
+            previous = frames[read_start + offset] if read_start + offset < len(frames) else None
+            current = tracks[offset]
+            if previous is None or len(previous) == 0 or len(current) == 0:
+                continue
+            iou = _iou_matrix(current[:, :4], previous[:, :4])
+            # 只在同类目标之间匹配
+            iou[current[:, 6][:, None] != previous[:, 6][None, :]] = 0
+            while iou.size and iou.max() >= MATCH_IOU:
+                i, j = np.unravel_index(np.argmax(iou), iou.shape)
+                local_id, global_id = int(current[i, 4]), int(previous[j, 4])
+                votes.setdefault(local_id, {}).setdefault(global_id, 0)
+                votes[local_id][global_id] += 1
+                iou[i, :] = 0
+                iou[:, j] = 0
+
+        # 每个全局ID只分配给得票最多的一个局部ID
+        mapping = {}
+        claimed = set()
+        candidates = sorted(
+            ((count, local_id, global_id) for local_id, counter in votes.items() for global_id, count in counter.items()),
+            reverse=True
+        )
+        for count, local_id, global_id in candidates:
+            if local_id in mapping or global_id in claimed:
+                continue
+            mapping[local_id] = global_id
+            claimed.add(global_id)
+
+        for det in tracks[overlap:overlap + (end - start)]:
+            if len(det):
+                det = det.copy()
+                for row in det:
+                    local_id = int(row[4])
+                    if local_id not in mapping:
+                        mapping[local_id] = next_id
+                        next_id += 1
+                    row[4] = mapping[local_id]
+            frames.append(det)
+    return frames
+
+
+def process_video_parallel(filepath, uploads_dir, workers=None, imgsz=None, progress_callback=None):
+    """
+    多进程分段处理视频（目标检测模式）。
+
+    1. 按帧号把视频均分为若干段（每段带 OVERLAP_FRAMES 重叠帧），提交到常驻进程池，
+       每个 worker 持有已加载的模型和自己的追踪器，只做解码与推理（seek 不准确时 worker 回退为从头逐帧读取）
+    2. 在主进程中按顺序对齐各段边界上的追踪ID
+    3. 顺序解码一遍原视频，按帧执行危险区域规则、绘制并写出，告警按帧序产生
+
+    progress_callback(已完成帧数, 总帧数) 在推理阶段按段汇报，渲染阶段按帧汇报（两阶段各占一半进度）。
+    返回值与 process_video 相同。
+    """
+    from ultralytics.engine.results import Results
+    import torch
+    from app.services import detection as detection_service
+    from app.services import danger_zone as danger_zone_service
+    from app.services.alerts import reset_alerts, get_alerts, update_detection_time
+
+    workers = workers or default_worker_count()
+    reset_alerts(detection_service.UPLOAD_STREAM)
+
+    output_filename = 'processed_' + os.path.basename(filepath)
+    output_path = os.path.join(uploads_dir, output_filename)
+    print(f"并行处理视频: {filepath}")
+
+    cap = cv2.VideoCapture(filepath)
+    if not cap.isOpened():
+        return {"status": "error", "message": "Failed to open video"}, 500
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    out = None
+    try:
+        segments = plan_segments(total_frames, workers)
+        print(f"总帧数: {total_frames}，分为 {len(segments)} 段，worker 数: {workers}")
+
+        # --- 阶段1：并行推理 ---
+        t0 = time.time()
+        executor = _get_executor(workers, detection_service.OBJECT_MODEL_PATH)
+        futures = [executor.submit(_track_segment, filepath, read_start, end, imgsz)
+                   for read_start, _, end in segments]
+        segment_results = []
+        inferred = 0
+        try:
+            for future in futures:
+                _, tracks, elapsed = future.result()
+                segment_results.append(tracks)
+                inferred += len(tracks)
+                print(f"分段推理完成: {len(tracks)} 帧，耗时 {elapsed:.1f}s")
+                if progress_callback is not None:
+                    progress_callback(min(inferred, total_frames), total_frames * 2)
+        except Exception:
+            # 某段失败时取消尚未开始的其余段，不再占用进程池
+            for future in futures:
+                future.cancel()
+            raise
+        print(f"并行推理总耗时: {time.time() - t0:.1f}s")
+
+        # --- 阶段2：对齐段边界上的追踪ID ---
+        frame_tracks = reconcile_track_ids(segment_results, segments)
+        object_model = detection_service.model_pool.get_shared('object')
+        names = object_model.names
+        # 对齐后的追踪结果就是完整的检测索引，保存后修改危险区域可直接重放规则
+        index_writer = detection_service.create_index_writer(
+            filepath, 'object_detection', object_model, fps, frame_width, frame_height
+        )
+        if index_writer is not None:
+            for det in frame_tracks:
+                index_writer.add_rows(det)
+            detection_service.commit_index_writer(index_writer)
+
+        # --- 阶段3：顺序执行规则、绘制与写出 ---
+        zone_config = danger_zone_service.get_config()
+        out, output_filename = detection_service.create_video_writer(
+            output_path, output_filename, fps, frame_width, frame_height
+        )
+        # 按视频时间累计停留时间，而不是按处理耗时
+        time_diff = 1.0 / fps if fps and fps > 0 else 1.0 / 30
+
+        frame_count = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            det = frame_tracks[frame_count] if frame_count < len(frame_tracks) else np.zeros((0, 7), dtype=np.float32)
+            frame_count += 1
+            update_detection_time(detection_service.UPLOAD_STREAM, time_diff)
+
+            detection_service.draw_danger_zone_overlay(frame, zone_config)
+            results = [Results(orig_img=frame, path=filepath, names=names, boxes=torch.as_tensor(det))]
+            detection_service.process_object_detection_results(results, frame, time_diff, frame_count, zone_config,
+                                                               stream=detection_service.UPLOAD_STREAM)
+            out.write(frame)
+            if progress_callback is not None and frame_count % 10 == 0:
+                progress_callback(total_frames + frame_count, total_frames * 2)
+    finally:
+        cap.release()
+        if out is not None:
+            out.release()
+
+    output_url = f"/api/files/{output_filename}"
+    print(f"并行视频处理完成，输出URL: {output_url}，总耗时: {time.time() - t0:.1f}s")
+    return {
+        "status": "success",
+        "media_type": "video",
+        "file_url": output_url,
+        "alerts": get_alerts(detection_service.UPLOAD_STREAM)
+    }
@@ -2,13 +2,18 @@ import cv2
 import uuid
 import threading
 import time
-import queue
 import os
 from datetime import datetime
 from typing import Dict, List, Optional
 from app import socketio
-from app.services.danger_zone import DANGER_ZONE
-from ultralytics import YOLO
+from app.services import danger_zone as danger_zone_service
+from app.services.alerts import (
+    add_alert, evaluate_target_zones, update_detection_time, reset_stream_state, drop_stream_state
+)
+from app.services.frame_broadcast import broadcast_hub
+from app.services.load_controller import load_controller
+from app.services.batch_inference import BatchInferenceService
+from app.services.metrics import metrics
 import numpy as np
 import base64
 
@@ -17,21 +22,22 @@ class RTMPStreamManager:
         self.streams: Dict[str, dict] = {}
         self.active_captures: Dict[str, cv2.VideoCapture] = {}
         self.processing_threads: Dict[str, threading.Thread] = {}
-        self.frame_queues: Dict[str, queue.Queue] = {}
         self.stop_events: Dict[str, threading.Event] = {}
         
+        # 每路流从模型池借出的会话实例（共享权重，独立追踪器状态）
+        self.stream_models: Dict[str, dict] = {}
+        
         # 初始化AI模型
         try:
-            from ultralytics import YOLO
             from app.services.dlib_service import dlib_face_service
+            from app.services.detection import model_pool
             
-            # 模型路径
-            BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
-            MODEL_DIR = os.path.join(BASE_PATH, 'yolo-Weights')
-            
-            print(f"模型目录: {MODEL_DIR}")
+            self.model_pool = model_pool
+            # 跨流批量推理：所有流的目标检测帧合并为一个 batch 做前向推理
+            self.batch_service = BatchInferenceService(model_pool, 'object')
+            print(f"模型目录: {os.path.dirname(model_pool.model_paths['object'])}")
             
-            # 加载模型
+            # 共享模型（只读，用于查询类别名等）；推理使用每路流自己的会话实例
             self.models = {
                 'object': None,
                 'face': None,
@@ -39,20 +45,18 @@ class RTMPStreamManager:
             }
             
             # 尝试加载目标检测模型
-            object_model_path = os.path.join(MODEL_DIR, "yolov8n.pt")
-            if os.path.exists(object_model_path):
-                self.models['object'] = YOLO(object_model_path)
+            if os.path.exists(model_pool.model_paths['object']):
+                self.models['object'] = model_pool.get_shared('object')
                 print("✅ 目标检测模型加载成功")
             else:
-                print(f"❌ 目标检测模型文件不存在: {object_model_path}")
+                print(f"❌ 目标检测模型文件不存在: {model_pool.model_paths['object']}")
             
             # 尝试加载人脸检测模型
-            face_model_path = os.path.join(MODEL_DIR, "yolov8n-face-lindevs.pt")
-            if os.path.exists(face_model_path):
-                self.models['face'] = YOLO(face_model_path)
+            if os.path.exists(model_pool.model_paths['face']):
+                self.models['face'] = model_pool.get_shared('face')
                 print("✅ 人脸检测模型加载成功")
             else:
-                print(f"❌ 人脸检测模型文件不存在: {face_model_path}")
+                print(f"❌ 人脸检测模型文件不存在: {model_pool.model_paths['face']}")
             
             # 初始化Dlib服务
             self.dlib_service = dlib_face_service
@@ -60,6 +64,8 @@ class RTMPStreamManager:
             
         except Exception as e:
             print(f"❌ RTMP AI模型加载失败: {e}")
+            self.model_pool = None
+            self.batch_service = None
             self.models = {'object': None, 'face': None, 'pose': None}
             self.dlib_service = None
     
@@ -136,7 +142,12 @@ class RTMPStreamManager:
         cap.set(cv2.CAP_PROP_BUFFERSIZE, 3)
         
         self.active_captures[stream_id] = cap
-        self.frame_queues[stream_id] = queue.Queue(maxsize=10)
+        if self.model_pool is not None:
+            loaded = tuple(name for name, model in self.models.items() if model is not None)
+            self.stream_models[stream_id] = self.model_pool.acquire_session(loaded)
+        if self.batch_service is not None and self.models.get('object') is not None \
+                and 'object_detection' in stream_config['detection_modes']:
+            self.batch_service.register_stream(stream_id)
         self.stop_events[stream_id] = threading.Event()
         
         # 启动处理线程
@@ -173,8 +184,15 @@ class RTMPStreamManager:
             self.active_captures[stream_id].release()
             del self.active_captures[stream_id]
         
-        if stream_id in self.frame_queues:
-            del self.frame_queues[stream_id]
+        # 关闭广播通道，所有观看者的生成器随之结束
+        broadcast_hub.close_channel(self.channel_key(stream_id))
+        
+        if self.batch_service is not None:
+            self.batch_service.unregister_stream(stream_id)
+        
+        # 归还模型会话实例
+        if stream_id in self.stream_models:
+            self.model_pool.release_session(self.stream_models.pop(stream_id))
         
         if stream_id in self.stop_events:
             del self.stop_events[stream_id]
@@ -198,23 +216,37 @@ class RTMPStreamManager:
         """获取所有流的信息"""
         return list(self.streams.values())
     
-    def get_stream_frames(self, stream_id: str):
-        """获取流的帧数据（生成器）"""
-        if stream_id not in self.frame_queues:
+    @staticmethod
+    def channel_key(stream_id: str) -> str:
+        """流在广播中心中的通道名"""
+        return f"rtmp:{stream_id}"
+    
+    def get_stream_frames(self, stream_id: str, mode: str = 'latest'):
+        """
+        获取流的帧数据（生成器）。
+        每个调用方都是广播通道的一个独立订阅者，多个观看者之间不再互相抢帧；
+        mode='latest' 跟不上时跳到最新帧，mode='every' 尽量逐帧接收。
+        """
+        if stream_id not in self.active_captures:
             raise Exception("流未激活")
         
-        frame_queue = self.frame_queues[stream_id]
-        
-        while stream_id in self.active_captures:
-            try:
-                # 从队列获取帧数据
-                frame_data = frame_queue.get(timeout=1)
+        subscriber = broadcast_hub.subscribe(self.channel_key(stream_id), mode=mode, name=stream_id)
+        try:
+            for frame_data in subscriber.frames(timeout=1.0):
+                if stream_id not in self.active_captures:
+                    break
                 yield frame_data
-            except queue.Empty:
-                continue
-            except Exception as e:
-                print(f"获取帧数据错误: {e}")
-                break
+        except Exception as e:
+            print(f"获取帧数据错误: {e}")
+        finally:
+            subscriber.close()
+    
+    def get_broadcast_stats(self, stream_id: Optional[str] = None) -> dict:
+        """获取广播通道及每个观看者的延迟统计"""
+        stats = broadcast_hub.stats()
+        if stream_id is not None:
+            return stats.get(self.channel_key(stream_id), {})
+        return stats
     
     def _validate_rtmp_url(self, rtmp_url: str) -> bool:
         """验证RTMP URL的有效性"""
@@ -229,36 +261,61 @@ class RTMPStreamManager:
     def _process_stream(self, stream_id: str):
         """处理单个RTMP流的主循环"""
         cap = self.active_captures[stream_id]
-        frame_queue = self.frame_queues[stream_id]
+        channel_key = self.channel_key(stream_id)
         stop_event = self.stop_events[stream_id]
         stream_config = self.streams[stream_id]
         
         frame_count = 0
-        last_detection_time = time.time()
+        # 本流独立的目标状态表与检测时钟，流之间的追踪ID互不冲突
+        reset_stream_state(channel_key)
+        
+        # 自适应控制器：按本流主检测模式的预算调整检测间隔、输入分辨率和JPEG质量，
+        # 多路流共享一台主机时各自降载，而不是一起变慢
+        detection_modes = stream_config['detection_modes']
+        controller = load_controller.get(channel_key, detection_modes[0] if detection_modes else None)
+        # 指标标签：流标识与检测模式组合
+        metrics_mode = '+'.join(detection_modes)
         
         try:
             while not stop_event.is_set():
-                ret, frame = cap.read()
+                loop_start = time.time()
+                # grab 与 retrieve 分开计时，分别对应采集（拉流）与解码
+                t0 = time.perf_counter()
+                ret = cap.grab()
+                t1 = time.perf_counter()
+                frame = None
+                if ret:
+                    ret, frame = cap.retrieve()
                 if not ret:
                     print(f"流 {stream_id} 读取帧失败")
                     break
+                metrics.observe('capture', t1 - t0, channel_key, metrics_mode)
+                metrics.observe('decode', time.perf_counter() - t1, channel_key, metrics_mode)
                 
                 frame_count += 1
-                current_time = time.time()
                 
                 # 创建用于显示的帧副本
                 display_frame = frame.copy()
                 
-                # 每隔几帧进行一次AI检测
-                if frame_count % 5 == 0:  # 每5帧检测一次
+                # 由控制器决定本帧是否进行AI检测
+                if controller.should_detect(frame_count):
                     try:
+                        # 本轮检测与绘制使用同一个危险区域配置快照
+                        zone_config = danger_zone_service.get_config()
+                        
                         # 执行AI检测
+                        t0 = time.time()
                         detection_results = self._perform_detection(
-                            frame, stream_config['detection_modes']
+                            frame, detection_modes, self.stream_models.get(stream_id), zone_config,
+                            imgsz=controller.imgsz, time_diff=update_detection_time(channel_key),
+                            stream_id=stream_id
                         )
+                        controller.record_inference((time.time() - t0) * 1000)
                         
                         # 在显示帧上绘制检测结果
-                        self._draw_detection_results(display_frame, detection_results, stream_config['detection_modes'])
+                        with metrics.timer('draw', channel_key, metrics_mode):
+                            self._draw_detection_results(display_frame, detection_results, detection_modes, zone_config,
+                                                         stream_id=stream_id)
                         
                         # 通过WebSocket发送检测结果
                         socketio.emit('detection_result', {
@@ -268,125 +325,148 @@ class RTMPStreamManager:
                             'alerts': detection_results['alerts']
                         }, namespace='/rtmp', room=stream_id)
                         
-                        last_detection_time = current_time
-                        
                     except Exception as e:
                         print(f"检测处理错误: {e}")
                 
                 # 编码帧为JPEG（使用带检测结果的显示帧）
+                # 每帧只编码一次并发布到广播通道，观看者数量增加不会增加编码开销
+                # 积压在发布前采样：发布后只要有观看者就至少为 1
+                backlog = broadcast_hub.backlog(channel_key)
                 try:
-                    _, buffer = cv2.imencode('.jpg', display_frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                    frame_data = buffer.tobytes()
-                    
-                    # 将帧数据放入队列
-                    if not frame_queue.full():
-                        frame_queue.put(frame_data)
-                    else:
-                        # 队列满时，移除旧帧
-                        try:
-                            frame_queue.get_nowait()
-                            frame_queue.put(frame_data)
-                        except queue.Empty:
-                            pass
-                            
+                    t0 = time.perf_counter()
+                    with metrics.timer('encode', channel_key, metrics_mode):
+                        _, buffer = cv2.imencode('.jpg', display_frame, [cv2.IMWRITE_JPEG_QUALITY, controller.jpeg_quality])
+                    controller.record_encode((time.perf_counter() - t0) * 1000)
+                    broadcast_hub.publish(channel_key, buffer.tobytes())
+                    metrics.inc_frames(channel_key, metrics_mode)
                 except Exception as e:
                     print(f"帧编码错误: {e}")
                 
+                controller.record_frame(backlog)
+                
                 # 更新活动时间
                 self.streams[stream_id]['last_activity'] = datetime.now().isoformat()
                 
-                # 控制帧率
-                time.sleep(0.033)  # 约30fps
+                # 控制帧率：按目标帧率补足剩余的帧时间，而不是固定休眠
+                frame_time = 1.0 / controller.budget['target_fps']
+                remaining = frame_time - (time.time() - loop_start)
+                if remaining > 0:
+                    time.sleep(remaining)
                 
         except Exception as e:
             print(f"流处理错误 {stream_id}: {e}")
         finally:
+            load_controller.remove(channel_key)
+            drop_stream_state(channel_key)
             # 更新流状态
             if stream_id in self.streams:
                 self.streams[stream_id]['status'] = 'error'
     
-    def _perform_detection(self, frame, detection_modes):
-        """执行AI检测"""
+    def _perform_detection(self, frame, detection_modes, models=None, zone_config=None, imgsz=None, time_diff=0.2,
+                           stream_id=None):
+        """
+        执行AI检测（models 为该流的会话模型实例，追踪器状态不与其他流共享）。
+        imgsz 为推理输入分辨率（None 使用模型默认值），time_diff 为距上次检测的秒数，用于累计停留时间。
+        传入 stream_id 且该流已注册到批量推理服务时，目标检测与其他流合批推理，追踪仍按流独立关联。
+        """
+        infer_kwargs = {'imgsz': imgsz} if imgsz else {}
+        metrics_stream = self.channel_key(stream_id) if stream_id is not None else 'rtmp'
+        metrics_mode = '+'.join(detection_modes)
         results = {
             'detections': [],
             'alerts': []
         }
+        models = models or {}
+        zone_config = zone_config or danger_zone_service.get_config()
         
         try:
             # 目标检测
-            if 'object_detection' in detection_modes and self.models['object'] is not None:
-                object_results = self.models['object'].track(frame, persist=True)  # 使用track而不是predict
+            if 'object_detection' in detection_modes and models.get('object') is not None:
+                with metrics.timer('model:object', metrics_stream, metrics_mode):
+                    if self.batch_service is not None and stream_id is not None and self.batch_service.has_stream(stream_id):
+                        object_results = [self.batch_service.submit(stream_id, frame, imgsz=imgsz)]
+                    else:
+                        object_results = models['object'].track(frame, persist=True, **infer_kwargs)  # 使用track而不是predict
+                rules_start = time.perf_counter()
                 for result in object_results:
                     boxes = result.boxes
                     if boxes is not None and hasattr(boxes, 'id') and boxes.id is not None:
-                        # 处理有追踪ID的检测结果
-                        for i, box in enumerate(boxes):
-                            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                            conf = box.conf[0].cpu().numpy()
-                            cls = int(box.cls[0].cpu().numpy())
-                            track_id = int(boxes.id[i].cpu().numpy())
-                            class_name = self.models['object'].names[cls]
+                        # 处理有追踪ID的检测结果：一次取出全部框，只保留人员（class 0）
+                        xyxy = boxes.xyxy.cpu().numpy()
+                        confs = boxes.conf.cpu().numpy()
+                        classes = boxes.cls.int().cpu().numpy()
+                        track_ids = boxes.id.int().cpu().numpy()
+                        person_rows = np.flatnonzero(classes == 0)
+                        # 批量计算所有人员底部中心点与该流各区域的关系（网格预筛选 + 栅格查表）
+                        foot_points = np.stack([((xyxy[person_rows, 0] + xyxy[person_rows, 2]) / 2).astype(int),
+                                                xyxy[person_rows, 3].astype(int)], axis=1)
+                        zone_set = zone_config.zone_set(metrics_stream)
+                        hits_by_target = zone_set.query(foot_points, frame.shape[:2]).by_point(len(foot_points))
+                        for index, row in enumerate(person_rows):
+                            x1, y1, x2, y2 = xyxy[row]
+                            conf = confs[row]
+                            track_id = int(track_ids[row])
+                            class_name = self.models['object'].names[int(classes[row])]
                             
-                            # 只处理人员检测（class 0）
-                            if cls == 0:  # person class
-                                # 计算目标的底部中心点
-                                foot_point = (int((x1 + x2) / 2), int(y2))
-                                
-                                # 检查是否在危险区域内
-                                in_danger_zone = self._is_in_danger_zone_advanced(foot_point)
-                                
-                                # 计算到危险区域的距离
-                                distance = self._calculate_distance_to_danger_zone(foot_point)
-                                
-                                # 确定告警状态
-                                alert_status = None
-                                color_status = 'green'  # 默认绿色
-                                
-                                if in_danger_zone:
-                                    # 更新停留时间
-                                    loitering_time = update_loitering_time(track_id, 0.2)  # 假设每次检测间隔0.2秒
-                                    
-                                    if loitering_time >= danger_zone_service.LOITERING_THRESHOLD:
-                                        color_status = 'red'
-                                        alert_status = f"人员 ID:{track_id} 在危险区域停留 {loitering_time:.1f} 秒"
-                                        results['alerts'].append(alert_status)
-                                        
-                                        # 添加告警
-                                        add_alert(alert_status,
-                                                 event_type="danger_zone_intrusion",
-                                                 details=f"人员在危险区域停留 {loitering_time:.1f} 秒")
-                                    else:
-                                        color_status = 'orange'
+                            # 更新各区域内的停留时间（检测间隔由控制器动态调整，按实际时间累计）
+                            zone, in_danger_zone, distance, loitering_time, events = evaluate_target_zones(
+                                track_id, hits_by_target[index], time_diff, metrics_stream
+                            )
+                            zone = zone or zone_set.zones[0]
+                            
+                            # 确定告警状态
+                            color_status = 'green'  # 默认绿色
+                            if in_danger_zone:
+                                color_status = 'red' if loitering_time >= zone.loitering_threshold else 'orange'
+                            elif distance < zone.safety_distance:
+                                color_status = 'yellow'
+                            
+                            # 告警经过闸门去重，只有放行的告警才通过WebSocket推送
+                            for event, event_zone, value in events:
+                                zone_label = self._zone_label(event_zone)
+                                if event == 'intrusion':
+                                    alert_status = f"人员 ID:{track_id} 在{zone_label}停留 {value:.1f} 秒"
+                                    alert = add_alert(alert_status,
+                                                      event_type="danger_zone_intrusion",
+                                                      details=f"人员在{zone_label}停留 {value:.1f} 秒",
+                                                      stream=metrics_stream, track_id=track_id, zone=event_zone.name)
                                 else:
-                                    # 重置停留时间
-                                    reset_loitering_time(track_id)
-                                    
-                                    # 检查是否接近危险区域
-                                    if distance < danger_zone_service.SAFETY_DISTANCE:
-                                        color_status = 'yellow'
-                                        alert_status = f"人员 ID:{track_id} 过于接近危险区域，距离 {distance:.1f} 像素"
-                                        results['alerts'].append(alert_status)
-                                        
-                                        # 添加告警
-                                        add_alert(alert_status,
-                                                 event_type="proximity_warning",
-                                                 details=f"人员过于接近危险区域，距离 {distance:.1f} 像素")
-                                
-                                results['detections'].append({
-                                    'type': 'object',
-                                    'class': class_name,
-                                    'confidence': float(conf),
-                                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                                    'track_id': track_id,
-                                    'in_danger_zone': in_danger_zone,
-                                    'distance_to_danger': distance,
-                                    'color_status': color_status,
-                                    'loitering_time': get_loitering_time(track_id) if in_danger_zone else 0
-                                })
+                                    alert_status = f"人员 ID:{track_id} 过于接近{zone_label}，距离 {value:.1f} 像素"
+                                    alert = add_alert(alert_status,
+                                                      event_type="proximity_warning",
+                                                      details=f"人员过于接近{zone_label}，距离 {value:.1f} 像素",
+                                                      stream=metrics_stream, track_id=track_id, zone=event_zone.name)
+                                if alert is not None:
+                                    results['alerts'].append(alert_status)
+                            
+                            # 区域外且距离小于安全距离2倍时需要绘制距离线，此时才计算区域边缘上的最近点
+                            nearest_point = None
+                            if not in_danger_zone and distance < zone.safety_distance * 2:
+                                _, nearest_points = zone.geometry.nearest(foot_points[index:index + 1])
+                                nearest_point = [int(v) for v in nearest_points[0]]
+                            
+                            results['detections'].append({
+                                'type': 'object',
+                                'class': class_name,
+                                'confidence': float(conf),
+                                'bbox': [int(x1), int(y1), int(x2), int(y2)],
+                                'track_id': track_id,
+                                'in_danger_zone': in_danger_zone,
+                                # 远离所有区域（网格预筛选未命中）时距离为 inf，JSON 无法表示，输出 None
+                                'distance_to_danger': float(distance) if np.isfinite(distance) else None,
+                                'nearest_point': nearest_point,
+                                'zone': zone.name,
+                                'safety_distance': zone.safety_distance,
+                                'loitering_threshold': zone.loitering_threshold,
+                                'color_status': color_status,
+                                'loitering_time': loitering_time if in_danger_zone else 0
+                            })
+                metrics.observe('rules', time.perf_counter() - rules_start, metrics_stream, metrics_mode)
             
             # 人脸检测和识别（保持原有逻辑）
-            if 'face_only' in detection_modes and self.models['face'] is not None:
-                face_results = self.models['face'](frame)
+            if 'face_only' in detection_modes and models.get('face') is not None:
+                with metrics.timer('model:face', metrics_stream, metrics_mode):
+                    face_results = models['face'](frame, **infer_kwargs)
                 
                 # 收集所有检测到的人脸边界框
                 face_boxes = []
@@ -405,7 +485,8 @@ class RTMPStreamManager:
                 if self.dlib_service is not None and len(face_boxes) > 0:
                     try:
                         # 调用正确的方法名和参数格式
-                        recognition_results = self.dlib_service.identify_faces(frame, face_boxes)
+                        with metrics.timer('recognition:dlib', metrics_stream, metrics_mode):
+                            recognition_results = self.dlib_service.identify_faces(frame, face_boxes)
                         
                         # 处理识别结果
                         for i, (name, box) in enumerate(recognition_results):
@@ -443,11 +524,12 @@ class RTMPStreamManager:
         
         return results
 
-    def _draw_detection_results(self, frame, detection_results, detection_modes):
+    def _draw_detection_results(self, frame, detection_results, detection_modes, zone_config=None, stream_id=None):
         """在帧上绘制检测结果"""
+        zone_config = zone_config or danger_zone_service.get_config()
         try:
-            # 首先绘制危险区域
-            self._draw_danger_zone(frame)
+            # 首先绘制该流的危险区域
+            self._draw_danger_zone(frame, zone_config, stream_id)
             
             for detection in detection_results['detections']:
                 bbox = detection['bbox']
@@ -475,9 +557,11 @@ class RTMPStreamManager:
                     
                     # 准备标签文本
                     label = f"ID:{detection.get('track_id', 'N/A')} {detection['class']}"
+                    safety_distance = detection.get('safety_distance', zone_config.safety_distance)
+                    loitering_threshold = detection.get('loitering_threshold', zone_config.loitering_threshold)
                     if detection['in_danger_zone']:
                         label += f" 停留:{detection['loitering_time']:.1f}s"
-                    elif detection['distance_to_danger'] < danger_zone_service.SAFETY_DISTANCE:
+                    elif detection['distance_to_danger'] is not None and detection['distance_to_danger'] < safety_distance:
                         label += f" 距离:{detection['distance_to_danger']:.1f}px"
                     
                     # 绘制标签
@@ -490,11 +574,13 @@ class RTMPStreamManager:
                     cv2.circle(frame, foot_point, 5, color, -1)
                     
                     # 如果接近但不在危险区域内，绘制连接线
-                    if not detection['in_danger_zone'] and detection['distance_to_danger'] < danger_zone_service.SAFETY_DISTANCE * 2:
-                        self._draw_distance_line(frame, foot_point, detection['distance_to_danger'])
+                    if (not detection['in_danger_zone'] and detection['distance_to_danger'] is not None
+                            and detection['distance_to_danger'] < safety_distance * 2):
+                        self._draw_distance_line(frame, foot_point, detection['distance_to_danger'], zone_config,
+                                                 detection.get('nearest_point'))
                     
                     # 如果在危险区域且停留时间超过阈值，绘制警告标记
-                    if detection['in_danger_zone'] and detection['loitering_time'] >= danger_zone_service.LOITERING_THRESHOLD:
+                    if detection['in_danger_zone'] and detection['loitering_time'] >= loitering_threshold:
                         self._draw_warning_triangle(frame, x1, y1, x2, y2)
                 
                 elif detection['type'] == 'face':
@@ -518,25 +604,24 @@ class RTMPStreamManager:
         except Exception as e:
             print(f"绘制检测结果错误: {e}")
     
-    def _draw_danger_zone(self, frame):
-        """绘制危险区域"""
+    def _draw_danger_zone(self, frame, zone_config=None, stream_id=None):
+        """绘制该流的全部危险区域"""
+        zone_config = zone_config or danger_zone_service.get_config()
+        stream = self.channel_key(stream_id) if stream_id is not None else 'rtmp'
         try:
-            if len(danger_zone_service.DANGER_ZONE) > 0:
-                # 绘制危险区域多边形
-                danger_zone_pts = np.array(danger_zone_service.DANGER_ZONE, dtype=np.int32).reshape((-1, 1, 2))
-                
-                # 绘制半透明填充
-                overlay = frame.copy()
-                cv2.fillPoly(overlay, [danger_zone_pts], (0, 0, 255))  # 红色填充
-                cv2.addWeighted(overlay, 0.3, frame, 0.7, 0, frame)
+            for zone in zone_config.zones_for(stream):
+                if len(zone.polygon) == 0:
+                    continue
+                # 绘制半透明填充（掩码按配置版本与分辨率缓存）
+                zone.blend_overlay(frame, (0, 0, 255), 0.3)  # 红色填充
                 
                 # 绘制边界线
-                cv2.polylines(frame, [danger_zone_pts], True, (0, 0, 255), 3)
+                cv2.polylines(frame, [np.array(zone.polygon, dtype=np.int32).reshape((-1, 1, 2))], True, (0, 0, 255), 3)
                 
-                # 添加危险区域标签
-                if len(danger_zone_service.DANGER_ZONE) > 0:
-                    label_pos = tuple(danger_zone_service.DANGER_ZONE[0].astype(int))
-                    cv2.putText(frame, "DANGER ZONE", label_pos, cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+                # 添加危险区域标签，命名区域显示区域名
+                label_pos = tuple(zone.polygon[0].astype(int))
+                label = "DANGER ZONE" if zone.name == danger_zone_service.DEFAULT_ZONE_NAME else zone.name
+                cv2.putText(frame, label, label_pos, cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
         except Exception as e:
             print(f"绘制危险区域错误: {e}")
     
@@ -564,32 +649,17 @@ class RTMPStreamManager:
         except Exception as e:
             print(f"绘制警告三角形错误: {e}")
     
-    def _draw_distance_line(self, frame, foot_point, distance):
-        """绘制到危险区域的距离线"""
+    def _draw_distance_line(self, frame, foot_point, distance, zone_config=None, nearest_point=None):
+        """绘制到危险区域的距离线（nearest_point 为批量计算得到的区域边缘最近点，未提供时现场计算）"""
+        zone_config = zone_config or danger_zone_service.get_config()
         try:
             # 找到危险区域上最近的点
-            min_dist = float('inf')
+            if nearest_point is None:
+                _, nearest_points = zone_config.geometry.nearest([foot_point])
+                nearest_point = nearest_points[0]
             closest_point = None
-            
-            for i in range(len(danger_zone_service.DANGER_ZONE)):
-                p1 = danger_zone_service.DANGER_ZONE[i]
-                p2 = danger_zone_service.DANGER_ZONE[(i + 1) % len(danger_zone_service.DANGER_ZONE)]
-                
-                # 计算点到线段的最近点
-                line_vec = p2 - p1
-                line_len = np.linalg.norm(line_vec)
-                if line_len > 0:
-                    line_unitvec = line_vec / line_len
-                    
-                    proj_length = np.dot(np.array(foot_point) - p1, line_unitvec)
-                    proj_length = max(0, min(line_len, proj_length))
-                    
-                    closest_on_line = p1 + proj_length * line_unitvec
-                    dist = np.linalg.norm(np.array(foot_point) - closest_on_line)
-                    
-                    if dist < min_dist:
-                        min_dist = dist
-                        closest_point = closest_on_line.astype(int)
+            if np.all(np.isfinite(nearest_point)):
+                closest_point = np.asarray(nearest_point).astype(int)
             
             if closest_point is not None:
                 # 绘制虚线
@@ -603,22 +673,31 @@ class RTMPStreamManager:
         except Exception as e:
             print(f"绘制距离线错误: {e}")
     
-    def _is_in_danger_zone_advanced(self, point):
+    @staticmethod
+    def _zone_label(zone):
+        """告警文案中的区域名称，默认区域保持原有文案"""
+        if zone.name == danger_zone_service.DEFAULT_ZONE_NAME:
+            return "危险区域"
+        return f"危险区域[{zone.name}]"
+
+    def _is_in_danger_zone_advanced(self, point, zone_config=None):
         """检查点是否在危险区域内（使用高级几何算法）"""
+        zone_config = zone_config or danger_zone_service.get_config()
         try:
-            if len(danger_zone_service.DANGER_ZONE) < 3:
+            if len(zone_config.danger_zone) < 3:
                 return False
-            return point_in_polygon(point, danger_zone_service.DANGER_ZONE)
+            return bool(zone_config.geometry.contains([point])[0])
         except Exception as e:
             print(f"危险区域检测错误: {e}")
             return False
     
-    def _calculate_distance_to_danger_zone(self, point):
+    def _calculate_distance_to_danger_zone(self, point, zone_config=None):
         """计算点到危险区域的最小距离"""
+        zone_config = zone_config or danger_zone_service.get_config()
         try:
-            if len(danger_zone_service.DANGER_ZONE) < 3:
+            if len(zone_config.danger_zone) < 3:
                 return float('inf')
-            return distance_to_polygon(point, danger_zone_service.DANGER_ZONE)
+            return float(zone_config.geometry.nearest([point])[0][0])
         except Exception as e:
             print(f"距离计算错误: {e}")
             return float('inf')
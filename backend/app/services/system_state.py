@@ -1,2 +1,4 @@
 DETECTION_MODE = "object_detection"  # 可选值: 'object_detection', 'face_only', 'fall_detection', 'smoking_detection', 'violence_detection' 
-FACE_RECOGNITION_ENABLED = False  # 控制人脸识别按钮是否启用 
\ No newline at end of file
+FACE_RECOGNITION_ENABLED = False  # 控制人脸识别按钮是否启用 
+VIDEO_PIPELINE_ENABLED = False  # 实时视频流是否默认启用 采集/推理/编码 三段式流水线
+VIDEO_PARALLEL_ENABLED = False  # 上传视频是否默认使用多进程分段推理（仅目标检测模式）
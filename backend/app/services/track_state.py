@@ -0,0 +1,315 @@
+import threading
+import time
+
+import numpy as np
+
+# 目标超过该时长（按所在流的时钟计）未再出现即视为离开画面，其状态被回收
+TRACK_TTL = 5.0
+# 两次过期回收之间的最小间隔（流时钟秒数），避免每帧都扫描整张表
+EVICT_INTERVAL = 1.0
+# 每个目标保留的姿态历史帧数
+POSE_HISTORY_LENGTH = 30
+# 姿态历史缓冲区的初始目标槽位数，不够时按倍数扩容
+POSE_INITIAL_SLOTS = 16
+# 人脸身份置信度每帧的衰减系数
+IDENTITY_DECAY = 0.99
+# 置信度衰减到该值以下的人脸重新提取特征识别
+IDENTITY_MIN_CONFIDENCE = 0.5
+# 即使置信度足够，也每隔这么多帧重新识别一次
+IDENTITY_REFRESH_FRAMES = 90
+# 人脸超过这么多帧未出现即回收其身份
+IDENTITY_TTL_FRAMES = 30
+
+
+class TrackState:
+    """单个追踪目标的状态：各命名区域内的停留时间与最后出现时刻"""
+    __slots__ = ('zone_times', 'last_seen')
+
+    def __init__(self, now):
+        self.zone_times = {}  # {zone_name: 停留秒数}，只保存目标当前所在的区域
+        self.last_seen = now
+
+
+class TrackStateTable:
+    """
+    一路流的目标状态表。
+
+    - 每路流有自己的时钟：tick() 不传参数时按两次调用之间的实际耗时前进，
+      离线视频可以传入按帧率计算的时间差，按视频时间前进
+    - 目标以追踪ID为键，不同流的ID互不冲突
+    - 超过 ttl 秒未出现的目标在 tick() 中被批量回收，长时间运行时内存保持平稳
+    """
+
+    def __init__(self, stream, ttl=TRACK_TTL, evict_interval=EVICT_INTERVAL):
+        self.stream = stream
+        self.ttl = ttl
+        self.evict_interval = evict_interval
+        self.reset()
+
+    def reset(self):
+        self._tracks = {}
+        self._pose = None
+        self.now = 0.0
+        self._last_tick = time.monotonic()
+        self._last_evict = 0.0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def tick(self, time_diff=None):
+        """推进本流时钟并返回本次的时间差（秒），按需回收过期目标"""
+        current = time.monotonic()
+        if time_diff is None:
+            time_diff = current - self._last_tick
+        self._last_tick = current
+        self.now += time_diff
+        if self.now - self._last_evict >= self.evict_interval:
+            self.evict()
+        return time_diff
+
+    def evict(self):
+        """回收超过 ttl 未出现的目标，返回回收数量"""
+        deadline = self.now - self.ttl
+        expired = [target_id for target_id, state in self._tracks.items() if state.last_seen < deadline]
+        for target_id in expired:
+            del self._tracks[target_id]
+        if self._pose is not None:
+            self._pose.evict(deadline)
+        self._last_evict = self.now
+        self.evicted += len(expired)
+        return len(expired)
+
+    @property
+    def pose(self):
+        """本流的姿态历史（跌倒检测模式下首次使用时创建）"""
+        if self._pose is None:
+            self._pose = PoseHistory()
+        return self._pose
+
+    def touch(self, target_id):
+        """标记目标在本帧出现，返回其状态记录"""
+        state = self._tracks.get(target_id)
+        if state is None:
+            state = self._tracks[target_id] = TrackState(self.now)
+        else:
+            state.last_seen = self.now
+        return state
+
+    def update_zones(self, target_id, inside_zones, time_diff):
+        """
+        累加目标在其所在各区域内的停留时间，已离开的区域重置为0。
+        返回 {zone_name: 停留时间}
+        """
+        state = self.touch(target_id)
+        previous = state.zone_times
+        state.zone_times = {name: previous.get(name, 0.0) + time_diff for name in inside_zones}
+        return state.zone_times
+
+    def loitering_time(self, target_id, zone_name):
+        state = self._tracks.get(target_id)
+        return state.zone_times.get(zone_name, 0.0) if state is not None else 0.0
+
+    def stats(self):
+        return {'stream': self.stream, 'tracks': len(self._tracks), 'clock': round(self.now, 3),
+                'pose_tracks': len(self._pose) if self._pose is not None else 0, 'evicted': self.evicted}
+
+
+class PoseHistory:
+    """
+    一路流所有目标的姿态历史，使用定长环形缓冲区。
+
+    buffer[slot, i] = (重心Y, 垂直速度, 流时钟时刻)，每个目标占用一个槽位，
+    写入只移动该槽位的 head 指针，没有列表 pop(0) 的搬移开销；
+    消失的目标由所属状态表按 TTL 回收，其槽位被后续新目标复用。
+    """
+
+    def __init__(self, length=POSE_HISTORY_LENGTH, slots=POSE_INITIAL_SLOTS):
+        self.length = length
+        self.buffer = np.zeros((slots, length, 3), dtype=np.float64)
+        self.head = np.zeros(slots, dtype=np.int64)     # 下一次写入的位置
+        self.count = np.zeros(slots, dtype=np.int64)    # 已写入的帧数（不超过 length）
+        self.last_seen = np.zeros(slots, dtype=np.float64)
+        self._slot_of = {}                              # {track_id: slot}
+        self._free = list(range(slots - 1, -1, -1))
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def _grow(self):
+        slots = len(self.head)
+        self.buffer = np.concatenate([self.buffer, np.zeros_like(self.buffer)])
+        self.head = np.concatenate([self.head, np.zeros(slots, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(slots, dtype=np.int64)])
+        self.last_seen = np.concatenate([self.last_seen, np.zeros(slots)])
+        self._free.extend(range(2 * slots - 1, slots - 1, -1))
+
+    def _slots(self, track_ids):
+        slots = np.empty(len(track_ids), dtype=np.int64)
+        for i, track_id in enumerate(track_ids):
+            slot = self._slot_of.get(track_id)
+            if slot is None:
+                if not self._free:
+                    self._grow()
+                slot = self._slot_of[track_id] = self._free.pop()
+                self.head[slot] = 0
+                self.count[slot] = 0
+            slots[i] = slot
+        return slots
+
+    def update(self, track_ids, centroid_y, now):
+        """
+        批量写入本帧各目标的重心Y（NaN 表示关键点不足，本帧不记录），返回 (velocity, has_previous)：
+        velocity 为相对上一次记录的垂直速度（像素/帧），没有上一次记录的目标为 0。
+        """
+        track_ids = [int(t) for t in track_ids]
+        centroid_y = np.asarray(centroid_y, dtype=np.float64)
+        slots = self._slots(track_ids)
+        self.last_seen[slots] = now
+
+        valid = ~np.isnan(centroid_y)
+        slots, centroid_y = slots[valid], centroid_y[valid]
+        has_previous = np.zeros(len(valid), dtype=bool)
+        velocity = np.zeros(len(valid))
+        if len(slots) == 0:
+            return velocity, has_previous
+
+        previous = self.buffer[slots, (self.head[slots] - 1) % self.length, 0]
+        seen = self.count[slots] > 0
+        step = np.where(seen, centroid_y - previous, 0.0)
+        has_previous[valid] = seen
+        velocity[valid] = step
+
+        head = self.head[slots]
+        self.buffer[slots, head] = np.stack([centroid_y, step, np.full(len(slots), now)], axis=1)
+        self.head[slots] = (head + 1) % self.length
+        self.count[slots] = np.minimum(self.count[slots] + 1, self.length)
+        return velocity, has_previous
+
+    def history(self, track_id):
+        """按时间顺序返回某目标的历史 (n, 3)，不存在时为空数组"""
+        slot = self._slot_of.get(int(track_id))
+        if slot is None:
+            return np.zeros((0, 3))
+        count, head = self.count[slot], self.head[slot]
+        order = (head - count + np.arange(count)) % self.length
+        return self.buffer[slot, order].copy()
+
+    def evict(self, deadline):
+        """回收最后出现时刻早于 deadline 的目标槽位，返回回收数量"""
+        expired = [track_id for track_id, slot in self._slot_of.items() if self.last_seen[slot] < deadline]
+        for track_id in expired:
+            self._free.append(self._slot_of.pop(track_id))
+        return len(expired)
+
+
+class Identity:
+    """绑定到一个人脸追踪ID的识别结果"""
+    __slots__ = ('name', 'distance', 'confidence', 'recognized_at', 'last_seen')
+
+    def __init__(self, name, distance, confidence, frame_index):
+        self.name = name
+        self.distance = distance
+        self.confidence = confidence
+        self.recognized_at = frame_index
+        self.last_seen = frame_index
+
+
+class IdentityCache:
+    """
+    人脸身份缓存，身份绑定到人脸追踪ID（按帧号计时）。
+
+    - 每帧 due() 把已有身份的置信度乘以 decay，并返回需要重新识别的人脸：
+      新出现的追踪ID、没有追踪ID的人脸、置信度低于 min_confidence 的、距上次识别已达 refresh_frames 帧的
+    - 其余人脸直接沿用缓存的身份，不再提取 dlib 特征
+    - 超过 ttl_frames 帧未出现的追踪ID被回收
+    """
+
+    def __init__(self, decay=IDENTITY_DECAY, min_confidence=IDENTITY_MIN_CONFIDENCE,
+                 refresh_frames=IDENTITY_REFRESH_FRAMES, ttl_frames=IDENTITY_TTL_FRAMES):
+        self.decay = decay
+        self.min_confidence = min_confidence
+        self.refresh_frames = refresh_frames
+        self.ttl_frames = ttl_frames
+        self._identities = {}   # {track_id: Identity}
+        self.hits = 0
+        self.recognized = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._identities)
+
+    def get(self, track_id):
+        return self._identities.get(track_id)
+
+    def due(self, track_ids, frame_index):
+        """返回本帧需要重新识别的人脸下标列表"""
+        pending = []
+        for i, track_id in enumerate(track_ids):
+            identity = self._identities.get(track_id) if track_id is not None else None
+            if identity is None:
+                pending.append(i)
+                continue
+            identity.confidence *= self.decay ** max(1, frame_index - identity.last_seen)
+            identity.last_seen = frame_index
+            if identity.confidence < self.min_confidence or frame_index - identity.recognized_at >= self.refresh_frames:
+                pending.append(i)
+            else:
+                self.hits += 1
+        self.recognized += len(pending)
+        return pending
+
+    def update(self, track_id, name, distance, confidence, frame_index):
+        """写入一次识别结果；没有追踪ID的人脸不缓存"""
+        if track_id is None:
+            return None
+        identity = self._identities[track_id] = Identity(name, distance, confidence, frame_index)
+        return identity
+
+    def evict(self, frame_index):
+        """回收超过 ttl_frames 帧未出现的身份，返回回收数量"""
+        deadline = frame_index - self.ttl_frames
+        expired = [track_id for track_id, identity in self._identities.items() if identity.last_seen < deadline]
+        for track_id in expired:
+            del self._identities[track_id]
+        self.evicted += len(expired)
+        return len(expired)
+
+    def stats(self):
+        total = self.hits + self.recognized
+        return {'identities': len(self._identities), 'hits': self.hits, 'recognized': self.recognized,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0, 'evicted': self.evicted}
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_table(stream):
+    """获取（必要时创建）某路流的目标状态表"""
+    table = _tables.get(stream)
+    if table is None:
+        with _tables_lock:
+            table = _tables.setdefault(stream, TrackStateTable(stream))
+    return table
+
+
+def reset_table(stream=None):
+    """重置某路流的目标状态与时钟；stream 为 None 时重置所有流"""
+    with _tables_lock:
+        tables = list(_tables.values()) if stream is None else [_tables.get(stream)]
+    for table in tables:
+        if table is not None:
+            table.reset()
+
+
+def drop_table(stream):
+    """流结束时删除其状态表"""
+    with _tables_lock:
+        _tables.pop(stream, None)
+
+
+def get_stats():
+    with _tables_lock:
+        tables = list(_tables.values())
+    return [table.stats() for table in tables]
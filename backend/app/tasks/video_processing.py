@@ -9,9 +9,8 @@ from app.celery_app import celery_app
 from app import socketio
 import json
 
-# --- 新增: 导入告警和快照服务 ---
-from app.services.alerts import create_alert
-from app.services.detection import save_snapshot
+# --- 新增: 导入告警服务（后台批量写库，快照由写入线程保存） ---
+from app.services.alerts import create_alert_async
 # --- 结束新增 ---
 
 
@@ -149,12 +148,11 @@ def process_frame_with_ai(frame, models, detection_modes, danger_zones):
                                 'message': alert_message,
                                 'severity': 'high'
                             })
-                            # --- 新增: 保存快照并创建数据库告警 ---
-                            snapshot_path = save_snapshot(frame)
-                            create_alert(
+                            # --- 新增: 创建数据库告警（入队后由写入线程保存快照并批量写库） ---
+                            create_alert_async(
                                 event_type="Danger Zone Intrusion (Live)",
                                 details=alert_message,
-                                frame_snapshot_path=snapshot_path
+                                snapshot=frame
                             )
                             # --- 结束新增 ---
         
@@ -76,4 +76,67 @@ def distance_to_polygon(point, polygon):
             
         min_distance = min(min_distance, dist)
     
-    return min_distance 
\ No newline at end of file
+    return min_distance 
+
+class PolygonGeometry:
+    """
+    预计算好边向量的多边形，用于批量计算一组点与多边形的关系。
+
+    与 point_in_polygon / distance_to_polygon 的判定规则一致，
+    但一次向量化计算 N 个点，避免在人多的画面里逐个点、逐条边地做 Python 循环。
+    多边形不变时应复用同一个实例（危险区域配置快照上已经缓存了一个）。
+    """
+    __slots__ = ('vertices', 'starts', 'edges', 'len_sq', 'x_max', 'y_min', 'y_max')
+
+    def __init__(self, polygon):
+        vertices = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+        self.vertices = vertices
+        self.starts = vertices
+        ends = np.roll(vertices, -1, axis=0)
+        self.edges = ends - vertices
+        self.len_sq = (self.edges ** 2).sum(axis=1)
+        self.x_max = np.maximum(vertices[:, 0], ends[:, 0])
+        self.y_min = np.minimum(vertices[:, 1], ends[:, 1])
+        self.y_max = np.maximum(vertices[:, 1], ends[:, 1])
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def contains(self, points):
+        """射线法：返回 (N,) bool，点是否在多边形内部"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(self.vertices) == 0 or len(points) == 0:
+            return np.zeros(len(points), dtype=bool)
+        x = points[:, 0:1]
+        y = points[:, 1:2]
+        sx, sy = self.starts[:, 0], self.starts[:, 1]
+        dx, dy = self.edges[:, 0], self.edges[:, 1]
+        # 水平边不会满足 y_min < y <= y_max，这里的除数只是为了避免除以零
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_inters = (y - sy) * dx / np.where(dy != 0, dy, 1) + sx
+        crossing = (y > self.y_min) & (y <= self.y_max) & (x <= self.x_max) & ((dx == 0) | (x <= x_inters))
+        return (crossing.sum(axis=1) % 2).astype(bool)
+
+    def nearest(self, points):
+        """
+        返回 (distances (N,), nearest_points (N, 2))：每个点到多边形边缘的最小距离及边缘上的最近点。
+        多边形为空时距离为 inf，最近点为 nan。
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(self.vertices) == 0 or len(points) == 0:
+            return np.full(len(points), np.inf), np.full((len(points), 2), np.nan)
+        rel = points[:, None, :] - self.starts[None, :, :]  # (N, M, 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            param = (rel * self.edges[None, :, :]).sum(axis=2) / self.len_sq
+        # 退化为一个点的边 (len_sq == 0) 取其起点
+        param = np.clip(np.nan_to_num(param, nan=0.0, posinf=0.0, neginf=0.0), 0.0, 1.0)
+        closest = self.starts[None, :, :] + param[:, :, None] * self.edges[None, :, :]
+        dist_sq = ((points[:, None, :] - closest) ** 2).sum(axis=2)
+        best = dist_sq.argmin(axis=1)
+        rows = np.arange(len(points))
+        return np.sqrt(dist_sq[rows, best]), closest[rows, best]
+
+    def query(self, points):
+        """一次计算 (inside, distances, nearest_points)"""
+        distances, nearest_points = self.nearest(points)
+        return self.contains(points), distances, nearest_points
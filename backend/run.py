@@ -150,5 +150,4 @@ def main(config, host, port, debug, init_db, show_config):
         sys.exit(1)
 
 if __name__ == '__main__':
-=======
     main()
\ No newline at end of file